@@ -0,0 +1,205 @@
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from . import impairment
+from . import instrumentation
+from . import p2p
+
+
+"""
+Benchmark für das dezentrale Netzwerk auf Loopback. Jeder Teilnehmer läuft mit dem echten p2p.start in einem eigenen
+Prozess mit eigener Adresse 127.0.0.x; Entdeckung per Broadcast an 127.255.255.255. Gemessen werden Durchsatz,
+CPU-Zeit und Speicher je Teilnehmer sowie zugestellte und verlorene Nachrichten (über die Sequenznummern) und die
+Latenz. Mit einem Szenario (siehe impairment) laufen alle gesendeten Datagramme über nachgebildete Funkverbindungen.
+"""
+
+
+def usage() -> dict:
+    """
+    :return: Bisher verbrauchte CPU-Zeit [s] und maximaler Speicher [kB] des aktuellen Prozesses
+    """
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return {"cpu_s": ru.ru_utime + ru.ru_stime, "max_rss_kb": ru.ru_maxrss}
+
+
+def quiet_logger(name: str) -> logging.Logger:
+    """
+    Logger für Benchmark-Prozesse, der nur Warnungen und Fehler ausgibt, damit das Logging die Messung nicht verfälscht.
+    :param name: Name des Loggers
+    :return: Logger-Objekt
+    """
+    logging_object = logging.getLogger(name)
+    logging_object.setLevel(logging.WARNING)
+    return logging_object
+
+
+def node_address(index: int) -> str:
+    """
+    :param index: Nummer des Teilnehmers ab 0
+    :return: Loopback-Adresse des Teilnehmers
+    """
+    return f"127.0.{2 + index // 250}.{2 + index % 250}"
+
+
+class ReceiveStats:
+    """
+    Empfangsstatistik eines Teilnehmers im Messzeitraum: erste und letzte Sequenznummer sowie Anzahl je Absender und
+    ein Latenzhistogramm.
+    """
+
+    def __init__(self, window_start: int, window_end: int):
+        """
+        :param window_start: Beginn des Messzeitraums (time.monotonic_ns)
+        :param window_end: Ende des Messzeitraums (time.monotonic_ns)
+        """
+        self.window_start = window_start
+        self.window_end = window_end
+        self.senders = {}
+        self.latency = instrumentation.LatencyHistogram()
+        self.lock = threading.Lock()
+
+    def handle(self, state):
+        """
+        message_handler für p2p.start.
+        :param state: Empfangener Fahrzeugzustand
+        :return: None
+        """
+        if not self.window_start <= state.timestamp < self.window_end:
+            return
+        latency = time.monotonic_ns() - state.timestamp
+        with self.lock:
+            sender = self.senders.get(state.vehicle_id)
+            if sender is None:
+                self.senders[state.vehicle_id] = [state.seq, state.seq, 1]
+            else:
+                sender[0] = min(sender[0], state.seq)
+                sender[1] = max(sender[1], state.seq)
+                sender[2] += 1
+            self.latency.record(latency)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            delivered = sum(sender[2] for sender in self.senders.values())
+            expected = sum(sender[1] - sender[0] + 1 for sender in self.senders.values())
+            return {"senders": len(self.senders), "delivered": delivered, "expected": expected,
+                    "latency": self.latency}
+
+
+def _node_process(result_queue, index: int, frequency: float, port: int, broadcast_port: int, bc_interval: float,
+                  start_at: float, duration: float, grace: float, options: dict, scenario: impairment.Scenario):
+    """
+    Teilnehmer-Prozess: startet p2p.start und meldet nach dem Messzeitraum Empfangsstatistik und CPU-Zeit.
+    """
+    ip_address = node_address(index)
+    stats = ReceiveStats(int(start_at * 1e9), int((start_at + duration) * 1e9))
+    network = impairment.Network(scenario, ip_address) if scenario is not None else None
+    node_thread = threading.Thread(
+        target=p2p.start,
+        args=(quiet_logger(f"benchmark.node{index}"), frequency, port, 3 * bc_interval, bc_interval),
+        kwargs=dict(options, ip_address=ip_address, broadcast_address="127.255.255.255",
+                    broadcast_port=broadcast_port, bind_address=ip_address, message_handler=stats.handle,
+                    network=network))
+    node_thread.daemon = True
+    node_thread.start()
+
+    time.sleep(max(0.0, start_at - time.monotonic()))
+    before = usage()
+    time.sleep(max(0.0, start_at + duration + grace - time.monotonic()))
+    after = usage()
+    result = stats.to_dict()
+    result.update(cpu_s=after["cpu_s"] - before["cpu_s"], max_rss_kb=after["max_rss_kb"])
+    if network is not None:
+        result["impairment"] = network.stats()
+    result_queue.put(result)
+    result_queue.close()
+    result_queue.join_thread()
+    os._exit(0)
+
+
+def run(logging_object: logging.Logger, nodes: int, frequency: float, duration: float, port: int = 51006,
+        broadcast_port: int = 51005, bc_interval: float = 0.5, setup_time: float = 3.0, grace: float = 1.0,
+        options: dict = None, scenario=None) -> dict:
+    """
+    Führt einen Benchmark-Lauf aus.
+    :param logging_object: Logger
+    :param nodes: Anzahl der Teilnehmer
+    :param frequency: Sendefrequenz je Teilnehmer in Hz
+    :param duration: Messdauer in Sekunden
+    :param port: Kommunikations-Port
+    :param broadcast_port: Port der Teilnehmer-Entdeckung
+    :param bc_interval: Sendeintervall der Broadcast-Nachricht
+    :param setup_time: Zeit für Start und gegenseitige Entdeckung vor der Messung
+    :param grace: Wartezeit nach der Messung für noch unterwegs befindliche Nachrichten
+    :param options: Weitere Schlüsselwortargumente für p2p.start
+    :param scenario: Kanalbedingungen (Name aus impairment.SCENARIOS, Pfad einer JSON-Datei oder impairment.Scenario),
+    None ohne Beeinträchtigung; die Phasen des Szenarios beginnen mit dem Messzeitraum
+    :return: Bericht als Dictionary
+    """
+    options = options or {}
+    start_at = time.monotonic() + setup_time
+    scenario = impairment.load(scenario)
+    if scenario is not None:
+        scenario.epoch = start_at
+    result_queue = multiprocessing.Queue()
+    processes = []
+    for index in range(nodes):
+        process = multiprocessing.Process(
+            target=_node_process,
+            args=(result_queue, index, frequency, port, broadcast_port, bc_interval, start_at, duration, grace,
+                  options, scenario))
+        process.start()
+        processes.append(process)
+
+    results = [result_queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    delivered = sum(result["delivered"] for result in results)
+    expected = sum(result["expected"] for result in results)
+    cpu = sum(result["cpu_s"] for result in results)
+    latency = instrumentation.LatencyHistogram()
+    for result in results:
+        latency.merge(result["latency"])
+
+    report = {
+        "topology": "dezentral",
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "nodes": nodes,
+        "frequency": frequency,
+        "duration": duration,
+        "options": options,
+        "scenario": scenario.name if scenario is not None else None,
+        "peers_seen_min": min(result["senders"] for result in results),
+        "expected": expected,
+        "delivered": delivered,
+        "lost": expected - delivered,
+        "loss_ratio": (expected - delivered) / expected if expected else 0.0,
+        "throughput_msgs_per_s": delivered / duration,
+        "cpu_s": cpu,
+        "cpu_us_per_msg": cpu / delivered * 1e6 if delivered else None,
+        "max_rss_kb": max(result["max_rss_kb"] for result in results),
+        "latency": latency.to_dict(),
+    }
+    if scenario is not None:
+        report["impairment"] = {key: sum(result["impairment"][key] for result in results)
+                                for key in results[0]["impairment"]}
+    logging_object.info(f"Benchmark dezentral: {nodes} Teilnehmer, {report['throughput_msgs_per_s']:.0f} "
+                        f"Nachrichten/s, Verlust {report['loss_ratio']:.2%}, CPU {cpu:.2f} s, "
+                        f"Szenario {report['scenario']}")
+    return report
+
+
+def write_report(report: dict, path: str):
+    """
+    Hängt einen Bericht als JSON-Zeile an eine Datei an, damit Läufe über die Zeit verglichen werden können.
+    :param report: Bericht aus run()
+    :param path: Pfad der Berichtsdatei (JSON Lines)
+    :return: None
+    """
+    with open(path, "a") as report_file:
+        report_file.write(json.dumps(report) + "\n")
@@ -1,55 +1,277 @@
+import select
 import socket
 import threading
 import time
-import subprocess
-import re
 import logging
 import os
+import math
+from . import buffers
+from . import capture
+from . import congestion
+from . import instrumentation
+from . import interfaces
+from . import log_pipeline
+from . import metrics
+from . import peers
+from . import protocol
+from . import relay
+from . import scheduler
 
 """*****************************************************************************************************************"""
 
 
+UNICAST = "unicast"         # Ein sendto je Teilnehmer
+MULTICAST = "multicast"     # Ein sendto je Takt an eine Multicast-Gruppe
+BROADCAST = "broadcast"     # Ein sendto je Takt an die Broadcast-Adresse des Subnetzes
+DATA_MODES = (UNICAST, MULTICAST, BROADCAST)
+DEFAULT_GROUP = "239.255.0.1"
+
+
+def read_vehicle_state(own_id: int, counter: int, frequency: int) -> (float, float, float, float):
+    """
+    Liefert den aktuellen Zustand des Fahrzeugs. Hier Pseudodaten: Kreisfahrt mit 10 m/s auf einem Kreis mit 50 m
+    Radius, Startwinkel abhängig von der Fahrzeug-ID.
+    :param own_id: Fahrzeug-ID des Geräts
+    :param counter: Nummer der Nachricht
+    :param frequency: Frequenz für Nachrichtenübertragung in Hz
+    :return: x [m], y [m], Geschwindigkeit [m/s], Richtung [Grad]
+    """
+    speed = 10.0
+    radius = 50.0
+    angle = math.radians(own_id % 360) + counter / frequency * speed / radius
+    return radius * math.cos(angle), radius * math.sin(angle), speed, math.degrees(angle + math.pi / 2) % 360
+
+
 def send_data(logging_object: logging.Logger, ip_address: str, socket_object: socket.socket,
-              peer_list: list, port: int, frequency: int):
+              peer_table: peers.PeerTable, port: int, frequency: int, recorder: capture.CaptureWriter = None,
+              monitor: instrumentation.Instrumentation = None, sync_interval: float = 1.0,
+              data_address: str = None, schedule: scheduler.Scheduler = None, stats_interval: float = 60.0,
+              ttl: int = 0, key_interval: int = None, registry: metrics.Registry = None,
+              encoder: protocol.DeltaEncoder = None, controller: congestion.RateController = None):
     """
-    Sendet Daten an andere Teilnehmer mit gegebener Frequenz.
+    Sendet Daten an andere Teilnehmer mit gegebener Frequenz. Mit data_address wird jede Nachricht einmal an die
+    Multicast-Gruppe bzw. Broadcast-Adresse gesendet, sonst einzeln an jeden Teilnehmer. Zustandsnachrichten,
+    Zeitanfragen und weitere Aufgaben in schedule (z.B. die Broadcast-Nachricht) laufen mit festen Zeitpunkten auf
+    diesem Thread.
     :param logging_object: Logger des Geräts
     :param ip_address: Statische IPv4 des Geräts im Mesh-Netzwerk
     :param socket_object: Sender-Socket des Geräts
-    :param peer_list: 2D Liste mit IPs und Zeitstempel aller Teilnehmer
+    :param peer_table: Tabelle aller Teilnehmer
     :param port: Port zur Kommunikation
     :param frequency: Frequenz für Nachrichtenübertragung in Hz
+    :param recorder: Optionaler Mitschnitt, in dem jede gesendete Nachricht aufgezeichnet wird
+    :param monitor: Messung des Geräts; mit monitor werden Zeitanfragen an alle Teilnehmer gesendet
+    :param sync_interval: Abstand der Zeitanfragen in Sekunden
+    :param data_address: Multicast-Gruppe oder Broadcast-Adresse, None für Unicast an jeden Teilnehmer
+    :param schedule: Scheduler mit weiteren Aufgaben dieses Threads, standardmäßig ein neuer Scheduler
+    :param stats_interval: Abstand in Sekunden, in dem Ist-Frequenz, Jitter und Überläufe ins Log geschrieben werden
+    :param ttl: Anzahl der Weiterleitungen eigener Zustandsnachrichten durch andere Teilnehmer, 0 nur direkte Nachbarn
+    :param key_interval: Mit key_interval wird nur jeder key_interval-te Zustand vollständig gesendet, dazwischen die
+    Differenz zu diesem (protocol.MSG_DELTA); None sendet jeden Zustand vollständig
+    :param registry: Metriken des Geräts für gesendete Nachrichten und Bytes je Teilnehmer bzw. Datenkanal und die
+    Statistik des Schedulers (Abschnitt "scheduler")
+    :param encoder: Kodierer der Zustände anstelle eines neuen mit key_interval, z.B. um für neue Teilnehmer von einem
+    anderen Thread aus vorzeitig einen Schlüsselzustand anzufordern
+    :param controller: Optionale Überlastregelung; der Zustand wird dann mit deren max_frequency geprüft und nur mit
+    der geregelten Frequenz oder bei deutlicher Änderung gesendet, frequency wird nicht verwendet
     :return: None
     """
+    if registry is None:
+        registry = metrics.Registry()
+    tx_log = log_pipeline.channel(logging_object, log_pipeline.TX)
+    own_id = protocol.vehicle_id(ip_address)
     counter = 0
-    period_duration = 1 / frequency
+    # Anzahl der Prüfungen, ohne Überlastregelung gleich der Anzahl gesendeter Zustände
+    tick = 0
+    if controller is not None:
+        frequency = controller.max_frequency
+    if encoder is None and key_interval:
+        encoder = protocol.DeltaEncoder(key_interval)
+
+    def send_state():
+        nonlocal counter, tick
+        x, y, speed, heading = read_vehicle_state(own_id, tick, frequency)
+        tick += 1
+        state = protocol.VehicleState(own_id, counter, time.monotonic_ns(), x, y, speed, heading)
+        if controller is not None and not controller.due(state, time.monotonic()):
+            return
+        # Frame wird einmal kodiert und an alle Teilnehmer gesendet
+        if encoder is not None:
+            message = encoder.encode(state, ttl=ttl)
+        else:
+            message = protocol.encode_state(state, ttl=ttl)
+        if recorder is not None:
+            recorder.write(message, capture.SENT)
+        if data_address is not None:
+            # Eine Übertragung je Takt, unabhängig von der Anzahl der Teilnehmer
+            socket_object.sendto(message, (data_address, port))
+            group.sent(len(message))
+            tx_log.debug("Nachricht gesendet an %s: %s", data_address, state)
+            copies = 1
+        else:
+            # Schnappschuss ohne Lock, Beitritt oder Austritt während des Sendens ändert ihn nicht
+            snapshot = peer_table.snapshot()
+            for peer_ip in snapshot:
+                socket_object.sendto(message, (peer_ip, port))
+                registry.peer(peer_ip).sent(len(message))
+                tx_log.debug("Nachricht gesendet an %s: %s", peer_ip, state)
+            copies = len(snapshot)
+        if controller is not None:
+            controller.sent(len(message), copies)
+        counter += 1
+
+    def send_time_requests():
+        request = protocol.encode_time_request(own_id, time.monotonic_ns())
+        for peer_ip in peer_table.snapshot():
+            socket_object.sendto(request, (peer_ip, port))
+            registry.peer(peer_ip).sent(len(request))
+
+    # Alle Teilnehmer empfangen dieselbe Übertragung, gezählt wird sie beim Datenkanal
+    group = registry.peer(data_address) if data_address is not None else None
+    if schedule is None:
+        schedule = scheduler.Scheduler()
+    registry.source("scheduler", schedule.stats)
+    schedule.add("state", 1 / frequency, send_state)
+    if monitor is not None:
+        schedule.add("sync", sync_interval, send_time_requests)
+    if controller is not None:
+        registry.source("congestion", controller.stats)
+        # Bei Unicast geht jede Nachricht einmal je Teilnehmer über das Medium
+        schedule.add("dcc", controller.interval,
+                     lambda: controller.update(len(peer_table) if data_address is None else 1, encoder))
+    schedule.add("stats", stats_interval, lambda: log_stats(logging_object, schedule, controller), phase=stats_interval)
     try:
-        while True:
-            message = f"{ip_address}: {str(counter)}"
-            for peer in peer_list:
-                if not ip_address == peer['ip']:
-                    socket_object.sendto(message.encode(), (peer["ip"], port))
-                    logging_object.info(f"Nachricht gesendet an {peer['ip']}: {message}")
-            counter += 1
-            time.sleep(period_duration)
+        schedule.run()
     except KeyboardInterrupt:
         logging_object.info("Übertragung manuell abgebrochen.")
     except Exception as e:
         logging_object.info(f"Error: {e}")
+    log_stats(logging_object, schedule, controller)
 
 
-def receive_data(logging_object: logging.Logger, socket_object: socket.socket):
+def log_stats(logging_object: logging.Logger, schedule: scheduler.Scheduler,
+              controller: congestion.RateController = None):
     """
-    Empfängt Daten von anderen Teilnehmern.
+    Schreibt die Statistik des Sende-Threads ins Log.
     :param logging_object: Logger des Geräts
-    :param socket_object: Empfänger-Socket des Geräts
+    :param schedule: Scheduler des Sende-Threads
+    :param controller: Optionale Überlastregelung
     :return: None
     """
+    schedule.log_stats(logging_object)
+    if controller is not None:
+        stats = controller.stats()
+        logging_object.info(f"Überlastregelung: {stats['frequency_hz']:.1f} Hz, Kanallast {stats['load']:.0%}, "
+                            f"{stats['sent']} Zustände gesendet, davon {stats['triggered']} vorzeitig")
+
+
+def wait_frames(receivers: list) -> list:
+    """
+    Wartet auf Datagramme an einem oder mehreren Sockets und zerlegt alle bereitliegenden in Frames.
+    :param receivers: buffers.DatagramReceiver je Socket
+    :return: Liste aus (Frame als memoryview, Absenderadresse), gültig bis zum nächsten Aufruf; None, wenn einer der
+    Sockets geschlossen wurde
+    """
+    if len(receivers) == 1:
+        return receivers[0].frames()
+    readable = select.select([receiver.sock for receiver in receivers], [], [])[0]
+    frames = []
+    for receiver in receivers:
+        if receiver.sock in readable:
+            received = receiver.frames()
+            if received is None:
+                return None
+            frames.extend(received)
+    return frames
+
+
+def receive_data(logging_object: logging.Logger, socket_object: socket.socket,
+                 recorder: capture.CaptureWriter = None, message_handler=None,
+                 monitor: instrumentation.Instrumentation = None, own_id: int = 0, port: int = None,
+                 report_interval: float = 10.0, latency_budget: float = None, mesh_relay: relay.Relay = None,
+                 states: protocol.DeltaDecoder = None, fleet_table=None, registry: metrics.Registry = None,
+                 controller: congestion.RateController = None, group_socket: socket.socket = None):
+    """
+    Empfängt Daten von anderen Teilnehmern und beantwortet deren Zeitanfragen. Je Aufwachen werden alle
+    bereitliegenden Datagramme in einen festen Pufferpool gelesen, Frames werden ohne Kopie als memoryview ausgewertet.
+    Unicast und Datenkanal (Multicast, Broadcast) laufen in derselben Schleife, da Messung, Schlüsselzustände und
+    Weiterleitung nicht threadsicher sind. Ausnahmen bei einzelnen Nachrichten (z.B. im message_handler) werden
+    protokolliert, der Empfang läuft mit der nächsten Nachricht weiter.
+    :param logging_object: Logger des Geräts
+    :param socket_object: Empfänger-Socket des Geräts, über den auch Zeitanfragen beantwortet werden
+    :param recorder: Optionaler Mitschnitt, in dem jede empfangene Nachricht aufgezeichnet wird
+    :param message_handler: Optionale Funktion, die mit jedem empfangenen Fahrzeugzustand aufgerufen wird
+    :param monitor: Messung des Geräts für Verlust, Umsortierung und Latenz je Teilnehmer
+    :param own_id: Fahrzeug-ID des Geräts für Antworten auf Zeitanfragen
+    :param port: Port zur Kommunikation, an den Antworten auf Zeitanfragen gesendet werden
+    :param report_interval: Abstand in Sekunden, in dem die Messung ins Log geschrieben wird, None ohne Ausgabe
+    :param latency_budget: Latenzbudget in ms, bei Überschreitung durch p99 wird eine Warnung geschrieben
+    :param mesh_relay: Optionale Weiterleitung über mehrere Hops; Duplikate werden dann nicht zugestellt
+    :param states: Schlüsselzustände je Teilnehmer, mit denen Zustandsänderungen (MSG_DELTA) ergänzt werden,
+    standardmäßig ein eigener Cache
+    :param fleet_table: Optionale fleet.FleetTable, in die jeder empfangene Zustand eingetragen wird
+    :param registry: Metriken des Geräts für empfangene Nachrichten und Bytes je Teilnehmer (IPv4 des direkten
+    Absenders)
+    :param controller: Optionale Überlastregelung, die aus den empfangenen Bytes die Kanallast schätzt
+    :param group_socket: Optionaler Empfangs-Socket des Datenkanals bei Multicast und Broadcast
+    :return: None
+    """
+    if registry is None:
+        registry = metrics.Registry()
+    rx_log = log_pipeline.channel(logging_object, log_pipeline.RX)
+    if states is None:
+        states = protocol.DeltaDecoder()
+    receivers = [buffers.DatagramReceiver(socket_object)]
+    if group_socket is not None:
+        receivers.append(buffers.DatagramReceiver(group_socket))
+    reporting = monitor is not None and report_interval is not None
+    next_report = time.monotonic() + (report_interval or 0)
     try:
         while True:
-            data = socket_object.recv(1024).decode()
-            if data:
-                logging_object.info(f"Nachricht empfangen: {data}")
+            frames = wait_frames(receivers)
+            if frames is not None:
+                now = time.monotonic_ns()
+                if controller is not None:
+                    controller.received(sum(len(frame) for frame, _ in frames), len(frames))
+                for frame, address in frames:
+                    try:
+                        registry.peer(address[0]).received(len(frame))
+                        frame_type = protocol.message_type(frame)
+                        if frame_type == protocol.MSG_STATE or frame_type == protocol.MSG_DELTA:
+                            # Eigene Nachrichten kommen bei Multicast und Broadcast zurück
+                            if protocol.sender_id(frame) == own_id:
+                                continue
+                            if mesh_relay is not None and not mesh_relay.handle(frame, address[0]):
+                                continue
+                            # Zeitabgleich wird nicht mitgeschnitten
+                            if recorder is not None:
+                                recorder.write(frame, capture.RECEIVED)
+                            state = states.decode(frame)
+                            if state is None:
+                                # Schlüsselzustand verloren oder vor dem eigenen Start gesendet
+                                continue
+                            rx_log.debug("Nachricht empfangen: %s", state)
+                            if monitor is not None:
+                                # Zeitstempel ist in der Uhr des Absenders angegeben
+                                monitor.observe(state, now, monitor.offset(state.vehicle_id))
+                            if fleet_table is not None:
+                                fleet_table.update(state)
+                            if message_handler is not None:
+                                message_handler(state)
+                        elif frame_type == protocol.MSG_TIME_REQ:
+                            _, t0 = protocol.decode_time_request(frame)
+                            response = protocol.encode_time_response(own_id, t0, now, time.monotonic_ns())
+                            socket_object.sendto(response, (address[0], port) if port else address)
+                        elif frame_type == protocol.MSG_TIME_RESP and monitor is not None:
+                            monitor.time_response(frame, protocol.sender_id(frame), now)
+                    except Exception as e:
+                        # Eine fehlerhafte Nachricht beendet nicht den Empfang der übrigen
+                        logging_object.info(f"Nachricht von {address[0]} verworfen: {e!r}")
+                if reporting and time.monotonic() >= next_report:
+                    monitor.log_summary(logging_object, latency_budget)
+                    if mesh_relay is not None:
+                        logging_object.info(f"Weiterleitung: {mesh_relay.stats()}")
+                    next_report += report_interval
             else:
                 logging_object.info("Verbindung zum Netzwerk beendet.")
                 break
@@ -62,10 +284,17 @@ def receive_data(logging_object: logging.Logger, socket_object: socket.socket):
 """*****************************************************************************************************************"""
 
 
-def create_logger(name: str):
+def create_logger(name: str, background: bool = False, detail: bool = True,
+                  sample: dict = None, max_per_second: dict = None):
     """
-    Erstellt einen neuen Logger, löscht die alte Log-Datei und gibt Logger-Objekt zurück.
+    Erstellt einen neuen Logger, löscht die alte Log-Datei und gibt Logger-Objekt zurück. Einzelne Nachrichten der
+    Sende- und Empfangsschleifen werden nur mit detail protokolliert und können per sample bzw. max_per_second
+    reduziert werden.
     :param name: Name der Log-datei
+    :param background: True schreibt Log-Einträge über eine Queue in einem Hintergrund-Thread
+    :param detail: True protokolliert jede gesendete und empfangene Nachricht
+    :param sample: Nachrichtenklasse ("tx", "rx") -> n, nur jede n-te Nachricht wird geschrieben
+    :param max_per_second: Nachrichtenklasse ("tx", "rx") -> maximale Anzahl Nachrichten pro Sekunde
     :return: Logger-Objekt
     """
     # Log-Datei entfernen, falls sie existiert
@@ -73,152 +302,279 @@ def create_logger(name: str):
         os.remove(name)
 
     # Logger konfigurieren
-    logging.basicConfig(
-        handlers=[
-            logging.FileHandler(name),
-            logging.StreamHandler()
-        ],
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s')
-
-    return logging.getLogger(name)
+    return log_pipeline.configure(name, background, detail, sample, max_per_second)
 
 
 def get_ip_address(interface="wlan0"):
     """
-    Gibt die statische IPv4 des Geräts im Mesh-Netzwerk zurück.
+    Gibt die statische IPv4 des Geräts im Mesh-Netzwerk zurück. Die Adresse wird direkt per ioctl gelesen, ohne
+    Unterprozess.
     :param interface: Schnittstelle für Mesh-Netzwerk, standardmäßig wlan0
     :return: IPv4
     """
     try:
-        # Führe 'ip addr show [Interface]' aus
-        result = subprocess.run(['ip', 'addr', 'show', interface], capture_output=True, text=True)
-
-        # Überprüfe die Ausgabe mit einem regulären Ausdruck, um die IP-Adresse zu finden
-        ip_match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)', result.stdout)
-
-        # Wenn eine IP-Adresse gefunden wurde, gib sie zurück
-        if ip_match:
-            return ip_match.group(1)
-        else:
+        address = interfaces.interface_address(interface)
+        if address is None:
             print("Keine IP-Adresse gefunden.")
-            return None
+        return address
     except Exception as e:
         print(f"Fehler: {e}")
         return None
 
 
 def broadcast_own_ip(logging_object: logging.Logger, socket_object: socket.socket, broadcast_address: str,
-                     broadcast_port: int, ip_address: str, interval: int):
+                     broadcast_port: int, ip_address: str, interval: int, schedule: scheduler.Scheduler = None,
+                     holdoff: float = 0.5):
     """
-    Sendet eigene IPv4 per Broadcast an alle Teilnehmer.
+    Sendet eigene IPv4 per Broadcast an alle Teilnehmer. Mit schedule wird die Broadcast-Nachricht dort als Aufgabe
+    eingeplant und die Funktion kehrt sofort zurück, sonst sendet sie in einer eigenen Schleife.
     :param logging_object: Logger des Geräts
     :param socket_object: Verbindung des Geräts mit Broadcast-Kanal
     :param broadcast_address: IPv4 des Broadcast-Kanals
     :param broadcast_port: Port des Broadcast-Kanals
     :param ip_address: IPv4 des Geräts
     :param interval: Sendeintervall der Broadcast-Nachricht
-    :return: None
+    :param schedule: Scheduler eines anderen Threads, z.B. des Sende-Threads
+    :param holdoff: Mindestabstand in Sekunden zwischen der letzten Broadcast-Nachricht und einer sofortigen Antwort
+    auf einen neuen Teilnehmer
+    :return: Mit schedule eine Funktion ohne Argumente, die die Broadcast-Nachricht sofort sendet, damit ein neuer
+    Teilnehmer nicht auf den nächsten Takt wartet; innerhalb von holdoff nach der letzten Nachricht sendet sie nicht
     """
-    while True:
+    message = f"{ip_address}"
+    last_sent = None
+
+    def announce():
+        nonlocal last_sent
         try:
-            message = f"{ip_address}"
             socket_object.sendto(message.encode(), (broadcast_address, broadcast_port))
+            last_sent = time.monotonic()
             logging_object.info(f"Sende eigene IPv4 {message} per Broadcast...")
         except Exception as e:
             logging_object.info(f"Fehler: {e}")
-        time.sleep(interval)
 
+    def answer():
+        # Ein neuer Teilnehmer hat sich gerade selbst angekündigt und antwortet den anderen daher nicht
+        if last_sent is None or time.monotonic() - last_sent >= holdoff:
+            announce()
+
+    if schedule is not None:
+        schedule.add("discovery", interval, announce)
+        return answer
+    schedule = scheduler.Scheduler()
+    schedule.add("discovery", interval, announce)
+    schedule.run()
 
-def listen_for_peers(logging_object: logging.Logger, socket_object: socket.socket, peer_list: list,
-                     ip_address: str, timeout: int):
+
+def listen_for_peers(logging_object: logging.Logger, socket_object: socket.socket, peer_table: peers.PeerTable,
+                     registry: metrics.Registry = None, on_new_peer=None):
     """
-    Lauscht auf dem Broadcast-Kanal, sucht nach anderen Teilnehmern und fügt diese der Liste peer_list zu.
+    Lauscht auf dem Broadcast-Kanal, sucht nach anderen Teilnehmern und trägt diese in peer_table ein. Teilnehmer ohne
+    Rückmeldung werden zu ihrem Ablaufzeitpunkt entfernt, auch wenn keine Broadcast-Nachrichten eintreffen.
     :param logging_object: Logger des Geräts
     :param socket_object: Verbindung des Geräts mit Broadcast-Kanal
-    :param peer_list: 2D Liste mit IPs und Zeitstempel aller Teilnehmer
-    :param ip_address: IPv4 des Geräts
-    :param timeout: Dauer, bis ein Gerät ohne Rückmeldung aus der Liste peer_list entfernt wird
+    :param peer_table: Tabelle aller Teilnehmer
+    :param registry: Metriken des Geräts, aus denen die Zähler entfernter Teilnehmer gelöscht werden
+    :param on_new_peer: Optionale Funktion ohne Argumente, die nach dem Entdecken neuer Teilnehmer aufgerufen wird, z.B.
+    um die eigene IPv4 sofort anzukündigen
     :return: None
     """
-    # Lock zur Vermeidung von Deadlocks
-    peer_ips_lock = threading.Lock()
-    # Lauscht auf eingehende Nachrichten und fügt IP-Adressen anderer Teilnehmer zur Liste hinzu.
+    receiver = buffers.DatagramReceiver(socket_object, 64, 16)
     while True:
         try:
-            data, addr = socket_object.recvfrom(1024)
-            peer_ip = data.decode().strip()  # Die empfangene IP-Adresse aus der Nachricht extrahieren
-            current_time = time.time()
-            peer_found = False
-            # Check ob IP schon in Liste und aktualisiert Zeitstempel
-            for peer in peer_list:
-                if peer["ip"] == peer_ip:
-                    with peer_ips_lock:
-                        peer["last_seen"] = current_time
-                        peer_found = True
-            # Falls IP nicht in Liste, dann hinzufuegen
-            if not peer_found and peer_ip != ip_address:
-                with peer_ips_lock:
-                    peer_list.append({"ip": peer_ip, "last_seen": current_time})
-                    logging_object.info(f"Neuer Teilnehmer entdeckt: {peer_ip}")
+            deadline = peer_table.next_deadline()
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([socket_object], [], [], wait)
+            if readable:
+                discovered = False
+                for data, _ in receiver.receive(block=False):
+                    peer_ip = str(data, "ascii").strip()  # Die empfangene IP-Adresse aus der Nachricht extrahieren
+                    if peer_ip and peer_table.seen(peer_ip):
+                        logging_object.info(f"Neuer Teilnehmer entdeckt: {peer_ip}")
+                        discovered = True
+                if discovered and on_new_peer is not None:
+                    on_new_peer()
             # IPs entfernen, wenn Timeout erreicht
-            with peer_ips_lock:
-                peer_list[:] = [peer for peer in peer_list if current_time - peer["last_seen"] <= timeout]
+            for peer_ip in peer_table.expire():
+                logging_object.info(f"Teilnehmer {peer_ip} ohne Rückmeldung entfernt.")
+                if registry is not None:
+                    registry.forget_peer(peer_ip)
         except Exception as e:
             logging_object.info(f"Fehler beim Empfangen: {e}")
 
 
-def start(logging_object: logging.Logger, frequency: int, communication_port: int, timeout: int, bc_interval: int):
+def open_data_socket(data_mode: str, data_address: str, port: int, ip_address: str,
+                     multicast_ttl: int = 1) -> (socket.socket, socket.socket):
+    """
+    Erstellt Sende- und Empfangssocket für den Datenkanal per Multicast oder Broadcast. Der Empfangssocket wird an die
+    Gruppen- bzw. Broadcast-Adresse gebunden und empfängt damit nur den Datenkanal, sodass mehrere Teilnehmer auf einem
+    Gerät (Tests auf Loopback) den Port teilen können.
+    :param data_mode: MULTICAST oder BROADCAST
+    :param data_address: Multicast-Gruppe oder Broadcast-Adresse
+    :param port: Port zur Kommunikation
+    :param ip_address: IPv4 der Schnittstelle, über die gesendet und die Gruppe abonniert wird
+    :param multicast_ttl: Anzahl der Router, die eine Multicast-Nachricht passieren darf
+    :return: Sende-Socket, Empfangs-Socket
+    """
+    sending_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sending_socket.bind((ip_address, 0))
+    receiving_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiving_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if data_mode == MULTICAST:
+        interface = socket.inet_aton(ip_address)
+        sending_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, interface)
+        sending_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+        receiving_socket.bind((data_address, port))
+        receiving_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                    socket.inet_aton(data_address) + interface)
+    else:
+        sending_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        receiving_socket.bind((data_address, port))
+    return sending_socket, receiving_socket
+
+
+def start(logging_object: logging.Logger, frequency: int, communication_port: int, timeout: int, bc_interval: int,
+          capture_path: str = None, ip_address: str = None, interface: str = "wlan0",
+          broadcast_address: str = "192.168.2.255", broadcast_port: int = 5005, bind_address: str = "",
+          message_handler=None, report_interval: float = 10.0, latency_budget: float = None,
+          data_mode: str = UNICAST, data_address: str = None, multicast_ttl: int = 1, relay_ttl: int = 0,
+          relay_probability: float = 1.0, relay_neighbours: int = None, key_interval: int = None,
+          fleet_table=None, stats_path: str = None, stats_dump: str = None, stats_interval: float = 10.0,
+          network=None, rate_controller: congestion.RateController = None):
     """
     Startet den Teilnehmer.
     :param logging_object: Logger des Geräts
     :param frequency: Frequenz der Nachrichtenübertragung
     :param communication_port: Port der Kommunikation
-    :param timeout: Dauer, bis ein Gerät ohne Rückmeldung aus der Liste peer_list entfernt wird
+    :param timeout: Dauer, bis ein Gerät ohne Rückmeldung aus der Teilnehmertabelle entfernt wird
     :param bc_interval: Sendeintervall der Broadcast-Nachricht
+    :param capture_path: Pfad einer Capture-Datei, in der alle gesendeten und empfangenen Nachrichten aufgezeichnet
+    werden
+    :param ip_address: IPv4 des Geräts, standardmäßig die Adresse von interface
+    :param interface: Schnittstelle für das Mesh-Netzwerk
+    :param broadcast_address: IPv4 des Broadcast-Kanals (z.B. 127.255.255.255 für Tests auf Loopback)
+    :param broadcast_port: Port des Broadcast-Kanals
+    :param bind_address: Adresse, an die der Empfänger-Socket gebunden wird ("" = alle Schnittstellen)
+    :param message_handler: Optionale Funktion, die mit jedem empfangenen Fahrzeugzustand aufgerufen wird
+    :param report_interval: Abstand in Sekunden, in dem Verlust und Latenz ins Log geschrieben werden
+    :param latency_budget: Latenzbudget in ms, bei Überschreitung durch p99 wird eine Warnung geschrieben
+    :param data_mode: UNICAST (ein sendto je Teilnehmer), MULTICAST oder BROADCAST (ein sendto je Takt); die
+    Teilnehmertabelle dient bei MULTICAST und BROADCAST nur noch dem Zeitabgleich und der Übersicht
+    :param data_address: Multicast-Gruppe bzw. Broadcast-Adresse des Datenkanals, standardmäßig DEFAULT_GROUP bzw.
+    broadcast_address
+    :param multicast_ttl: Anzahl der Router, die eine Multicast-Nachricht passieren darf
+    :param relay_ttl: Anzahl der Hops, über die eigene Zustandsnachrichten von anderen Teilnehmern weitergeleitet
+    werden (höchstens protocol.MAX_TTL); 0 erreicht nur direkte Nachbarn und leitet auch keine fremden Nachrichten weiter
+    :param relay_probability: Wahrscheinlichkeit, mit der eine neue fremde Nachricht weitergeleitet wird
+    :param relay_neighbours: Bei mehr direkten Nachbarn sinkt die Wahrscheinlichkeit auf relay_neighbours / Nachbarn
+    (None = keine Anpassung)
+    :param key_interval: Abstand der vollständig gesendeten Schlüsselzustände in Nachrichten, dazwischen werden nur
+    Differenzen gesendet; None sendet jeden Zustand vollständig
+    :param fleet_table: Optionale fleet.FleetTable mit dem neuesten Zustand aller anderen Teilnehmer, die von der
+    Anwendung abgefragt wird (Abstände, nächste Fahrzeuge, Zeit bis zur Kollision)
+    :param stats_path: Pfad eines Unix-Domain-Sockets, über den Metriken (Nachrichten und Bytes je Teilnehmer, Größe
+    der Teilnehmertabelle, Überläufe des Sendetakts, Empfangsmessung, Threads) abgefragt und der Sampling-Profiler
+    geschaltet werden (siehe metrics), None ohne Abfrage
+    :param stats_dump: Datei, an die alle stats_interval Sekunden eine Momentaufnahme der Metriken als JSON-Zeile
+    angehängt wird, None ohne Momentaufnahmen
+    :param stats_interval: Abstand der Momentaufnahmen in Sekunden
+    :param network: Optionales impairment.Network, über das alle gesendeten Datagramme laufen (Nachbildung von Verlust,
+    Latenz und Bandbreite der Funkverbindungen für Benchmarks)
+    :param rate_controller: Optionale Überlastregelung (congestion.RateController), die die Sendefrequenz zwischen
+    ihren Grenzen an die Kanallast anpasst und bei deutlichen Zustandsänderungen sofort sendet; frequency wird dann
+    nicht verwendet
     :return: None
     """
-
-    # Broadcast Setup
-    broadcast_address = "192.168.2.255"
-    broadcast_port = 5005
+    if data_mode not in DATA_MODES:
+        raise ValueError(f"Unbekannter Datenkanal: {data_mode}")
 
     # finde IP-Adresse des Geräts
-    ipv4 = get_ip_address()
+    ipv4 = ip_address or get_ip_address(interface)
 
-    # Liste mit Teilnehmern
-    peer_list = []
+    # Tabelle mit Teilnehmern
+    peer_table = peers.PeerTable(timeout, ipv4)
+
+    # Optionaler Mitschnitt
+    recorder = capture.CaptureWriter(capture_path) if capture_path else None
 
     # Broadcast Socket Objekt
     broadcast_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     broadcast_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    # Mehrere Teilnehmer auf einem Gerät (Tests) teilen sich den Broadcast-Port
+    broadcast_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     broadcast_sock.bind(("", broadcast_port))
 
     # Sender Socket Objekt
     sending_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if bind_address:
+        # Absenderadresse festlegen, wenn mehrere Teilnehmer auf einem Gerät laufen
+        sending_socket.bind((bind_address, 0))
 
-    # Empfaenger Socket Objekt
+    # Empfaenger Socket Objekt, bei Multicast und Broadcast nur für Unicast an die eigene IPv4
     receiving_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    receiving_socket.bind(("", communication_port))
+    if data_mode != UNICAST and not bind_address:
+        bind_address = ipv4
+    receiving_socket.bind((bind_address, communication_port))
+
+    # Datenkanal per Multicast oder Broadcast, Unicast-Sockets bleiben für den Zeitabgleich
+    group_sending_socket = group_receiving_socket = None
+    if data_mode != UNICAST:
+        if data_address is None:
+            data_address = DEFAULT_GROUP if data_mode == MULTICAST else broadcast_address
+        group_sending_socket, group_receiving_socket = open_data_socket(
+            data_mode, data_address, communication_port, bind_address, multicast_ttl)
+        logging_object.info(f"Datenkanal per {data_mode} an {data_address}:{communication_port}")
+    else:
+        data_address = None
+
+    if network is not None:
+        broadcast_sock, sending_socket, receiving_socket = (
+            network.wrap(sock) for sock in (broadcast_sock, sending_socket, receiving_socket))
+        if group_sending_socket is not None:
+            group_sending_socket = network.wrap(group_sending_socket)
+
+    # Zustandsnachrichten, Zeitanfragen und Broadcast-Nachricht laufen mit eigenen Frequenzen im Sende-Thread
+    schedule = scheduler.Scheduler()
+    answer = broadcast_own_ip(logging_object, broadcast_sock, broadcast_address, broadcast_port, ipv4, bc_interval,
+                              schedule)
+    encoder = protocol.DeltaEncoder(key_interval) if key_interval else None
+
+    def welcome():
+        # Neue Teilnehmer kennen sofort alle anderen und müssen nicht auf den nächsten Schlüsselzustand warten
+        answer()
+        if encoder is not None:
+            encoder.reset()
 
     # Threads initialisieren
-    broadcast_thread = threading.Thread(target=broadcast_own_ip,
-                                        args=(logging_object, broadcast_sock, broadcast_address,
-                                              broadcast_port, ipv4, bc_interval))
-    broadcast_thread.daemon = True
-
+    registry = metrics.Registry()
     listener_thread = threading.Thread(target=listen_for_peers,
-                                       args=(logging_object, broadcast_sock, peer_list, ipv4, timeout))
+                                       args=(logging_object, broadcast_sock, peer_table, registry, welcome))
     listener_thread.daemon = True
 
+    monitor = instrumentation.Instrumentation()
+    own_id = protocol.vehicle_id(ipv4)
+    states = protocol.DeltaDecoder()
+    mesh_relay = None
+    if relay_ttl > 0:
+        mesh_relay = relay.Relay(own_id, group_sending_socket or sending_socket, communication_port, peer_table,
+                                 data_address, relay_probability, relay_neighbours)
+        registry.source("relay", mesh_relay.stats)
+    registry.gauge("peers", peer_table.__len__)
+    registry.source("reception", monitor.summary)
+    if fleet_table is not None:
+        registry.gauge("fleet", fleet_table.__len__)
+    stats = None
+    if stats_path or stats_dump:
+        stats = metrics.StatsServer(registry, stats_path, stats_dump, stats_interval).start()
     send_thread = threading.Thread(target=send_data,
-                                   args=(logging_object, ipv4, sending_socket, peer_list,
-                                         communication_port, frequency))
+                                   args=(logging_object, ipv4, group_sending_socket or sending_socket, peer_table,
+                                         communication_port, frequency, recorder, monitor, 1.0, data_address,
+                                         schedule, 60.0, relay_ttl, key_interval, registry, encoder, rate_controller))
     receive_thread = threading.Thread(target=receive_data,
-                                      args=(logging_object, receiving_socket))
+                                      args=(logging_object, receiving_socket, recorder, message_handler, monitor,
+                                            own_id, communication_port, report_interval, latency_budget, mesh_relay,
+                                            states, fleet_table, registry, rate_controller, group_receiving_socket))
 
     # Threads starten
-    broadcast_thread.start()
     listener_thread.start()
     send_thread.start()
     receive_thread.start()
@@ -229,3 +585,10 @@ def start(logging_object: logging.Logger, frequency: int, communication_port: in
     broadcast_sock.close()
     sending_socket.close()
     receiving_socket.close()
+    if data_address is not None:
+        group_sending_socket.close()
+        group_receiving_socket.close()
+    if recorder is not None:
+        recorder.close()
+    if stats is not None:
+        stats.close()
@@ -0,0 +1,114 @@
+import heapq
+import threading
+import time
+
+
+"""
+Teilnehmertabelle des P2P-Knotens. Teilnehmer werden über ihre IPv4 in einem Dictionary gefunden, die Zeitüberschreitung
+wird über einen Min-Heap der Ablaufzeitpunkte geprüft, sodass weder Aktualisierung noch Ablauf die ganze Tabelle
+durchsuchen. Sendeschleifen lesen einen unveränderlichen Schnappschuss (Tupel), der nur bei Beitritt oder Austritt
+eines Teilnehmers neu erstellt wird und ohne Lock gelesen werden kann.
+"""
+
+
+class Peer:
+    """
+    Eintrag eines Teilnehmers.
+    """
+    __slots__ = ("ip", "first_seen", "last_seen")
+
+    def __init__(self, ip: str, now: float):
+        self.ip = ip
+        self.first_seen = now
+        self.last_seen = now
+
+
+class PeerTable:
+    """
+    Threadsichere Tabelle aller bekannten Teilnehmer.
+    """
+
+    def __init__(self, timeout: float, own_ip: str = None):
+        """
+        :param timeout: Dauer in Sekunden, bis ein Teilnehmer ohne Rückmeldung entfernt wird
+        :param own_ip: Eigene IPv4, wird nie aufgenommen
+        """
+        self.timeout = timeout
+        self.own_ip = own_ip
+        self._peers = {}
+        # Ein Eintrag (Ablaufzeitpunkt, IPv4) je Teilnehmer, veraltete Zeitpunkte werden beim Ablauf nachgetragen
+        self._deadlines = []
+        self._lock = threading.Lock()
+        self._snapshot = ()
+
+    def seen(self, ip: str, now: float = None) -> bool:
+        """
+        Vermerkt eine Rückmeldung eines Teilnehmers.
+        :param ip: IPv4 des Teilnehmers
+        :param now: Zeitpunkt (time.monotonic()), standardmäßig jetzt
+        :return: True, wenn der Teilnehmer neu ist
+        """
+        if ip == self.own_ip:
+            return False
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            peer = self._peers.get(ip)
+            if peer is not None:
+                peer.last_seen = now
+                return False
+            self._peers[ip] = Peer(ip, now)
+            heapq.heappush(self._deadlines, (now + self.timeout, ip))
+            self._snapshot = tuple(self._peers)
+            return True
+
+    def expire(self, now: float = None) -> list:
+        """
+        Entfernt alle Teilnehmer, deren letzte Rückmeldung länger als timeout zurückliegt.
+        :param now: Zeitpunkt (time.monotonic()), standardmäßig jetzt
+        :return: Liste der entfernten IPv4
+        """
+        if now is None:
+            now = time.monotonic()
+        removed = []
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] < now:
+                _, ip = heapq.heappop(deadlines)
+                peer = self._peers[ip]
+                deadline = peer.last_seen + self.timeout
+                if deadline < now:
+                    del self._peers[ip]
+                    removed.append(ip)
+                else:
+                    # Zwischenzeitlich gemeldet: erst jetzt den neuen Ablaufzeitpunkt eintragen
+                    heapq.heappush(deadlines, (deadline, ip))
+            if removed:
+                self._snapshot = tuple(self._peers)
+        return removed
+
+    def next_deadline(self) -> float:
+        """
+        :return: Frühester möglicher Ablaufzeitpunkt (time.monotonic()), None ohne Teilnehmer
+        """
+        deadlines = self._deadlines
+        return deadlines[0][0] if deadlines else None
+
+    def snapshot(self) -> tuple:
+        """
+        :return: IPv4 aller Teilnehmer zum Zeitpunkt der letzten Änderung (ohne Lock, nicht veränderbar)
+        """
+        return self._snapshot
+
+    def get(self, ip: str) -> Peer:
+        """
+        :param ip: IPv4 des Teilnehmers
+        :return: Eintrag des Teilnehmers, None wenn unbekannt
+        """
+        return self._peers.get(ip)
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    def __contains__(self, ip: str) -> bool:
+        return ip in self._peers
@@ -0,0 +1,129 @@
+import random
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from . import peers
+from . import protocol
+
+
+"""
+Weiterleitung von Zustandsnachrichten über mehrere Hops im Mesh-Netzwerk. Jede Nachricht wird über Fahrzeug-ID des
+Ursprungs und Sequenznummer erkannt und von jedem Teilnehmer höchstens einmal weitergeleitet, mit um eins verringerter
+TTL. Bereits gesehene Nachrichten werden in einem begrenzten LRU-Cache gehalten, Duplikate werden weder weitergeleitet
+noch zugestellt. Um redundante Wiederholungen in dichten Netzen zu begrenzen, wird mit einer Wahrscheinlichkeit
+weitergeleitet, die mit der Anzahl der direkten Nachbarn sinkt (bei mehr als neighbour_target Nachbarn
+neighbour_target / Nachbarn).
+"""
+
+
+class SeenCache:
+    """
+    Begrenzter LRU-Cache der zuletzt gesehenen Nachrichten (Ursprung, Sequenznummer).
+    """
+
+    def __init__(self, capacity: int = 4096):
+        """
+        :param capacity: Maximale Anzahl gespeicherter Nachrichten, z.B. Teilnehmer * Frequenz * Laufzeit im Netz
+        """
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, origin: int, seq: int) -> bool:
+        """
+        Vermerkt eine Nachricht.
+        :param origin: Fahrzeug-ID des Ursprungs
+        :param seq: Sequenznummer
+        :return: True, wenn die Nachricht neu ist
+        """
+        key = (origin, seq)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return False
+            self._entries[key] = None
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Relay:
+    """
+    Duplikaterkennung und Weiterleitung empfangener Zustandsnachrichten eines Teilnehmers.
+    """
+
+    def __init__(self, own_id: int, socket_object: socket.socket, port: int, peer_table: peers.PeerTable,
+                 data_address: str = None, probability: float = 1.0, neighbour_target: int = None,
+                 capacity: int = 4096):
+        """
+        :param own_id: Fahrzeug-ID des Geräts, eigene Nachrichten werden nie weitergeleitet
+        :param socket_object: Socket, über den weitergeleitet wird
+        :param port: Port zur Kommunikation
+        :param peer_table: Tabelle der direkten Nachbarn
+        :param data_address: Multicast-Gruppe oder Broadcast-Adresse, None für Unicast an jeden Nachbarn
+        :param probability: Grundwahrscheinlichkeit, mit der eine neue Nachricht weitergeleitet wird
+        :param neighbour_target: Gewünschte Anzahl weiterleitender Nachbarn, None ohne Anpassung an die Nachbarzahl
+        :param capacity: Größe des Caches gesehener Nachrichten
+        """
+        self.own_id = own_id
+        self.socket_object = socket_object
+        self.port = port
+        self.peer_table = peer_table
+        self.data_address = data_address
+        self.probability = probability
+        self.neighbour_target = neighbour_target
+        self.seen = SeenCache(capacity)
+        self.duplicates = 0
+        self.relayed = 0
+        self.suppressed = 0
+
+    def relay_probability(self) -> float:
+        """
+        :return: Aktuelle Wahrscheinlichkeit, mit der eine neue Nachricht weitergeleitet wird
+        """
+        neighbours = len(self.peer_table)
+        if self.neighbour_target is not None and neighbours > self.neighbour_target:
+            return self.probability * self.neighbour_target / neighbours
+        return self.probability
+
+    def handle(self, frame, source_ip: str) -> bool:
+        """
+        Prüft einen empfangenen Zustands-Frame auf Duplikate und leitet neue Frames mit verbleibender TTL weiter.
+        :param frame: Vollständiger Frame vom Typ MSG_STATE oder MSG_DELTA
+        :param source_ip: IPv4 des direkten Absenders
+        :return: True, wenn der Frame neu ist und zugestellt werden soll
+        """
+        origin = protocol.sender_id(frame)
+        if origin == self.own_id or not self.seen.add(origin, protocol.sequence(frame)):
+            self.duplicates += 1
+            return False
+        ttl = protocol.ttl(frame)
+        if ttl == 0:
+            return True
+        if random.random() >= self.relay_probability():
+            self.suppressed += 1
+            return True
+        self._send(protocol.with_ttl(frame, ttl - 1), source_ip, origin)
+        self.relayed += 1
+        return True
+
+    def _send(self, frame: bytes, source_ip: str, origin: int):
+        if self.data_address is not None:
+            self.socket_object.sendto(frame, (self.data_address, self.port))
+            return
+        origin_ip = socket.inet_ntoa(struct.pack("!I", origin))
+        for peer_ip in self.peer_table.snapshot():
+            # Direkter Absender und Ursprung haben die Nachricht bereits
+            if peer_ip != source_ip and peer_ip != origin_ip:
+                self.socket_object.sendto(frame, (peer_ip, self.port))
+
+    def stats(self) -> dict:
+        """
+        :return: Weitergeleitete, unterdrückte und doppelt empfangene Nachrichten
+        """
+        return {"relayed": self.relayed, "suppressed": self.suppressed, "duplicates": self.duplicates,
+                "probability": self.relay_probability()}
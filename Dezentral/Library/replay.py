@@ -0,0 +1,36 @@
+import logging
+import socket
+import time
+from . import capture
+from . import protocol
+
+
+def replay_to_node(logging_object: logging.Logger, path: str, node_ip: str, port: int, speed: float = 1.0,
+                   restamp: bool = True, direction: int = capture.SENT) -> int:
+    """
+    Spielt einen Mitschnitt per UDP in einen laufenden Teilnehmer ein, als kämen die Frames von den aufgezeichneten
+    Fahrzeugen.
+    :param logging_object: Logger
+    :param path: Pfad der Capture-Datei
+    :param node_ip: IPv4 des Teilnehmers
+    :param port: Kommunikations-Port des Teilnehmers
+    :param speed: Zeitfaktor (1 = Echtzeit, N = N-fach schneller, 0 = so schnell wie möglich)
+    :param restamp: True ersetzt den Zeitstempel der Zustands-Frames durch den aktuellen Sendezeitpunkt
+    :param direction: Nur Einträge dieser Richtung einspielen, None für alle
+    :return: Anzahl gesendeter Frames
+    """
+    reader = capture.CaptureReader(path)
+    sending_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    logging_object.info(f"Replay von {len(reader)} Einträgen an {node_ip}:{port} (Faktor {speed})")
+    sent = 0
+    try:
+        for _, _, _, frame in capture.paced(reader, speed, direction):
+            if restamp:
+                frame = protocol.with_timestamp(frame, time.monotonic_ns())
+            sending_socket.sendto(frame, (node_ip, port))
+            sent += 1
+    finally:
+        sending_socket.close()
+        reader.close()
+    logging_object.info(f"Replay beendet: {sent} Frames gesendet.")
+    return sent
@@ -0,0 +1,42 @@
+import logging
+from Library import benchmark
+
+
+"""
+Benchmark für das dezentrale Netzwerk auf Loopback. Jeder Teilnehmer läuft in einem eigenen Prozess mit eigener
+Adresse 127.0.0.x, jeder Bericht wird als JSON-Zeile an report_path angehängt.
+
+Parameter:
+nodes: Anzahl der Teilnehmer
+frequency [Hz]: Sendefrequenz je Teilnehmer
+duration [s]: Messdauer
+bc_interval [s]: Sendeintervall der Broadcast-Nachricht während des Benchmarks
+c_port: Port für die Kommunikation während des Benchmarks
+broadcast_port: Port der Teilnehmer-Entdeckung während des Benchmarks
+data_modes: Datenkanäle, die nacheinander gemessen werden: "unicast", "multicast" (Gruppe 239.255.0.1 über Loopback)
+oder "broadcast" (127.255.255.255)
+scenarios: Kanalbedingungen, unter denen jeder Datenkanal gemessen wird: None (ohne Beeinträchtigung), Name aus
+impairment.SCENARIOS ("ideal", "wifi", "wifi_congested", "mesh", "outage") oder Pfad einer JSON-Datei
+report_path: Datei, an die der Bericht angehängt wird (JSON Lines)
+"""
+
+# Setup
+nodes = 10
+frequency = 20
+duration = 10
+bc_interval = 0.5
+c_port = 51006
+broadcast_port = 51005
+data_modes = ["unicast", "multicast", "broadcast"]
+scenarios = [None]
+report_path = "benchmark.jsonl"
+
+# Start
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger("benchmark")
+    for scenario in scenarios:
+        for data_mode in data_modes:
+            report = benchmark.run(logger, nodes, frequency, duration, c_port, broadcast_port, bc_interval,
+                                   options={"data_mode": data_mode}, scenario=scenario)
+            benchmark.write_report(report, report_path)
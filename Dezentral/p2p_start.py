@@ -1,3 +1,5 @@
+from Library import congestion
+from Library import fleet
 from Library import p2p
 
 
@@ -9,6 +11,33 @@ timeout [s]: Nach Ablauf dieser Zeit wird der Kommunikationsteilnehmer aus der L
 muss sich erneut melden (hier 2x bc_interval)
 c_port: Port für die Kommunikation
 logger_name: Name des Loggers, in dem Informationen gespeichert werden
+log_background: True schreibt Log-Einträge in einem Hintergrund-Thread, Sende- und Empfangsschleifen warten nicht auf
+Datei und Konsole
+log_detail: True protokolliert jede gesendete und empfangene Nachricht
+log_sample: Nachrichtenklasse ("tx", "rx") -> n, nur jede n-te Nachricht wird protokolliert (None = alle)
+capture_path: Datei, in der jede gesendete und empfangene Nachricht binär aufgezeichnet wird (None = kein Mitschnitt)
+report_interval [s]: Abstand, in dem Verlust, Umsortierung und Latenz (p50/p99/p999) ins Log geschrieben werden
+latency_budget [ms]: Latenzbudget Fahrzeug zu Fahrzeug, bei Überschreitung durch p99 wird gewarnt (None = keine Prüfung)
+data_mode: "unicast" (eine Nachricht je Teilnehmer), "multicast" oder "broadcast" (eine Nachricht je Takt für alle)
+data_address: Multicast-Gruppe bzw. Broadcast-Adresse des Datenkanals (None = 239.255.0.1 bzw. Broadcast-Adresse)
+relay_ttl: Anzahl der Hops, über die Nachrichten weitergeleitet werden (0 = nur direkte Nachbarn, höchstens 15)
+relay_probability: Wahrscheinlichkeit, mit der eine neue fremde Nachricht weitergeleitet wird
+relay_neighbours: Bei mehr direkten Nachbarn leitet jeder nur mit Wahrscheinlichkeit relay_neighbours / Nachbarn weiter
+(None = immer mit relay_probability)
+key_interval: Nur jeder key_interval-te Zustand wird vollständig gesendet, dazwischen die Differenz zu diesem (z.B.
+send_freq für einen vollständigen Zustand je Sekunde, None = jeder Zustand vollständig). Alle Teilnehmer müssen
+Differenzen (MSG_DELTA) verstehen, ältere Teilnehmer verwerfen sie
+fleet_capacity: Anfängliche Anzahl der Teilnehmer in der Zustandstabelle fleet_table, die Anwendungen abfragen (z.B.
+fleet_table.within(x, y, 50), fleet_table.nearest(x, y, 3), fleet_table.time_to_collision(x, y, v, h))
+fleet_max_age [s]: Teilnehmer ohne Nachricht in dieser Zeit werden aus der Zustandstabelle entfernt
+stats_path: Unix-Domain-Socket für Metriken und Profiler im laufenden Betrieb, z.B. echo stats | socat -
+UNIX-CONNECT:p2p.stats oder echo "profile start" (None = keine Abfrage)
+stats_dump: Datei, an die periodisch eine Momentaufnahme der Metriken als JSON-Zeile angehängt wird (None = keine)
+stats_interval [s]: Abstand der Momentaufnahmen in stats_dump
+rate_control: True passt die Sendefrequenz an die Kanallast an (DCC) und sendet bei deutlichen Änderungen von Richtung,
+Geschwindigkeit oder Position sofort; send_freq ist dann die Höchstfrequenz (False = immer send_freq)
+min_freq [Hz]: Untere Grenze der Sendefrequenz bei voller Kanallast
+channel_capacity [bit/s]: Kapazität des gemeinsamen Funkkanals, aus der die Kanallast geschätzt wird
 """
 
 
@@ -18,7 +47,37 @@ bc_time = 5
 timeout = 2*bc_time
 c_port = 5006
 logger_name = "p2p.log"
-logger = p2p.create_logger(logger_name)
+log_background = False
+log_detail = True
+log_sample = None
+capture_path = None
+report_interval = 10
+latency_budget = None
+data_mode = "unicast"
+data_address = None
+relay_ttl = 0
+relay_probability = 1.0
+relay_neighbours = None
+key_interval = None
+fleet_capacity = 64
+fleet_max_age = 2.0
+stats_path = None
+stats_dump = None
+stats_interval = 10.0
+rate_control = False
+min_freq = 1
+channel_capacity = 6e6
+logger = p2p.create_logger(logger_name, log_background, log_detail, log_sample)
+fleet_table = fleet.FleetTable(fleet_capacity, fleet_max_age)
+rate_controller = None
+if rate_control:
+    # Bei hoher Last werden seltener Schlüsselzustände gesendet (höchstens halb so oft)
+    rate_controller = congestion.RateController(min_freq, send_freq, channel_capacity,
+                                                key_intervals=(key_interval, 2 * key_interval) if key_interval else None)
 
 # Start
-p2p.start(logger, send_freq, c_port, timeout, bc_time)
+p2p.start(logger, send_freq, c_port, timeout, bc_time, capture_path, report_interval=report_interval,
+          latency_budget=latency_budget, data_mode=data_mode, data_address=data_address, relay_ttl=relay_ttl,
+          relay_probability=relay_probability, relay_neighbours=relay_neighbours, key_interval=key_interval,
+          fleet_table=fleet_table, stats_path=stats_path, stats_dump=stats_dump, stats_interval=stats_interval,
+          rate_controller=rate_controller)
@@ -0,0 +1,28 @@
+from Library import p2p
+from Library import replay
+
+
+"""
+Spielt einen mit p2p_start (capture_path) aufgezeichneten Mitschnitt in einen laufenden Teilnehmer ein, z.B. für
+reproduzierbare Lasttests.
+
+Parameter:
+capture_path: Capture-Datei eines Teilnehmers
+node_ip: IPv4 des Teilnehmers, der die Nachrichten empfängt
+c_port: Port für die Kommunikation (muss übereinstimmen mit p2p_start)
+speed: Zeitfaktor (1 = Echtzeit, N = N-fach schneller, 0 = so schnell wie möglich)
+restamp: True ersetzt die Zeitstempel der Nachrichten durch den Sendezeitpunkt
+logger_name: Name des Loggers
+"""
+
+# Setup
+capture_path = "p2p.cap"
+node_ip = "127.0.0.1"
+c_port = 5006
+speed = 1.0
+restamp = True
+logger_name = "replay.log"
+logger = p2p.create_logger(logger_name)
+
+# Start
+replay.replay_to_node(logger, capture_path, node_ip, c_port, speed, restamp)
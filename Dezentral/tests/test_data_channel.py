@@ -0,0 +1,101 @@
+import logging
+import socket
+import threading
+import time
+import pytest
+from Library import p2p
+from Library import protocol
+
+
+"""
+Datenkanal per Multicast und Broadcast auf Loopback: zwei Teilnehmer mit eigenen Adressen 127.0.0.x empfangen die
+Zustände des jeweils anderen, eigene über die Gruppe zurückkommende Nachrichten werden verworfen.
+"""
+
+
+FIRST = "127.0.9.2"
+SECOND = "127.0.9.3"
+DATA_CHANNELS = [(p2p.MULTICAST, p2p.DEFAULT_GROUP, 52106), (p2p.BROADCAST, "127.255.255.255", 52116)]
+
+
+class Received:
+    """
+    message_handler eines Teilnehmers, sammelt die Absender der empfangenen Zustände.
+    """
+
+    def __init__(self):
+        self.senders = []
+        self.lock = threading.Lock()
+
+    def handle(self, state: protocol.VehicleState):
+        with self.lock:
+            self.senders.append(state.vehicle_id)
+
+    def count(self, vehicle_id: int) -> int:
+        with self.lock:
+            return self.senders.count(vehicle_id)
+
+
+def quiet_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def start_node(ip_address: str, data_mode: str, data_address: str, port: int) -> Received:
+    received = Received()
+    node = threading.Thread(
+        target=p2p.start,
+        args=(quiet_logger(f"test.{data_mode}.{ip_address}"), 20, port, 2, 0.2),
+        kwargs=dict(ip_address=ip_address, broadcast_address="127.255.255.255", broadcast_port=port - 1,
+                    bind_address=ip_address, message_handler=received.handle, report_interval=None,
+                    data_mode=data_mode, data_address=data_address))
+    node.daemon = True
+    node.start()
+    return received
+
+
+@pytest.mark.parametrize("data_mode, data_address, port", DATA_CHANNELS)
+def test_nodes_receive_each_other(data_mode, data_address, port):
+    first = start_node(FIRST, data_mode, data_address, port)
+    second = start_node(SECOND, data_mode, data_address, port)
+    first_id, second_id = protocol.vehicle_id(FIRST), protocol.vehicle_id(SECOND)
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline and (first.count(second_id) < 10 or second.count(first_id) < 10):
+        time.sleep(0.1)
+    assert first.count(second_id) >= 10
+    assert second.count(first_id) >= 10
+    assert first.count(first_id) == 0
+    assert second.count(second_id) == 0
+
+
+@pytest.mark.parametrize("data_mode, data_address, port", DATA_CHANNELS)
+def test_own_frames_are_dropped(data_mode, data_address, port):
+    port += 5
+    sending_socket, group_socket = p2p.open_data_socket(data_mode, data_address, port, FIRST)
+    unicast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    unicast_socket.bind((FIRST, port))
+    received = Received()
+    receiver = threading.Thread(target=p2p.receive_data,
+                                args=(quiet_logger(f"test.own.{data_mode}"), unicast_socket),
+                                kwargs=dict(message_handler=received.handle, own_id=protocol.vehicle_id(FIRST),
+                                            port=port, report_interval=None, group_socket=group_socket))
+    receiver.daemon = True
+    receiver.start()
+    try:
+        first_id, second_id = protocol.vehicle_id(FIRST), protocol.vehicle_id(SECOND)
+        for seq in range(5):
+            for vehicle_id in (first_id, second_id):
+                state = protocol.VehicleState(vehicle_id, seq, time.monotonic_ns(), 1.0, 2.0, 3.0, 4.0)
+                sending_socket.sendto(protocol.encode_state(state), (data_address, port))
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline and received.count(second_id) < 5:
+            time.sleep(0.05)
+        # Beide Nachrichten kommen über denselben Weg zurück, zugestellt wird nur die fremde
+        assert received.count(second_id) == 5
+        assert received.count(first_id) == 0
+    finally:
+        sending_socket.close()
+        group_socket.close()
+        unicast_socket.close()
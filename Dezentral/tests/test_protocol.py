@@ -0,0 +1,104 @@
+import pytest
+from Library import buffers
+from Library import protocol
+
+
+"""
+Framing und Codec aus Gemeinsam/protocol.py: zu kurze Frames werden beim Zerlegen verworfen, damit kein Empfänger beim
+Lesen der Felder scheitert.
+"""
+
+
+STATE = protocol.VehicleState(7, 3, 1_000_000, 1.5, -2.5, 10.0, 90.0)
+
+
+def truncated(frame: bytes, size: int) -> bytes:
+    # Längenfeld passend zur gekürzten Länge, der Frame ist also vollständig, aber zu kurz für seinen Typ
+    return protocol.LENGTH.pack(size - protocol.LENGTH.size) + frame[protocol.LENGTH.size:size]
+
+
+def valid_frames() -> list:
+    key = protocol.decode_state(protocol.encode_state(STATE))
+    return [protocol.encode_state(STATE), protocol.encode_time_request(7, 1), protocol.encode_time_response(0, 1, 2, 3),
+            protocol.encode_register(7), protocol.encode_resume(7, 5),
+            protocol.encode_delta(key, STATE._replace(seq=4, timestamp=2_000_000, x=2.0, heading=91.0))]
+
+
+@pytest.mark.parametrize("frame", valid_frames())
+def test_complete_frames_are_valid(frame):
+    assert protocol.valid(frame)
+    assert not protocol.valid(truncated(frame, len(frame) - 1))
+    assert not protocol.valid(truncated(frame, protocol.HEADER.size))
+
+
+def test_unknown_types_need_only_the_header():
+    assert protocol.valid(bytes([0, 2, 99, 0]))
+    assert not protocol.valid(bytes([0, 1, 99]))
+
+
+def test_framing_drops_short_frames():
+    good = protocol.encode_state(STATE)
+    data = truncated(good, 4) + truncated(good, 20) + good
+    assert list(protocol.iter_frames(data)) == [good]
+    assert protocol.FrameDecoder().feed(data) == [good]
+    frames = []
+    assert buffers.split_frames(memoryview(data), frames) == len(data)
+    assert [bytes(frame) for frame in frames] == [good]
+
+
+def drive(count: int) -> list:
+    # Fahrzeug fährt mit 10 m/s geradeaus und lenkt leicht, 10 Hz
+    return [STATE._replace(seq=seq, timestamp=STATE.timestamp + seq * 100_000_000, x=STATE.x + seq * 1.0,
+                           heading=STATE.heading + seq * 0.5) for seq in range(count)]
+
+
+def assert_close(decoded: protocol.VehicleState, state: protocol.VehicleState):
+    # Abweichung höchstens eine Einheit der Differenz-Kodierung (mm, mm/s, 0,01 Grad) plus float32-Rundung
+    assert decoded[:3] == state[:3]
+    for value, expected, scale in zip(decoded[3:], state[3:], protocol.DELTA_SCALES):
+        assert value == pytest.approx(expected, abs=1 / scale)
+
+
+def test_delta_round_trip_with_key_interval():
+    encoder = protocol.DeltaEncoder(key_interval=4)
+    decoder = protocol.DeltaDecoder()
+    states = drive(10)
+    frames = [encoder.encode(state) for state in states]
+    assert [protocol.message_type(frame) for frame in frames] == [protocol.MSG_STATE, *[protocol.MSG_DELTA] * 3] * 2 + \
+        [protocol.MSG_STATE, protocol.MSG_DELTA]
+    for frame, state in zip(frames, states):
+        assert protocol.valid(frame)
+        assert_close(decoder.decode(frame), state)
+    assert decoder.missing == 0
+
+
+def test_delta_without_key_is_dropped_until_next_key():
+    encoder = protocol.DeltaEncoder(key_interval=3)
+    decoder = protocol.DeltaDecoder()
+    frames = [encoder.encode(state) for state in drive(7)]
+    # Der erste Schlüsselzustand geht verloren, der Empfänger setzt mit dem nächsten (Nachricht 3) wieder auf
+    decoded = [decoder.decode(frame) for frame in frames[1:]]
+    assert decoded[:2] == [None, None]
+    assert [state.seq for state in decoded[2:]] == [3, 4, 5, 6]
+    assert decoder.missing == 2
+
+
+def test_delta_against_replaced_key_is_dropped():
+    encoder = protocol.DeltaEncoder(key_interval=3)
+    decoder = protocol.DeltaDecoder()
+    frames = [encoder.encode(state) for state in drive(5)]
+    decoder.decode(frames[0])
+    # Schlüsselzustand 3 fehlt, Differenz 4 bezieht sich auf ihn und nicht auf den bekannten Schlüsselzustand 0
+    assert decoder.decode(frames[4]) is None
+    assert decoder.missing == 1
+
+
+def test_encoder_falls_back_to_key_frames():
+    encoder = protocol.DeltaEncoder(key_interval=10)
+    first, jump = STATE, STATE._replace(seq=STATE.seq + 1, x=STATE.x + 100.0)
+    assert protocol.message_type(encoder.encode(first)) == protocol.MSG_STATE
+    # 100 m passen nicht in eine Differenz in mm
+    assert protocol.message_type(encoder.encode(jump)) == protocol.MSG_STATE
+    assert protocol.message_type(encoder.encode(jump._replace(seq=jump.seq + 1))) == protocol.MSG_DELTA
+    encoder.reset()
+    assert protocol.message_type(encoder.encode(jump._replace(seq=jump.seq + 2))) == protocol.MSG_STATE
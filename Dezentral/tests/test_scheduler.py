@@ -0,0 +1,96 @@
+import pytest
+from Library import scheduler
+
+
+"""
+Scheduler aus Gemeinsam/scheduler.py mit simulierter Uhr: Warten und Aufgaben verschieben nur die Uhr, sodass sich
+Drift und Verhalten bei Überläufen exakt prüfen lassen.
+"""
+
+
+PERIOD = 0.1
+
+
+class FakeClock:
+    """
+    Ersetzt time.monotonic() und das Weck-Event des Schedulers. Jedes Warten wacht um latency zu spät auf.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.now = 1000.0
+        self.latency = latency
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def wait(self, timeout: float = None) -> bool:
+        self.now += timeout + self.latency
+        return False
+
+    def set(self):
+        pass
+
+    def clear(self):
+        pass
+
+
+def make_scheduler(monkeypatch, clock: FakeClock) -> scheduler.Scheduler:
+    monkeypatch.setattr(scheduler.time, "monotonic", clock.monotonic)
+    tasks = scheduler.Scheduler()
+    tasks._wakeup = clock
+    return tasks
+
+
+def run_until(tasks: scheduler.Scheduler, clock: FakeClock, runs: int, durations: dict = None,
+              policy: str = scheduler.SKIP, max_backlog: int = 10) -> list:
+    """
+    Führt eine Aufgabe aus, bis sie runs-mal gelaufen ist.
+    :param durations: Nummer der Ausführung -> Laufzeit in Sekunden, sonst 0
+    :return: Startzeitpunkte relativ zum ersten geplanten Zeitpunkt
+    """
+    first_due = clock.now
+    starts = []
+
+    def callback():
+        starts.append(round(clock.now - first_due, 9))
+        clock.now += (durations or {}).get(len(starts) - 1, 0.0)
+        if len(starts) == runs:
+            tasks.stop()
+
+    tasks.add("state", PERIOD, callback, policy=policy, max_backlog=max_backlog)
+    tasks.run()
+    return starts
+
+
+def test_deadlines_do_not_drift(monkeypatch):
+    # Laufzeit und verspätetes Aufwachen verschieben nur den einzelnen Start, nicht das Raster
+    clock = FakeClock(latency=0.002)
+    tasks = make_scheduler(monkeypatch, clock)
+    starts = run_until(tasks, clock, 1000, durations={n: 0.03 for n in range(1000)})
+    # Die erste Ausführung ist sofort fällig, alle weiteren wachen um genau latency zu spät auf
+    assert starts[0] == 0.0
+    for n, start in enumerate(starts[1:], 1):
+        assert start == pytest.approx(n * PERIOD + clock.latency, abs=1e-6)
+    task = tasks.tasks["state"]
+    assert task.overruns == 0 and task.skipped == 0
+
+
+def test_overrun_skips_missed_ticks(monkeypatch):
+    clock = FakeClock()
+    tasks = make_scheduler(monkeypatch, clock)
+    starts = run_until(tasks, clock, 5, durations={1: 0.35})
+    # Ausführung 1 endet bei 0.45, die Takte 0.2 bis 0.4 entfallen, weiter geht es im ursprünglichen Raster
+    assert starts == pytest.approx([0.0, 0.1, 0.5, 0.6, 0.7])
+    task = tasks.tasks["state"]
+    assert task.overruns == 1
+    assert task.skipped == 3
+
+
+def test_catch_up_is_limited_to_backlog(monkeypatch):
+    clock = FakeClock()
+    tasks = make_scheduler(monkeypatch, clock)
+    starts = run_until(tasks, clock, 6, durations={1: 0.35}, policy=scheduler.CATCH_UP, max_backlog=2)
+    # Von drei verpassten Takten werden nur die zwei jüngsten direkt nacheinander nachgeholt
+    assert starts == pytest.approx([0.0, 0.1, 0.45, 0.45, 0.5, 0.6])
+    assert tasks.tasks["state"].skipped == 1
+
@@ -0,0 +1,29 @@
+import os
+
+
+"""
+Gemeinsame Module liegen nur in Gemeinsam. Eine Kopie in Zentral/Library oder Dezentral/Library hätte Vorrang und
+würde unbemerkt vom Original abweichen.
+"""
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def modules(*path) -> set:
+    return {name for name in os.listdir(os.path.join(ROOT, *path)) if name.endswith(".py") and name != "__init__.py"}
+
+
+def test_shared_modules_are_not_copied():
+    shared = modules("Gemeinsam")
+    assert shared
+    for side in ("Zentral", "Dezentral"):
+        assert not shared & modules(side, "Library"), side
+
+
+def test_identical_modules_are_shared():
+    central, decentral = modules("Zentral", "Library"), modules("Dezentral", "Library")
+    for name in central & decentral:
+        with open(os.path.join(ROOT, "Zentral", "Library", name), "rb") as first, \
+                open(os.path.join(ROOT, "Dezentral", "Library", name), "rb") as second:
+            assert first.read() != second.read(), f"{name} gehört nach Gemeinsam"
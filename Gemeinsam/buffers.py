@@ -0,0 +1,161 @@
+import socket
+from . import protocol
+
+
+"""
+Empfang in vorab angelegte Puffer. Statt mit recv() je Aufruf ein neues bytes-Objekt anzulegen, wird mit recv_into bzw.
+recvfrom_into in feste bytearrays gelesen, und Frames werden als memoryview auf diese Puffer zurückgegeben. Die Views
+sind nur bis zum nächsten Empfang gültig: wer einen Frame länger behält (Warteschlangen, Verlauf), muss ihn mit
+bytes(frame) kopieren. Bei UDP werden je Aufruf alle bereitliegenden Datagramme gelesen, der erste Aufruf blockiert,
+die weiteren nicht (MSG_DONTWAIT).
+"""
+
+
+MAX_FRAME = protocol.LENGTH.size + 0xFFFF   # Größter möglicher Frame
+
+
+def split_frames(view: memoryview, frames: list, start: int = 0, end: int = None) -> int:
+    """
+    Hängt alle vollständigen Frames zwischen start und end als memoryview an frames an. Frames, die für ihren Typ zu
+    kurz sind (protocol.valid()), werden übersprungen.
+    :param view: Empfangspuffer
+    :param frames: Liste, an die die Frames angehängt werden
+    :param start: Beginn des ersten Frames
+    :param end: Ende der empfangenen Daten, standardmäßig das Ende von view
+    :return: Beginn des ersten unvollständigen Frames bzw. end
+    """
+    if end is None:
+        end = len(view)
+    length = protocol.LENGTH
+    while end - start >= length.size:
+        stop = start + length.size + length.unpack_from(view, start)[0]
+        if stop > end:
+            break
+        frame = view[start:stop]
+        if protocol.valid(frame):
+            frames.append(frame)
+        start = stop
+    return start
+
+
+class StreamReceiver:
+    """
+    Empfang eines TCP-Streams in einen festen Puffer. Ein unvollständiger Frame am Ende wird vor dem nächsten Empfang
+    an den Anfang verschoben; passt ein Frame nicht in den Puffer, wird dieser einmalig vergrößert.
+    """
+    __slots__ = ("_buffer", "_view", "_start", "_end")
+
+    def __init__(self, size: int = 4096):
+        """
+        :param size: Anfangsgröße des Puffers in Byte, bestimmt die maximale Datenmenge je Systemaufruf
+        """
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def receive(self, sock: socket.socket) -> list:
+        """
+        Liest einmal von sock und gibt alle nun vollständigen Frames zurück.
+        :param sock: Verbundener TCP-Socket
+        :return: Liste von Frames (memoryview, gültig bis zum nächsten Aufruf), None wenn die Verbindung beendet wurde
+        """
+        self._compact()
+        count = sock.recv_into(self._view[self._end:])
+        if not count:
+            # Nur bei einem Stream bedeuten 0 Byte das Ende, bei einem Datagramm-Socket ein leeres Datagramm
+            return None if sock.type == socket.SOCK_STREAM else []
+        self._end += count
+        frames = []
+        self._start = split_frames(self._view, frames, self._start, self._end)
+        return frames
+
+    def _compact(self):
+        start, end = self._start, self._end
+        if start == end:
+            self._start = self._end = 0
+            return
+        pending = end - start
+        if start:
+            # Rest eines unvollständigen Frames an den Anfang, Kopie wegen Überlappung
+            self._view[:pending] = bytes(self._view[start:end])
+            self._start, self._end = 0, pending
+        if pending >= protocol.LENGTH.size:
+            needed = protocol.LENGTH.size + protocol.LENGTH.unpack_from(self._view)[0]
+            if needed > len(self._buffer):
+                # Nicht verkleinern, damit weitere große Frames keine neue Allokation auslösen
+                buffer = bytearray(max(needed, MAX_FRAME))
+                buffer[:pending] = self._view[:pending]
+                self._buffer, self._view = buffer, memoryview(buffer)
+
+    def pending(self) -> int:
+        """
+        :return: Anzahl gepufferter Bytes eines unvollständigen Frames
+        """
+        return self._end - self._start
+
+
+class DatagramReceiver:
+    """
+    Empfang aller bereitliegenden Datagramme eines UDP-Sockets in einen Pool gleich großer Puffer, ein Puffer je
+    Datagramm. Mit einem Aufruf werden höchstens count Datagramme gelesen. Leere Datagramme sind gültig und werden mit
+    Länge 0 zurückgegeben; nur nach shutdown() liefert recvfrom 0 Byte ohne Absenderadresse, das beendet das Lesen.
+    Unix-Domain-Sockets haben auch sonst keine Absenderadresse, ihre leeren Datagramme gelten immer als Daten.
+    """
+    __slots__ = ("sock", "size", "_views")
+
+    def __init__(self, sock: socket.socket, size: int = 2048, count: int = 64):
+        """
+        :param sock: UDP-Socket, blockierend oder nicht blockierend; ein Timeout nur per SO_RCVTIMEO, da mit settimeout
+        auch die nicht blockierenden Aufrufe bis zum Timeout warten
+        :param size: Größe eines Puffers in Byte, längere Datagramme werden abgeschnitten
+        :param count: Anzahl der Puffer und damit der maximal gelesenen Datagramme je Aufruf
+        """
+        self.sock = sock
+        self.size = size
+        memory = memoryview(bytearray(size * count))
+        self._views = [memory[index * size:(index + 1) * size] for index in range(count)]
+
+    def receive(self, block: bool = True) -> list:
+        """
+        Liest alle bereitliegenden Datagramme. Fehler und Timeouts des ersten, blockierenden Aufrufs werden
+        weitergegeben.
+        :param block: True wartet auf das erste Datagramm, False kehrt ohne bereitliegende Datagramme sofort zurück
+        :return: Liste aus (Datagramm als memoryview, Absenderadresse), gültig bis zum nächsten Aufruf; mit block leer,
+        wenn der Socket geschlossen wurde
+        """
+        datagrams = []
+        views = self._views
+        flags = 0 if block else socket.MSG_DONTWAIT
+        index = 0
+        while index < len(views):
+            view = views[index]
+            try:
+                count, address = self.sock.recvfrom_into(view, 0, flags)
+            except (BlockingIOError, InterruptedError):
+                if flags == 0:
+                    raise
+                break
+            if not count and address is None and self.sock.family != socket.AF_UNIX:
+                break
+            datagrams.append((view[:count], address))
+            flags = socket.MSG_DONTWAIT
+            index += 1
+        return datagrams
+
+    def frames(self, block: bool = True) -> list:
+        """
+        Liest alle bereitliegenden Datagramme und zerlegt sie in Frames.
+        :param block: True wartet auf das erste Datagramm
+        :return: Liste aus (Frame als memoryview, Absenderadresse), gültig bis zum nächsten Aufruf, leer bei leeren
+        Datagrammen; mit block None, wenn der Socket geschlossen wurde
+        """
+        datagrams = self.receive(block)
+        if block and not datagrams:
+            return None
+        frames = []
+        for data, address in datagrams:
+            views = []
+            split_frames(data, views)
+            frames.extend((frame, address) for frame in views)
+        return frames
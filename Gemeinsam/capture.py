@@ -0,0 +1,281 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from . import protocol
+
+
+"""
+Binäre Mitschnitte (Captures) aller weitergeleiteten, gesendeten oder empfangenen Frames für die Offline-Analyse.
+
+Datendatei: Kopf (MAGIC), danach Einträge aus RECORD (Zeitstempel in ns, Fahrzeug-ID, Richtung, Länge) und dem
+unveränderten Frame. Index-Datei (<Datei>.idx): ein INDEX-Eintrag (Zeitstempel, Offset, Fahrzeug-ID) pro Eintrag der
+Datendatei, sodass der Reader ohne Parsen nach Zeit und Fahrzeug suchen kann. Beide Dateien werden nur angehängt.
+"""
+
+
+MAGIC = b"V2XCAP1\0"
+RECORD = struct.Struct("!QIBH")
+INDEX = struct.Struct("!QQI")
+
+FORWARDED = 0   # Vom Server weitergeleitet
+SENT = 1        # Vom Teilnehmer gesendet
+RECEIVED = 2    # Vom Teilnehmer empfangen
+
+CaptureRecord = namedtuple("CaptureRecord", "timestamp vehicle_id direction frame")
+
+
+def index_path(path: str) -> str:
+    """
+    :param path: Pfad der Datendatei
+    :return: Pfad der zugehörigen Index-Datei
+    """
+    return path + ".idx"
+
+
+class CaptureWriter:
+    """
+    Schreibt Frames gepuffert und threadsicher in eine Capture-Datei mit Index.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        """
+        :param path: Pfad der Datendatei, eine vorhandene Datei wird fortgesetzt
+        :param flush_interval: Maximale Zeit in Sekunden, die Einträge nur im Puffer liegen
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file and not os.path.exists(index_path(path)):
+            rebuild_index(path)
+        self._data = open(path, "ab")
+        self._index = open(index_path(path), "ab")
+        if new_file:
+            self._data.write(MAGIC)
+            self._index.truncate(0)
+        self._offset = self._data.tell()
+        self._last_flush = time.monotonic()
+        self.records = 0
+
+    def write(self, frame, direction: int, timestamp: int = None):
+        """
+        Hängt einen Frame an.
+        :param frame: Vollständiger Frame
+        :param direction: FORWARDED, SENT oder RECEIVED
+        :param timestamp: Zeitstempel in ns (time.time_ns()), standardmäßig jetzt
+        :return: None
+        """
+        with self._lock:
+            self._append(frame, direction, time.time_ns() if timestamp is None else timestamp)
+
+    def write_all(self, frames: list, direction: int):
+        """
+        Hängt mehrere Frames mit gleichem Zeitstempel an.
+        :param frames: Liste vollständiger Frames
+        :param direction: FORWARDED, SENT oder RECEIVED
+        :return: None
+        """
+        with self._lock:
+            # Zeitstempel unter Lock, damit der Index zeitlich sortiert bleibt
+            timestamp = time.time_ns()
+            for frame in frames:
+                self._append(frame, direction, timestamp)
+
+    def _append(self, frame, direction: int, timestamp: int):
+        if self._data.closed:
+            return
+        vehicle = protocol.sender_id(frame)
+        self._index.write(INDEX.pack(timestamp, self._offset, vehicle))
+        self._data.write(RECORD.pack(timestamp, vehicle, direction, len(frame)))
+        self._data.write(frame)
+        self._offset += RECORD.size + len(frame)
+        self.records += 1
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._data.flush()
+            self._index.flush()
+            self._last_flush = now
+
+    def close(self):
+        """
+        Schreibt alle gepufferten Einträge und schließt beide Dateien.
+        :return: None
+        """
+        with self._lock:
+            if not self._data.closed:
+                self._data.close()
+                self._index.close()
+
+
+class CaptureReader:
+    """
+    Liest eine Capture-Datei per mmap. Frames werden als memoryview auf die Datei zurückgegeben (ohne Kopie) und
+    müssen vor dem Schließen des Readers freigegeben oder kopiert werden.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Pfad der Datendatei
+        """
+        self.path = path
+        self._data_file = open(path, "rb")
+        self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} ist keine Capture-Datei")
+        self._view = memoryview(self._data)
+
+        if not os.path.exists(index_path(path)):
+            rebuild_index(path)
+        self._index_file = open(index_path(path), "rb")
+        if os.path.getsize(index_path(path)):
+            self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._index = b""
+        # Nur Einträge berücksichtigen, deren Daten vollständig geschrieben sind
+        self._count = len(self._index) // INDEX.size
+        while self._count and not self._complete(self._count - 1):
+            self._count -= 1
+        self._times = _IndexColumn(self._index, 0, self._count)
+
+    def _complete(self, position: int) -> bool:
+        _, offset, _ = INDEX.unpack_from(self._index, position * INDEX.size)
+        if offset + RECORD.size > len(self._data):
+            return False
+        length = RECORD.unpack_from(self._data, offset)[3]
+        return offset + RECORD.size + length <= len(self._data)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> CaptureRecord:
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError(position)
+        offset = INDEX.unpack_from(self._index, position * INDEX.size)[1]
+        timestamp, vehicle, direction, length = RECORD.unpack_from(self._data, offset)
+        start = offset + RECORD.size
+        return CaptureRecord(timestamp, vehicle, direction, self._view[start:start + length])
+
+    def __iter__(self):
+        return self.records()
+
+    def seek_time(self, timestamp: int) -> int:
+        """
+        Sucht per Binärsuche im Index den ersten Eintrag mit Zeitstempel >= timestamp.
+        :param timestamp: Zeitstempel in ns
+        :return: Position des Eintrags
+        """
+        return bisect.bisect_left(self._times, timestamp)
+
+    def records(self, start: int = None, end: int = None, vehicle: int = None, direction: int = None):
+        """
+        Iteriert über die Einträge eines Zeitbereichs, optional nur für ein Fahrzeug oder eine Richtung.
+        :param start: Erster Zeitstempel in ns (inklusive)
+        :param end: Letzter Zeitstempel in ns (exklusive)
+        :param vehicle: Fahrzeug-ID
+        :param direction: FORWARDED, SENT oder RECEIVED
+        :return: Generator über CaptureRecord
+        """
+        first = self.seek_time(start) if start is not None else 0
+        last = self.seek_time(end) if end is not None else self._count
+        for position in range(first, last):
+            if vehicle is not None and INDEX.unpack_from(self._index, position * INDEX.size)[2] != vehicle:
+                continue
+            record = self[position]
+            if direction is None or record.direction == direction:
+                yield record
+
+    def vehicles(self) -> set:
+        """
+        :return: Fahrzeug-IDs aller Einträge
+        """
+        return {INDEX.unpack_from(self._index, position * INDEX.size)[2] for position in range(self._count)}
+
+    def close(self):
+        """
+        Gibt die Speicherabbilder frei. Zurückgegebene Frames sind danach ungültig.
+        :return: None
+        """
+        if hasattr(self, "_view"):
+            self._view.release()
+        try:
+            self._data.close()
+        except BufferError:
+            # Noch referenzierte Frames, das Speicherabbild wird mit dem letzten Frame freigegeben
+            pass
+        self._data_file.close()
+        if hasattr(self, "_index_file"):
+            if isinstance(self._index, mmap.mmap):
+                self._index.close()
+            self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _IndexColumn:
+    """
+    Sequenz-Sicht auf die Zeitstempel des Index für bisect, ohne den Index in eine Liste zu kopieren.
+    """
+    __slots__ = ("_index", "_field", "_count")
+
+    def __init__(self, index, field: int, count: int):
+        self._index = index
+        self._field = field
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> int:
+        return INDEX.unpack_from(self._index, position * INDEX.size)[self._field]
+
+
+def rebuild_index(path: str):
+    """
+    Erstellt die Index-Datei durch einmaliges Lesen der Datendatei neu, z.B. wenn sie fehlt.
+    :param path: Pfad der Datendatei
+    :return: None
+    """
+    with open(path, "rb") as data_file, open(index_path(path), "wb") as index_file:
+        if os.path.getsize(path) <= len(MAGIC):
+            return
+        data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = len(MAGIC)
+        while offset + RECORD.size <= len(data):
+            timestamp, vehicle, _, length = RECORD.unpack_from(data, offset)
+            if offset + RECORD.size + length > len(data):
+                break
+            index_file.write(INDEX.pack(timestamp, offset, vehicle))
+            offset += RECORD.size + length
+        data.close()
+
+
+def paced(reader: CaptureReader, speed: float, direction: int = None):
+    """
+    Gibt die Einträge eines Mitschnitts zu ihrem (skalierten) Aufnahmezeitpunkt zurück.
+    :param reader: Geöffneter Mitschnitt
+    :param speed: Zeitfaktor (1 = Echtzeit, N = N-fach schneller, 0 = so schnell wie möglich)
+    :param direction: Nur Einträge dieser Richtung, None für alle
+    :return: Generator über CaptureRecord
+    """
+    start_capture = None
+    start_replay = time.monotonic()
+    for record in reader.records(direction=direction):
+        if start_capture is None:
+            start_capture = record.timestamp
+        if speed > 0:
+            due = start_replay + (record.timestamp - start_capture) / 1e9 / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield record
@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+from . import protocol
+
+
+"""
+Dezentrale Überlastregelung der Zustandsnachrichten nach dem Vorbild von ETSI DCC (TS 102 687, adaptiver Ansatz nach
+LIMERIC). Jedes Fahrzeug schätzt die Kanallast aus den empfangenen und gesendeten Bytes und regelt seinen Anteil an der
+Kanalzeit (duty cycle) so, dass die Last gegen target_load läuft; daraus ergibt sich die Sendefrequenz zwischen
+min_frequency und max_frequency. Alle Fahrzeuge mit derselben Regelung teilen sich den Kanal dadurch gleichmäßig.
+Abweichend von TS 102 687 schrumpft der Anteil (Faktor 1 - ALPHA) nur bei Last über target_load: bei wenigen Fahrzeugen
+läge das Gleichgewicht sonst weit unter target_load und die Frequenz würde ohne Überlast gesenkt.
+
+Die Kanallast ist der Anteil der Kanalkapazität, den alle Übertragungen belegen. Empfangen wird nur, was an das eigene
+Gerät adressiert ist; geht jede Nachricht mehrfach über das Medium (Unicast an jeden Teilnehmer, Server an jeden
+Client), werden die empfangenen Bytes mit der Anzahl dieser Kopien hochgerechnet.
+
+Unabhängig von der Frequenz wird ein Zustand wie bei CAM sofort gesendet, sobald sich Richtung, Geschwindigkeit oder
+Position seit dem zuletzt gesendeten Zustand deutlich geändert haben, höchstens jedoch mit max_frequency. Mit einem
+DeltaEncoder wird bei steigender Last zusätzlich der Abstand der Schlüsselzustände vergrößert, sodass die Nachrichten im
+Mittel kleiner werden.
+"""
+
+
+# Parameter des adaptiven Ansatzes aus ETSI TS 102 687 V1.2.1, abgestimmt auf eine Messperiode von 200 ms
+ALPHA = 0.016
+BETA = 0.0012
+GAIN_MAX = 0.0005
+GAIN_MIN = -0.00025
+
+
+class RateController:
+    """
+    Regelung der Sendefrequenz eines Fahrzeugs. received() darf von mehreren Empfangs-Threads aufgerufen werden, alle
+    anderen Methoden laufen auf dem Sende-Thread.
+    """
+
+    def __init__(self, min_frequency: float = 1.0, max_frequency: float = 20.0, capacity: float = 6e6,
+                 target_load: float = 0.68, interval: float = 0.2, overhead: int = 64, key_intervals: tuple = None,
+                 heading_threshold: float = 4.0, speed_threshold: float = 0.5, position_threshold: float = 4.0):
+        """
+        :param min_frequency: Untere Grenze der Sendefrequenz in Hz, auch bei voller Last
+        :param max_frequency: Obere Grenze der Sendefrequenz in Hz, zugleich Frequenz, mit der der Zustand geprüft wird
+        :param capacity: Kapazität des gemeinsamen Kanals in bit/s (z.B. 6e6 für ITS-G5 mit 6 Mbit/s)
+        :param target_load: Angestrebter Anteil der belegten Kanalkapazität
+        :param interval: Messperiode der Kanallast in Sekunden
+        :param overhead: Zusätzliche Bytes je Übertragung auf dem Medium (UDP/IP- und MAC-Header)
+        :param key_intervals: (kleinster, größter) Abstand der Schlüsselzustände, zwischen denen der Abstand mit der
+        Last wächst; None lässt den Abstand unverändert
+        :param heading_threshold: Richtungsänderung in Grad, ab der sofort gesendet wird
+        :param speed_threshold: Geschwindigkeitsänderung in m/s, ab der sofort gesendet wird
+        :param position_threshold: Positionsänderung in m, ab der sofort gesendet wird
+        """
+        if not 0 < min_frequency <= max_frequency:
+            raise ValueError(f"Ungültige Frequenzgrenzen: {min_frequency} bis {max_frequency} Hz")
+        if key_intervals and not 1 <= key_intervals[0] <= key_intervals[1] <= 256:
+            raise ValueError(f"Abstände der Schlüsselzustände müssen zwischen 1 und 256 liegen: {key_intervals}")
+        self.min_frequency = min_frequency
+        self.max_frequency = max_frequency
+        self.capacity = capacity
+        self.target_load = target_load
+        self.interval = interval
+        self.overhead = overhead
+        self.key_intervals = key_intervals
+        self.heading_threshold = heading_threshold
+        self.speed_threshold = speed_threshold
+        self.position_threshold = position_threshold
+        self.frequency = max_frequency
+        self.load = 0.0
+        self.duty_cycle = 0.0
+        self.message_bits = (protocol.STATE_FRAME.size + overhead) * 8
+        self.sent_messages = 0
+        self.triggered = 0
+        self._lock = threading.Lock()
+        self._received_bits = 0
+        self._sent_bits = 0
+        self._sent_count = 0
+        self._previous_load = 0.0
+        self._last_state = None
+        self._last_sent = None
+        self._last_update = time.monotonic()
+
+    def received(self, size: int, count: int = 1):
+        """
+        Zählt empfangene Nachrichten für die Schätzung der Kanallast.
+        :param size: Bytes
+        :param count: Anzahl der Nachrichten
+        :return: None
+        """
+        with self._lock:
+            self._received_bits += (size + count * self.overhead) * 8
+
+    def sent(self, size: int, count: int = 1):
+        """
+        Zählt eigene Übertragungen, bei Unicast an mehrere Teilnehmer jede Kopie.
+        :param size: Bytes je Übertragung
+        :param count: Anzahl der Übertragungen
+        :return: None
+        """
+        self._sent_bits += (size + self.overhead) * 8 * count
+        self._sent_count += count
+
+    def update(self, copies: int = 1, key_encoder: protocol.DeltaEncoder = None):
+        """
+        Schätzt die Kanallast der vergangenen Messperiode und passt Sendefrequenz und Schlüsselabstand an. Wird alle
+        interval Sekunden aufgerufen.
+        :param copies: Anzahl der Übertragungen je empfangener Nachricht auf dem Medium (z.B. Anzahl der Teilnehmer
+        bei Unicast an jeden, 1 bei Multicast und Broadcast)
+        :param key_encoder: Kodierer der eigenen Zustände, dessen Schlüsselabstand angepasst wird
+        :return: None
+        """
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        if elapsed <= 0:
+            return
+        self._last_update = now
+        with self._lock:
+            received_bits, self._received_bits = self._received_bits, 0
+        sent_bits, self._sent_bits = self._sent_bits, 0
+        sent_count, self._sent_count = self._sent_count, 0
+        if sent_count:
+            # Mittlere Größe je Kopie, berücksichtigt kleinere Differenz-Nachrichten
+            self.message_bits = sent_bits / sent_count
+
+        measured = (received_bits * max(copies, 1) + sent_bits) / (self.capacity * elapsed)
+        # Mittelwert der letzten beiden Messperioden wie CBR_G in TS 102 687
+        self.load = (measured + self._previous_load) / 2
+        self._previous_load = measured
+
+        # Anteil aus der aktuellen Frequenz, damit neue Teilnehmer (mehr Kopien) die Frequenz nicht sprunghaft senken;
+        # über die Grenzen hinaus staut sich dadurch auch nichts auf
+        airtime = self.message_bits * max(copies, 1) / self.capacity
+        duty_cycle = self.frequency * airtime
+        error = BETA * (self.target_load - self.load)
+        gain = min(error, GAIN_MAX) if error > 0 else max(error, GAIN_MIN)
+        decay = ALPHA * duty_cycle if self.load > self.target_load else 0.0
+        duty_cycle = max(0.0, duty_cycle - decay + gain)
+        self.frequency = min(self.max_frequency, max(self.min_frequency, duty_cycle / airtime))
+        self.duty_cycle = self.frequency * airtime
+
+        if key_encoder is not None and self.key_intervals:
+            smallest, largest = self.key_intervals
+            pressure = min(1.0, self.load / self.target_load) if self.target_load else 1.0
+            key_encoder.key_interval = round(smallest + (largest - smallest) * pressure)
+
+    def due(self, state: protocol.VehicleState, now: float) -> bool:
+        """
+        Entscheidet, ob ein Zustand gesendet wird: nach 1 / frequency Sekunden seit der letzten Nachricht oder sofort
+        bei deutlicher Änderung. Wird mit max_frequency aufgerufen.
+        :param state: Aktueller Zustand des Fahrzeugs
+        :param now: Zeitpunkt (time.monotonic())
+        :return: True, wenn der Zustand jetzt gesendet werden soll; der Zustand gilt dann als gesendet
+        """
+        last = self._last_state
+        if last is None:
+            send = True
+        elif now - self._last_sent >= 1 / self.frequency - 0.5 / self.max_frequency:
+            # Halbe Prüfperiode Toleranz, damit die Frequenz nicht durch Jitter des Takts auf die nächste Prüfung fällt
+            send = True
+        elif self._changed(last, state):
+            send = True
+            self.triggered += 1
+        else:
+            send = False
+        if send:
+            self._last_state = state
+            self._last_sent = now
+            self.sent_messages += 1
+        return send
+
+    def _changed(self, last: protocol.VehicleState, state: protocol.VehicleState) -> bool:
+        turn = abs((state.heading - last.heading + 180) % 360 - 180)
+        return (turn > self.heading_threshold or abs(state.speed - last.speed) > self.speed_threshold
+                or math.hypot(state.x - last.x, state.y - last.y) > self.position_threshold)
+
+    def stats(self) -> dict:
+        """
+        :return: Aktuelle Sendefrequenz, Kanallast, Anteil an der Kanalzeit, gesendete und vorzeitig gesendete Zustände
+        """
+        return {"frequency_hz": self.frequency, "load": self.load, "duty_cycle": self.duty_cycle,
+                "sent": self.sent_messages, "triggered": self.triggered}
@@ -0,0 +1,216 @@
+import math
+import threading
+import time
+import numpy as np  # Vektorisierte Abfragen über alle Fahrzeuge
+from . import protocol
+
+
+"""
+Tabelle der zuletzt empfangenen Zustände aller anderen Fahrzeuge für Anwendungen auf dem Fahrzeug. Jedes Fahrzeug
+belegt einen festen Platz (Slot) in vorab angelegten NumPy-Arrays; frei gewordene Slots abgemeldeter Fahrzeuge kommen
+in eine Freiliste und werden wiederverwendet. Abfragen wie Abstände, die k nächsten Fahrzeuge oder die Zeit bis zur
+Kollision rechnen mit einem Aufruf über alle Fahrzeuge statt in einer Python-Schleife je Fahrzeug.
+
+Richtungen sind in Grad gegen den Uhrzeigersinn ab der x-Achse angegeben, wie in read_vehicle_state.
+"""
+
+
+STATE_DTYPE = np.dtype([
+    ("vehicle_id", np.uint32),
+    ("seq", np.uint32),
+    ("timestamp", np.int64),    # Zeitstempel der Nachricht in ns
+    ("x", np.float64),
+    ("y", np.float64),
+    ("speed", np.float64),
+    ("heading", np.float64),
+    ("vx", np.float64),         # Geschwindigkeit in x-Richtung [m/s], beim Eintragen berechnet
+    ("vy", np.float64),
+    ("received", np.float64),   # Empfangszeitpunkt (time.monotonic())
+])
+
+
+class FleetTable:
+    """
+    Threadsichere Tabelle Fahrzeug-ID -> neuester Zustand. Ist die Tabelle voll, wird sie durch Verdopplung vergrößert.
+    Abfragen entfernen vorher abgelaufene Fahrzeuge, damit sie auch ohne neue Nachrichten (z.B. nach einem
+    Verbindungsabbruch) keine längst abgemeldeten Fahrzeuge liefern.
+    """
+
+    def __init__(self, capacity: int = 64, max_age: float = 2.0):
+        """
+        :param capacity: Anfängliche Anzahl der Slots, z.B. die erwartete Anzahl der Fahrzeuge
+        :param max_age: Dauer in Sekunden ohne neue Nachricht, nach der ein Fahrzeug aus der Tabelle entfernt wird
+        """
+        if capacity < 1:
+            raise ValueError(f"Kapazität muss mindestens 1 sein: {capacity}")
+        self.max_age = max_age
+        self._states = np.zeros(capacity, dtype=STATE_DTYPE)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._slots = {}
+        # Freie Slots, der kleinste liegt am Ende und wird zuerst vergeben
+        self._free = list(range(capacity - 1, -1, -1))
+        self._next_expiry = time.monotonic() + max_age
+        self._lock = threading.Lock()
+
+    def update(self, state: protocol.VehicleState, now: float = None) -> bool:
+        """
+        Trägt den neuesten Zustand eines Fahrzeugs ein. Verspätete Zustände mit älterem Zeitstempel als dem
+        eingetragenen werden ignoriert. Etwa alle max_age / 2 Sekunden werden abgelaufene Fahrzeuge entfernt.
+        :param state: Dekodierter Fahrzeugzustand
+        :param now: Empfangszeitpunkt (time.monotonic()), standardmäßig jetzt
+        :return: True, wenn der Zustand eingetragen wurde
+        """
+        if now is None:
+            now = time.monotonic()
+        heading = math.radians(state.heading)
+        with self._lock:
+            slot = self._slots.get(state.vehicle_id)
+            if slot is None:
+                slot = self._allocate(state.vehicle_id)
+            elif state.timestamp < self._states["timestamp"][slot]:
+                return False
+            self._states[slot] = (state.vehicle_id, state.seq, state.timestamp, state.x, state.y, state.speed,
+                                  state.heading, state.speed * math.cos(heading), state.speed * math.sin(heading), now)
+            if now >= self._next_expiry:
+                self._expire(now)
+        return True
+
+    def _allocate(self, vehicle_id: int) -> int:
+        if not self._free:
+            capacity = len(self._states)
+            self._states = np.concatenate((self._states, np.zeros(capacity, dtype=STATE_DTYPE)))
+            self._active = np.concatenate((self._active, np.zeros(capacity, dtype=bool)))
+            self._free = list(range(2 * capacity - 1, capacity - 1, -1))
+        slot = self._free.pop()
+        self._slots[vehicle_id] = slot
+        self._active[slot] = True
+        return slot
+
+    def remove(self, vehicle_id: int):
+        """
+        Entfernt ein Fahrzeug und gibt seinen Slot frei.
+        :param vehicle_id: Fahrzeug-ID
+        :return: None
+        """
+        with self._lock:
+            slot = self._slots.pop(vehicle_id, None)
+            if slot is not None:
+                self._active[slot] = False
+                self._free.append(slot)
+
+    def expire(self, now: float = None) -> list:
+        """
+        Entfernt alle Fahrzeuge, deren letzte Nachricht länger als max_age zurückliegt.
+        :param now: Zeitpunkt (time.monotonic()), standardmäßig jetzt
+        :return: Fahrzeug-IDs der entfernten Fahrzeuge
+        """
+        with self._lock:
+            return self._expire(time.monotonic() if now is None else now)
+
+    def _expire(self, now: float) -> list:
+        self._next_expiry = now + self.max_age / 2
+        slots = np.flatnonzero(self._active & (self._states["received"] < now - self.max_age))
+        removed = self._states["vehicle_id"][slots].tolist()
+        for vehicle_id in removed:
+            del self._slots[vehicle_id]
+        self._active[slots] = False
+        # Absteigend, damit die kleinsten Slots zuerst wiederverwendet werden
+        self._free.extend(slots[::-1].tolist())
+        return removed
+
+    def get(self, vehicle_id: int) -> protocol.VehicleState:
+        """
+        :param vehicle_id: Fahrzeug-ID
+        :return: Neuester Zustand des Fahrzeugs, None wenn es nicht in der Tabelle steht
+        """
+        with self._lock:
+            slot = self._slots.get(vehicle_id)
+            if slot is None or self._states["received"][slot] < time.monotonic() - self.max_age:
+                return None
+            row = self._states[slot].copy()
+        return protocol.VehicleState(int(row["vehicle_id"]), int(row["seq"]), int(row["timestamp"]), float(row["x"]),
+                                     float(row["y"]), float(row["speed"]), float(row["heading"]))
+
+    def snapshot(self) -> np.ndarray:
+        """
+        :return: Kopie der Zustände aller Fahrzeuge als strukturiertes Array (STATE_DTYPE)
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._states[self._active]
+
+    def _columns(self, *names) -> list:
+        with self._lock:
+            self._expire(time.monotonic())
+            slots = np.flatnonzero(self._active)
+            return [self._states[name][slots] for name in names]
+
+    def distances(self, x: float, y: float) -> (np.ndarray, np.ndarray):
+        """
+        :param x: x [m] des Bezugspunkts (z.B. eigene Position)
+        :param y: y [m] des Bezugspunkts
+        :return: Fahrzeug-IDs, Abstände [m] aller Fahrzeuge zum Bezugspunkt
+        """
+        ids, other_x, other_y = self._columns("vehicle_id", "x", "y")
+        return ids, np.hypot(other_x - x, other_y - y)
+
+    def within(self, x: float, y: float, radius: float) -> (np.ndarray, np.ndarray):
+        """
+        :param x: x [m] des Bezugspunkts
+        :param y: y [m] des Bezugspunkts
+        :param radius: Umkreis [m]
+        :return: Fahrzeug-IDs, Abstände [m] aller Fahrzeuge im Umkreis, aufsteigend nach Abstand
+        """
+        ids, distances = self.distances(x, y)
+        inside = np.flatnonzero(distances <= radius)
+        order = inside[np.argsort(distances[inside], kind="stable")]
+        return ids[order], distances[order]
+
+    def nearest(self, x: float, y: float, k: int) -> (np.ndarray, np.ndarray):
+        """
+        :param x: x [m] des Bezugspunkts
+        :param y: y [m] des Bezugspunkts
+        :param k: Anzahl der gesuchten Fahrzeuge
+        :return: Fahrzeug-IDs, Abstände [m] der höchstens k nächsten Fahrzeuge, aufsteigend nach Abstand
+        """
+        ids, distances = self.distances(x, y)
+        if k < len(distances):
+            # Teilweise Sortierung in O(n), nur die k nächsten werden vollständig sortiert
+            candidates = np.argpartition(distances, k)[:k] if k > 0 else np.empty(0, dtype=np.intp)
+        else:
+            candidates = np.arange(len(distances))
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return ids[order], distances[order]
+
+    def time_to_collision(self, x: float, y: float, speed: float, heading: float,
+                          radius: float = 2.0) -> (np.ndarray, np.ndarray):
+        """
+        Zeit, bis sich der Abstand zu jedem Fahrzeug bei gleichbleibender Geschwindigkeit und Richtung beider Fahrzeuge
+        auf radius verringert.
+        :param x: Eigene Position x [m]
+        :param y: Eigene Position y [m]
+        :param speed: Eigene Geschwindigkeit [m/s]
+        :param heading: Eigene Richtung [Grad]
+        :param radius: Abstand [m], ab dem eine Kollision angenommen wird (z.B. Summe der halben Fahrzeuglängen)
+        :return: Fahrzeug-IDs, Zeit bis zur Kollision [s]; 0 bei bereits unterschrittenem Abstand, inf wenn sich die
+        Fahrzeuge nicht auf radius nähern
+        """
+        ids, other_x, other_y, other_vx, other_vy = self._columns("vehicle_id", "x", "y", "vx", "vy")
+        heading = math.radians(heading)
+        # Relative Position und Geschwindigkeit, gesucht ist das kleinste t >= 0 mit |p + v t| = radius
+        px, py = other_x - x, other_y - y
+        vx, vy = other_vx - speed * math.cos(heading), other_vy - speed * math.sin(heading)
+        a = vx * vx + vy * vy
+        b = px * vx + py * vy
+        c = px * px + py * py - radius * radius
+        discriminant = b * b - a * c
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ttc = (-b - np.sqrt(discriminant)) / a
+        approaching = (a > 0) & (discriminant >= 0) & (b < 0)
+        ttc = np.where(approaching & (ttc >= 0), ttc, np.inf)
+        return ids, np.where(c <= 0, 0.0, ttc)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._slots)
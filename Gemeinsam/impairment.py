@@ -0,0 +1,615 @@
+import heapq
+import json
+import random
+import selectors
+import socket
+import threading
+import time
+import zlib
+
+
+"""
+Nachbildung beeinträchtigter Funkverbindungen (WLAN, Mesh) auf Loopback, damit Durchsatz und Latenz des zentralen und
+des dezentralen Betriebs unter gleichen, reproduzierbaren Kanalbedingungen verglichen werden können.
+
+Ein Szenario (Scenario) beschreibt die Bedingungen als Folge von Phasen, z.B. 10 s gutes WLAN, dann 2 s Ausfall, dann
+hohe Last. Je Phase sind Verlust, Grundlatenz, Jitter, Umordnung, Bandbreite mit begrenzter Warteschlange und zufällige
+Ausfälle (Poisson-Prozess mit exponentiell verteilter Dauer) einstellbar. Jede Verbindung und Richtung hat einen eigenen
+Kanal (Channel) mit eigenem Zufallsgenerator, dessen Startwert aus dem Startwert des Szenarios und dem Namen der
+Verbindung gebildet wird; gleiche Szenarien ergeben bei gleicher Folge von Nachrichten dieselben Verluste und
+Verzögerungen.
+
+Für den zentralen Betrieb sitzt ein Proxy (Proxy) zwischen Clients und Server: Clients verbinden sich mit dem Port des
+Proxys, der jede Verbindung (TCP) bzw. jede Absenderadresse (UDP) mit einem eigenen Socket an den Server weiterleitet.
+Im dezentralen Betrieb senden die Teilnehmer direkt an die Adressen der anderen, dort läuft jedes gesendete Datagramm
+über ein Network, das die Verbindung vom eigenen Teilnehmer zur Zieladresse nachbildet. Gruppennachrichten (Multicast,
+Broadcast) gehen dabei für alle Empfänger über denselben Kanal.
+
+Bei TCP gehen keine Daten verloren: ein Verlust oder Ausfall wird wie von TCP mit sich verdoppelnder Wartezeit (ab rto)
+wiederholt, bis eine Wiederholung durchkommt; alle folgenden Daten warten dahinter (Head-of-Line-Blocking).
+"""
+
+
+TCP = "tcp"
+UDP = "udp"
+MAX_DATAGRAM = 65536
+MAX_RETRIES = 15        # Höchstzahl der Wiederholungen einer TCP-Übertragung, danach wird sie trotzdem zugestellt
+
+# Vordefinierte Szenarien, Werte in s, kbit/s und Byte
+SCENARIOS = {
+    "ideal": {"phases": [{}]},
+    "wifi": {"phases": [{"loss": 0.01, "latency": 0.002, "jitter": 0.001, "reorder": 0.001,
+                         "bandwidth": 20000, "queue": 65536}]},
+    "wifi_congested": {"phases": [{"loss": 0.05, "latency": 0.008, "jitter": 0.006, "reorder": 0.01,
+                                   "bandwidth": 2000, "queue": 32768}]},
+    "mesh": {"phases": [{"loss": 0.03, "latency": 0.004, "jitter": 0.003, "reorder": 0.005, "bandwidth": 6000,
+                         "queue": 32768, "outage_rate": 0.1, "outage_duration": 0.3}]},
+    "outage": {"phases": [{"duration": 4.0, "loss": 0.01, "latency": 0.002, "jitter": 0.001},
+                          {"duration": 2.0, "loss": 1.0},
+                          {"loss": 0.01, "latency": 0.002, "jitter": 0.001}]},
+}
+
+
+class Conditions:
+    """
+    Kanalbedingungen einer Phase.
+    """
+    __slots__ = ("duration", "loss", "latency", "jitter", "reorder", "reorder_delay", "bandwidth", "queue",
+                 "outage_rate", "outage_duration", "rto")
+
+    def __init__(self, duration: float = None, loss: float = 0.0, latency: float = 0.0, jitter: float = 0.0,
+                 reorder: float = 0.0, reorder_delay: float = 0.01, bandwidth: float = None, queue: int = 65536,
+                 outage_rate: float = 0.0, outage_duration: float = 0.5, rto: float = 0.2):
+        """
+        :param duration: Dauer der Phase in Sekunden, None = bis zum Ende
+        :param loss: Verlustwahrscheinlichkeit je Nachricht
+        :param latency: Grundlatenz in Sekunden
+        :param jitter: Standardabweichung der Latenz in Sekunden
+        :param reorder: Wahrscheinlichkeit, mit der eine Nachricht um reorder_delay zurückgehalten und von späteren
+        Nachrichten überholt wird (nur UDP)
+        :param reorder_delay: Zusätzliche Verzögerung umgeordneter Nachrichten in Sekunden
+        :param bandwidth: Bandbreite in kbit/s, None = unbegrenzt
+        :param queue: Größe der Warteschlange vor dem Engpass in Byte, darüber werden Datagramme verworfen
+        :param outage_rate: Mittlere Anzahl der Ausfälle je Sekunde
+        :param outage_duration: Mittlere Dauer eines Ausfalls in Sekunden
+        :param rto: Wartezeit in Sekunden bis zur ersten Wiederholung verlorener TCP-Daten, verdoppelt sich danach
+        """
+        self.duration = duration
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.bandwidth = bandwidth
+        self.queue = queue
+        self.outage_rate = outage_rate
+        self.outage_duration = outage_duration
+        self.rto = rto
+
+
+class Scenario:
+    """
+    Zeitlicher Ablauf der Kanalbedingungen. Die Zeit zählt ab epoch (time.monotonic()); ohne epoch ab dem Anlegen des
+    ersten Kanals. Nach der letzten Phase gelten deren Bedingungen weiter, mit repeat beginnt der Ablauf von vorn.
+    Abweichende Abläufe einzelner Verbindungen stehen in links (Name der Verbindung -> Scenario).
+    """
+
+    def __init__(self, phases: list, seed: int = 0, repeat: bool = False, links: dict = None, name: str = None,
+                 epoch: float = None):
+        """
+        :param phases: Liste aus Conditions
+        :param seed: Startwert der Zufallsgeneratoren
+        :param repeat: True wiederholt die Phasen, alle Phasen brauchen dann eine Dauer
+        :param links: Optionale abweichende Szenarien je Verbindung, z.B. {"127.0.2.2>127.0.2.3": Scenario(...)}
+        :param name: Name für Berichte
+        :param epoch: Beginn der ersten Phase (time.monotonic()), None = beim Anlegen des ersten Kanals
+        """
+        if not phases:
+            raise ValueError("Ein Szenario braucht mindestens eine Phase")
+        if repeat and any(phase.duration is None for phase in phases):
+            raise ValueError("Wiederholte Szenarien brauchen eine Dauer je Phase")
+        self.phases = phases
+        self.seed = seed
+        self.repeat = repeat
+        self.links = links or {}
+        self.name = name
+        self.epoch = epoch
+        self._period = sum(phase.duration for phase in phases) if repeat else None
+
+    @classmethod
+    def from_dict(cls, config: dict, name: str = None) -> "Scenario":
+        """
+        :param config: Szenario als Dictionary, z.B. aus SCENARIOS oder einer JSON-Datei: {"seed": 1, "repeat": false,
+        "phases": [{"duration": 5, "loss": 0.01, ...}, ...], "links": {"<Verbindung>": {"phases": [...]}}}
+        :param name: Name für Berichte
+        :return: Scenario
+        """
+        links = {link: cls.from_dict(link_config, f"{name}[{link}]")
+                 for link, link_config in config.get("links", {}).items()}
+        return cls([Conditions(**phase) for phase in config["phases"]], config.get("seed", 0),
+                   config.get("repeat", False), links, config.get("name", name))
+
+    def conditions(self, elapsed: float) -> Conditions:
+        """
+        :param elapsed: Zeit seit Beginn des Szenarios in Sekunden
+        :return: Geltende Kanalbedingungen
+        """
+        if self._period:
+            elapsed %= self._period
+        for phase in self.phases:
+            if phase.duration is None or elapsed < phase.duration:
+                return phase
+            elapsed -= phase.duration
+        return self.phases[-1]
+
+    def channel(self, link: str) -> "Channel":
+        """
+        :param link: Name der Verbindung und Richtung, bestimmt den Startwert des Zufallsgenerators
+        :return: Neuer Kanal der Verbindung
+        """
+        if self.epoch is None:
+            self.epoch = time.monotonic()
+        scenario = self.links.get(link, self)
+        return Channel(scenario, zlib.crc32(f"{self.seed}:{link}".encode()), self.epoch)
+
+
+def load(scenario) -> Scenario:
+    """
+    :param scenario: Name aus SCENARIOS, Pfad einer JSON-Datei, Dictionary oder Scenario
+    :return: Scenario, None für None
+    """
+    if scenario is None or isinstance(scenario, Scenario):
+        return scenario
+    if isinstance(scenario, dict):
+        return Scenario.from_dict(scenario)
+    if scenario in SCENARIOS:
+        return Scenario.from_dict(SCENARIOS[scenario], scenario)
+    with open(scenario) as scenario_file:
+        return Scenario.from_dict(json.load(scenario_file), scenario)
+
+
+class Channel:
+    """
+    Eine Richtung einer Verbindung. Berechnet für jede Nachricht, ob und wann sie beim Empfänger ankommt.
+    """
+    __slots__ = ("scenario", "random", "epoch", "busy_until", "last_delivery", "outage_start", "outage_end", "sent",
+                 "lost", "queue_drops", "outage_drops", "reordered", "retransmitted")
+
+    def __init__(self, scenario: Scenario, seed: int, epoch: float):
+        self.scenario = scenario
+        self.random = random.Random(seed)
+        self.epoch = epoch
+        self.busy_until = 0.0
+        self.last_delivery = 0.0
+        self.outage_start = self.outage_end = epoch
+        self.sent = 0
+        self.lost = 0
+        self.queue_drops = 0
+        self.outage_drops = 0
+        self.reordered = 0
+        self.retransmitted = 0
+
+    def transmit(self, size: int, now: float, reliable: bool = False) -> float:
+        """
+        :param size: Größe der Nachricht in Byte
+        :param now: Sendezeitpunkt (time.monotonic())
+        :param reliable: True für TCP: Verluste und Ausfälle verzögern statt zu verwerfen, keine Umordnung
+        :return: Ankunftszeitpunkt (time.monotonic()), None wenn die Nachricht verloren geht
+        """
+        conditions = self.scenario.conditions(now - self.epoch)
+        self.sent += 1
+        ready = now
+        backoff = conditions.rto
+        for _ in range(MAX_RETRIES):
+            outage_end = self._outage(ready, conditions)
+            if outage_end is None and not (conditions.loss and self.random.random() < conditions.loss):
+                break
+            if not reliable:
+                if outage_end is not None:
+                    self.outage_drops += 1
+                else:
+                    self.lost += 1
+                return None
+            # Wiederholung nach der Wartezeit, bei einem Ausfall frühestens nach dessen Ende
+            self.retransmitted += 1
+            ready = max(ready, outage_end or ready) + backoff
+            backoff *= 2
+            conditions = self.scenario.conditions(ready - self.epoch)
+
+        # Engpass: Nachrichten werden nacheinander mit der Bandbreite übertragen
+        departure = max(ready, self.busy_until)
+        if conditions.bandwidth:
+            rate = conditions.bandwidth * 125
+            if not reliable and (departure - ready) * rate > conditions.queue:
+                self.queue_drops += 1
+                return None
+            departure += size / rate
+            self.busy_until = departure
+
+        delay = conditions.latency
+        if conditions.jitter:
+            delay = max(0.0, self.random.gauss(delay, conditions.jitter))
+        arrival = departure + delay
+        if not reliable and conditions.reorder and self.random.random() < conditions.reorder:
+            self.reordered += 1
+            return arrival + conditions.reorder_delay
+        # Ohne Umordnung überholt keine Nachricht eine frühere
+        arrival = max(arrival, self.last_delivery)
+        self.last_delivery = arrival
+        return arrival
+
+    def _outage(self, now: float, conditions: Conditions) -> float:
+        """
+        :return: Ende des laufenden Ausfalls, None ohne Ausfall
+        """
+        if not conditions.outage_rate:
+            return None
+        while now >= self.outage_end:
+            self.outage_start = self.outage_end + self.random.expovariate(conditions.outage_rate)
+            self.outage_end = self.outage_start + self.random.expovariate(1 / conditions.outage_duration)
+        return self.outage_end if now >= self.outage_start else None
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "lost": self.lost, "queue_drops": self.queue_drops,
+                "outage_drops": self.outage_drops, "reordered": self.reordered, "retransmitted": self.retransmitted}
+
+
+def merge_stats(channels) -> dict:
+    """
+    :param channels: Kanäle
+    :return: Summe der Zähler aller Kanäle
+    """
+    total = {"sent": 0, "lost": 0, "queue_drops": 0, "outage_drops": 0, "reordered": 0, "retransmitted": 0}
+    for channel in channels:
+        for key, value in channel.stats().items():
+            total[key] += value
+    return total
+
+
+class _Link:
+    """
+    Eine Verbindung des Proxys: Socket zum Client, eigener Socket zum Server und je Richtung ein Kanal.
+    """
+    __slots__ = ("client", "address", "upstream", "uplink", "downlink", "pending", "closed")
+
+    def __init__(self, client: socket.socket, address: tuple, upstream: socket.socket, uplink: Channel,
+                 downlink: Channel):
+        self.client = client
+        self.address = address
+        self.upstream = upstream
+        self.uplink = uplink
+        self.downlink = downlink
+        # Socket -> noch nicht gesendete Daten (nur TCP)
+        self.pending = {client: bytearray(), upstream: bytearray()}
+        self.closed = False
+
+
+class Proxy:
+    """
+    Beeinträchtigender Proxy für einen Server-Port auf einem eigenen Thread. Nachrichten werden beim Empfang einem
+    Kanal übergeben und zum berechneten Ankunftszeitpunkt weitergesendet.
+    """
+
+    def __init__(self, listen_address: tuple, target_address: tuple, transport: str, uplink: Scenario,
+                 downlink: Scenario = None):
+        """
+        :param listen_address: IPv4 und Port, an denen der Proxy die Clients erwartet
+        :param target_address: IPv4 und Port des Servers
+        :param transport: TCP oder UDP
+        :param uplink: Szenario der Richtung Client -> Server
+        :param downlink: Szenario der Richtung Server -> Client, standardmäßig wie uplink
+        """
+        if transport not in (TCP, UDP):
+            raise ValueError(f"Unbekanntes Transportprotokoll: {transport}")
+        self.listen_address = listen_address
+        self.target_address = target_address
+        self.transport = transport
+        self.uplink = uplink
+        self.downlink = downlink or uplink
+        self.links = {}
+        self.cpu_s = 0.0
+        self._selector = selectors.DefaultSelector()
+        self._deliveries = []
+        self._sequence = 0
+        self._running = False
+        self._thread = None
+        self._count = 0
+        if transport == TCP:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind(listen_address)
+            self._socket.listen(socket.SOMAXCONN)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.bind(listen_address)
+        self._socket.setblocking(False)
+        self._selector.register(self._socket, selectors.EVENT_READ)
+
+    def start(self) -> "Proxy":
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="impairment-proxy")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Beendet den Thread und schließt alle Sockets.
+        :return: None
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        for link in list(self.links.values()):
+            self._close(link)
+        self._selector.close()
+        self._socket.close()
+
+    def stats(self) -> dict:
+        """
+        :return: Anzahl der Verbindungen, Zähler je Richtung und CPU-Zeit des Proxy-Threads
+        """
+        links = list(self.links.values())
+        return {"links": self._count, "uplink": merge_stats(link.uplink for link in links),
+                "downlink": merge_stats(link.downlink for link in links), "cpu_s": self.cpu_s}
+
+    def _run(self):
+        try:
+            while self._running:
+                wait = 0.1
+                if self._deliveries:
+                    wait = min(wait, max(0.0, self._deliveries[0][0] - time.monotonic()))
+                for key, events in self._selector.select(wait):
+                    if key.data is None:
+                        if self.transport == TCP:
+                            self._accept()
+                        else:
+                            self._receive_datagrams()
+                    elif events & selectors.EVENT_READ:
+                        self._receive(key.data, key.fileobj)
+                    if events & selectors.EVENT_WRITE:
+                        self._flush(key.data, key.fileobj)
+                now = time.monotonic()
+                deliveries = self._deliveries
+                while deliveries and deliveries[0][0] <= now:
+                    _, _, function, args = heapq.heappop(deliveries)
+                    function(*args)
+        finally:
+            self.cpu_s = time.thread_time()
+
+    def _schedule(self, arrival: float, function, *args):
+        self._sequence += 1
+        heapq.heappush(self._deliveries, (arrival, self._sequence, function, args))
+
+    def _new_link(self, client: socket.socket, address: tuple, upstream: socket.socket) -> _Link:
+        # Kanäle nach der Reihenfolge der Verbindungen benennen, damit der Startwert nicht vom Port abhängt
+        name = f"{self.listen_address[1]}/{self._count}"
+        self._count += 1
+        link = _Link(client, address, upstream, self.uplink.channel(f"{name}>"), self.downlink.channel(f"{name}<"))
+        self.links[address] = link
+        return link
+
+    def _accept(self):
+        while True:
+            try:
+                client, address = self._socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                upstream = socket.create_connection(self.target_address)
+            except OSError:
+                client.close()
+                continue
+            link = self._new_link(client, address, upstream)
+            for sock in (client, upstream):
+                sock.setblocking(False)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._selector.register(sock, selectors.EVENT_READ, link)
+
+    def _receive_datagrams(self):
+        while True:
+            try:
+                data, address = self._socket.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            link = self.links.get(address)
+            if link is None:
+                # Eigener Socket je Client, damit der Server die Clients weiterhin unterscheidet
+                upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                upstream.connect(self.target_address)
+                upstream.setblocking(False)
+                link = self._new_link(self._socket, address, upstream)
+                self._selector.register(upstream, selectors.EVENT_READ, link)
+            arrival = link.uplink.transmit(len(data), time.monotonic())
+            if arrival is not None:
+                self._schedule(arrival, self._send_datagram, link.upstream, data, None)
+
+    def _receive(self, link: _Link, sock: socket.socket):
+        """
+        Liest alle wartenden Daten eines Sockets einer Verbindung und übergibt sie dem Kanal der Richtung.
+        """
+        if link.closed:
+            return
+        upstream = sock is link.upstream
+        channel = link.downlink if upstream else link.uplink
+        while True:
+            try:
+                data = sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b""
+                if self.transport == UDP:
+                    # z.B. ICMP "Port nicht erreichbar", solange der Server noch nicht läuft
+                    continue
+            now = time.monotonic()
+            if self.transport == UDP:
+                arrival = channel.transmit(len(data), now)
+                if arrival is not None:
+                    self._schedule(arrival, self._send_datagram, self._socket, data, link.address)
+            elif data:
+                self._schedule(channel.transmit(len(data), now, True), self._write, link,
+                               link.client if upstream else link.upstream, data)
+            else:
+                # Verbindung erst schließen, wenn alle Daten davor angekommen sind
+                self._selector.unregister(sock)
+                self._schedule(max(now, channel.last_delivery), self._close, link)
+                return
+
+    @staticmethod
+    def _send_datagram(sock: socket.socket, data: bytes, address: tuple):
+        try:
+            if address is None:
+                sock.send(data)
+            else:
+                sock.sendto(data, address)
+        except OSError:
+            pass
+
+    def _write(self, link: _Link, sock: socket.socket, data: bytes):
+        if link.closed:
+            return
+        pending = link.pending[sock]
+        pending += data
+        if len(pending) == len(data):
+            self._flush(link, sock)
+
+    def _flush(self, link: _Link, sock: socket.socket):
+        """
+        Sendet die wartenden Daten eines Sockets so weit wie ohne Blockieren möglich und meldet den Socket für
+        EVENT_WRITE an, solange Daten übrig sind.
+        """
+        if link.closed:
+            return
+        pending = link.pending[sock]
+        try:
+            sent = sock.send(pending)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._close(link)
+            return
+        del pending[:sent]
+        try:
+            events = self._selector.get_key(sock).events
+        except KeyError:
+            # Lesen bereits beendet, zum Senden neu anmelden
+            events = 0
+        wanted = (events & selectors.EVENT_READ) | (selectors.EVENT_WRITE if pending else 0)
+        if wanted != events:
+            if not events:
+                self._selector.register(sock, wanted, link)
+            elif not wanted:
+                self._selector.unregister(sock)
+            else:
+                self._selector.modify(sock, wanted, link)
+
+    def _close(self, link: _Link):
+        if link.closed:
+            return
+        link.closed = True
+        sockets = (link.upstream,) if self.transport == UDP else (link.client, link.upstream)
+        for sock in sockets:
+            try:
+                self._selector.unregister(sock)
+            except KeyError:
+                pass
+            sock.close()
+
+
+class ImpairedSocket:
+    """
+    UDP-Socket, dessen gesendete Datagramme über ein Network laufen. Alle anderen Methoden gehen an den Socket.
+    """
+    __slots__ = ("sock", "network")
+
+    def __init__(self, sock: socket.socket, network: "Network"):
+        self.sock = sock
+        self.network = network
+
+    def sendto(self, data, address: tuple) -> int:
+        self.network.send(self.sock, bytes(data), address)
+        return len(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self.sock, name)
+
+
+class Network:
+    """
+    Beeinträchtigte Verbindungen eines Teilnehmers zu allen Zieladressen, die Kanäle heißen
+    "<eigene IPv4>><Ziel-IPv4>". Ein Thread sendet die Datagramme zu ihren Ankunftszeitpunkten.
+    """
+
+    def __init__(self, scenario: Scenario, own_address: str):
+        """
+        :param scenario: Szenario aller Verbindungen
+        :param own_address: Eigene IPv4
+        """
+        self.scenario = scenario
+        self.own_address = own_address
+        self.channels = {}
+        self._deliveries = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="impairment")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wrap(self, sock: socket.socket) -> ImpairedSocket:
+        """
+        :param sock: UDP-Socket
+        :return: Socket, dessen sendto über die Kanäle dieses Netzes läuft
+        """
+        return ImpairedSocket(sock, self)
+
+    def send(self, sock: socket.socket, data: bytes, address: tuple):
+        """
+        Übergibt ein Datagramm dem Kanal zur Zieladresse.
+        :param sock: Socket, über den das Datagramm gesendet wird
+        :param data: Datagramm
+        :param address: IPv4 und Port des Ziels
+        :return: None
+        """
+        now = time.monotonic()
+        with self._condition:
+            channel = self.channels.get(address[0])
+            if channel is None:
+                channel = self.channels[address[0]] = self.scenario.channel(f"{self.own_address}>{address[0]}")
+            arrival = channel.transmit(len(data), now)
+            if arrival is None:
+                return
+            self._sequence += 1
+            heapq.heappush(self._deliveries, (arrival, self._sequence, sock, data, address))
+            if self._deliveries[0][1] == self._sequence:
+                self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        """
+        :return: Summe der Zähler aller Kanäle
+        """
+        with self._condition:
+            return merge_stats(self.channels.values())
+
+    def _run(self):
+        deliveries = self._deliveries
+        while True:
+            with self._condition:
+                while self._running and (not deliveries or deliveries[0][0] > time.monotonic()):
+                    self._condition.wait(deliveries[0][0] - time.monotonic() if deliveries else None)
+                if not self._running:
+                    return
+                _, _, sock, data, address = heapq.heappop(deliveries)
+            try:
+                sock.sendto(data, address)
+            except OSError:
+                pass
@@ -0,0 +1,345 @@
+import collections
+import logging
+import time
+from . import protocol
+
+
+"""
+Messung von Verlust und Latenz auf Empfängerseite.
+
+Jede Zustandsnachricht trägt eine Sequenznummer und einen Zeitstempel der monotonen Uhr des Absenders.
+SequenceTracker erkennt daraus je Absender Lücken (Verlust), verspätete (umsortierte) und doppelte Nachrichten.
+LatencyHistogram sammelt die Latenzen log-linear wie ein HDR-Histogramm (fester relativer Fehler, konstanter Aufwand je
+Wert). Da monotone Uhren verschiedener Geräte beliebig gegeneinander versetzt sind, schätzt ClockOffsetEstimator den
+Versatz zu einer anderen Uhr per Zeitabgleich nach NTP (MSG_TIME_REQ/MSG_TIME_RESP); verwendet wird die Messung mit der
+kürzesten Umlaufzeit, da sie am wenigsten durch Warteschlangen verfälscht ist.
+"""
+
+
+SERVER_ID = 0   # Fahrzeug-ID, unter der der Server Zeitanfragen beantwortet
+
+IN_ORDER = 0
+GAP = 1
+REORDERED = 2
+DUPLICATE = 3
+
+SEQ_MODULO = 1 << 32
+WINDOW = 64
+RESTART = 1024  # Rücksprung der Sequenznummer um mehr als RESTART gilt als Neustart des Absenders
+
+
+class _SenderSequence:
+    """
+    Sequenzzustand eines Absenders. window enthält ein Bit je bereits empfangener Nummer unterhalb von highest.
+    """
+    __slots__ = ("highest", "window", "received", "lost", "reordered", "duplicates", "restarts")
+
+    def __init__(self, seq: int):
+        self.highest = seq
+        self.window = 1
+        self.received = 1
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.restarts = 0
+
+
+class SequenceTracker:
+    """
+    Verfolgt die Sequenznummern aller Absender. Nicht threadsicher, wird nur vom Empfangs-Thread benutzt.
+    """
+
+    def __init__(self):
+        self.senders = {}
+
+    def observe(self, sender: int, seq: int) -> int:
+        """
+        Verbucht eine empfangene Sequenznummer.
+        :param sender: Fahrzeug-ID des Absenders
+        :param seq: Sequenznummer der Nachricht
+        :return: IN_ORDER, GAP, REORDERED oder DUPLICATE
+        """
+        state = self.senders.get(sender)
+        if state is None:
+            self.senders[sender] = _SenderSequence(seq)
+            return IN_ORDER
+
+        # Abstand modulo 2^32, damit ein Überlauf der Sequenznummer keine Lücke erzeugt
+        distance = (seq - state.highest) % SEQ_MODULO
+        if distance >= SEQ_MODULO // 2:
+            distance -= SEQ_MODULO
+
+        if distance > 0:
+            state.received += 1
+            state.lost += distance - 1
+            state.highest = seq
+            state.window = ((state.window << distance) | 1) & ((1 << WINDOW) - 1)
+            return IN_ORDER if distance == 1 else GAP
+
+        if distance <= -RESTART:
+            state.restarts += 1
+            state.highest = seq
+            state.window = 1
+            state.received += 1
+            return IN_ORDER
+
+        age = -distance
+        if age < WINDOW and state.window >> age & 1:
+            state.duplicates += 1
+            return DUPLICATE
+        if age < WINDOW:
+            state.window |= 1 << age
+        # Verspätete Nachricht füllt eine bereits als verloren gezählte Lücke
+        state.received += 1
+        state.reordered += 1
+        state.lost -= 1
+        return REORDERED
+
+    def totals(self) -> dict:
+        """
+        :return: Summen über alle Absender
+        """
+        totals = {"senders": len(self.senders), "received": 0, "lost": 0, "reordered": 0, "duplicates": 0}
+        for state in self.senders.values():
+            totals["received"] += state.received
+            totals["lost"] += max(0, state.lost)
+            totals["reordered"] += state.reordered
+            totals["duplicates"] += state.duplicates
+        expected = totals["received"] + totals["lost"]
+        totals["loss_ratio"] = totals["lost"] / expected if expected else 0.0
+        return totals
+
+
+class LatencyHistogram:
+    """
+    Log-lineares Histogramm (HDR) für Latenzen in ns: Werte unter 2^precision werden exakt gezählt, darüber hat jede
+    Zweierpotenz 2^(precision-1) gleich breite Buckets. Der relative Fehler ist damit höchstens 2^(1-precision).
+    """
+    __slots__ = ("precision", "counts", "count", "total", "min", "max")
+
+    def __init__(self, precision: int = 7):
+        """
+        :param precision: Anzahl signifikanter Bits, 7 entspricht einem relativen Fehler unter 1,6 %
+        """
+        self.precision = precision
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.precision
+        if shift <= 0:
+            return value
+        return (shift << self.precision) + (value >> shift)
+
+    def _highest(self, index: int) -> int:
+        shift = index >> self.precision
+        if shift == 0:
+            return index
+        mantissa = index & ((1 << self.precision) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int):
+        """
+        Verbucht einen Wert.
+        :param value: Latenz in ns, negative Werte (Ungenauigkeit des Zeitabgleichs) zählen als 0
+        :return: None
+        """
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "LatencyHistogram"):
+        """
+        Addiert ein anderes Histogramm gleicher Genauigkeit, z.B. aus einem anderen Prozess.
+        :param other: Histogramm
+        :return: None
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction: float) -> int:
+        """
+        :param fraction: Anteil, z.B. 0.99
+        :return: Größter Wert des Buckets in ns, in dem das Perzentil liegt
+        """
+        if not self.count:
+            return 0
+        target = max(1, fraction * self.count)
+        total = 0
+        for index in sorted(self.counts):
+            total += self.counts[index]
+            if total >= target:
+                return min(self._highest(index), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """
+        :return: Anzahl und Kennwerte in µs
+        """
+        return {"count": self.count,
+                "min_us": (self.min or 0) / 1e3,
+                "mean_us": self.total / self.count / 1e3 if self.count else 0.0,
+                "p50_us": self.percentile(0.5) / 1e3,
+                "p99_us": self.percentile(0.99) / 1e3,
+                "p999_us": self.percentile(0.999) / 1e3,
+                "max_us": self.max / 1e3}
+
+
+class ClockOffsetEstimator:
+    """
+    Versatz einer entfernten monotonen Uhr zur eigenen aus den letzten window Zeitabgleichen.
+    """
+    __slots__ = ("samples", "offset", "rtt", "synced")
+
+    def __init__(self, window: int = 8):
+        """
+        :param window: Anzahl der letzten Messungen, aus denen die mit kürzester Umlaufzeit gewählt wird
+        """
+        self.samples = collections.deque(maxlen=window)
+        self.offset = 0
+        self.rtt = None
+        self.synced = False
+
+    def add_sample(self, t0: int, t1: int, t2: int, t3: int) -> int:
+        """
+        Verbucht einen Zeitabgleich.
+        :param t0: Senden der Anfrage (eigene Uhr)
+        :param t1: Empfang der Anfrage (entfernte Uhr)
+        :param t2: Senden der Antwort (entfernte Uhr)
+        :param t3: Empfang der Antwort (eigene Uhr)
+        :return: Aktueller Versatz in ns (entfernte Uhr - eigene Uhr)
+        """
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt >= 0:
+            self.samples.append((rtt, ((t1 - t0) + (t2 - t3)) // 2))
+            self.rtt, self.offset = min(self.samples)
+            self.synced = True
+        return self.offset
+
+
+class Instrumentation:
+    """
+    Empfangsseitige Messung eines Geräts: Sequenzverfolgung, Latenzhistogramm und Zeitabgleich zu Server oder
+    Teilnehmern.
+    """
+
+    def __init__(self, window: int = 8, precision: int = 7):
+        """
+        :param window: Anzahl Zeitabgleiche je Gegenstelle für die Schätzung des Versatzes
+        :param precision: Signifikante Bits des Latenzhistogramms
+        """
+        self.window = window
+        self.sequences = SequenceTracker()
+        self.latency = LatencyHistogram(precision)
+        self.clocks = {}
+
+    def clock(self, remote: int) -> ClockOffsetEstimator:
+        """
+        :param remote: Fahrzeug-ID der Gegenstelle (SERVER_ID für den Server)
+        :return: Schätzer des Uhrenversatzes zur Gegenstelle
+        """
+        estimator = self.clocks.get(remote)
+        if estimator is None:
+            estimator = self.clocks[remote] = ClockOffsetEstimator(self.window)
+        return estimator
+
+    def offset(self, remote: int) -> int:
+        """
+        :param remote: Fahrzeug-ID der Gegenstelle
+        :return: Geschätzter Versatz in ns (Uhr der Gegenstelle - eigene Uhr), 0 ohne Zeitabgleich
+        """
+        estimator = self.clocks.get(remote)
+        return estimator.offset if estimator is not None else 0
+
+    def observe(self, state: protocol.VehicleState, now: int, offset: int = 0) -> int:
+        """
+        Verbucht eine empfangene Zustandsnachricht.
+        :param state: Fahrzeugzustand
+        :param now: Empfangszeitpunkt (time.monotonic_ns())
+        :param offset: Versatz der Uhr, in der state.timestamp gemessen wurde, zur eigenen Uhr
+        :return: Ergebnis der Sequenzprüfung (IN_ORDER, GAP, REORDERED oder DUPLICATE)
+        """
+        result = self.sequences.observe(state.vehicle_id, state.seq)
+        if result != DUPLICATE:
+            self.latency.record(now + offset - state.timestamp)
+        return result
+
+    def time_response(self, frame, remote: int, now: int):
+        """
+        Verbucht die Antwort auf eine eigene Zeitanfrage.
+        :param frame: Frame vom Typ MSG_TIME_RESP
+        :param remote: Fahrzeug-ID, unter der der Versatz gespeichert wird
+        :param now: Empfangszeitpunkt der Antwort (time.monotonic_ns())
+        :return: None
+        """
+        _, t0, t1, t2 = protocol.decode_time_response(frame)
+        self.clock(remote).add_sample(t0, t1, t2, now)
+
+    def summary(self) -> dict:
+        """
+        :return: Verlust, Umsortierung und Latenz über alle Absender
+        """
+        summary = self.sequences.totals()
+        summary["latency"] = self.latency.to_dict()
+        summary["clocks"] = {remote: {"offset_us": estimator.offset / 1e3,
+                                      "rtt_us": estimator.rtt / 1e3 if estimator.rtt is not None else None}
+                             for remote, estimator in self.clocks.items()}
+        return summary
+
+    def log_summary(self, logging_object: logging.Logger, budget_ms: float = None):
+        """
+        Schreibt die Zusammenfassung ins Log, als Warnung wenn p99 das Latenzbudget überschreitet.
+        :param logging_object: Logger des Geräts
+        :param budget_ms: Latenzbudget in ms, None ohne Prüfung
+        :return: None
+        """
+        summary = self.summary()
+        latency = summary["latency"]
+        message = (f"Empfang von {summary['senders']} Fahrzeugen: {summary['received']} Nachrichten, "
+                   f"{summary['lost']} verloren ({summary['loss_ratio']:.2%}), {summary['reordered']} umsortiert, "
+                   f"{summary['duplicates']} doppelt; Latenz p50 {latency['p50_us'] / 1e3:.2f} ms, "
+                   f"p99 {latency['p99_us'] / 1e3:.2f} ms, p999 {latency['p999_us'] / 1e3:.2f} ms")
+        if budget_ms is not None and latency["p99_us"] > budget_ms * 1e3:
+            logging_object.warning(message + f" (Budget {budget_ms} ms überschritten)")
+        else:
+            logging_object.info(message)
+
+
+def time_responses(frames: list, received_at: int, own_id: int = SERVER_ID) -> (list, list):
+    """
+    Trennt Zeitanfragen von den übrigen Frames und erstellt die Antworten.
+    :param frames: Empfangene Frames
+    :param received_at: Empfangszeitpunkt (time.monotonic_ns())
+    :param own_id: Fahrzeug-ID des Antwortenden
+    :return: Weiterzuleitende Frames, Antwort-Frames
+    """
+    forward = frames
+    responses = []
+    for frame in frames:
+        if protocol.message_type(frame) == protocol.MSG_TIME_REQ:
+            # Nur bei vorhandenen Zeitanfragen wird eine neue Liste erstellt
+            forward = [frame for frame in frames if protocol.message_type(frame) != protocol.MSG_TIME_REQ]
+            now = time.monotonic_ns()
+            for request in frames:
+                # Zu kurze Zeitanfragen werden ohne Antwort verworfen
+                if protocol.message_type(request) == protocol.MSG_TIME_REQ \
+                        and len(request) >= protocol.TIME_REQ_FRAME.size:
+                    _, t0 = protocol.decode_time_request(request)
+                    responses.append(protocol.encode_time_response(own_id, t0, received_at, now))
+            break
+    return forward, responses
@@ -0,0 +1,56 @@
+import socket
+import struct
+try:
+    import fcntl
+except ImportError:
+    # Ohne fcntl (z.B. Windows) werden die Adressen über psutil gelesen
+    fcntl = None
+
+
+"""
+Abfrage der IPv4-Adressen der Netzwerkschnittstellen ohne Unterprozess. Unter Linux wird die Adresse je Schnittstelle
+mit einem ioctl-Aufruf (SIOCGIFADDR) auf einem beliebigen UDP-Socket gelesen, das dauert wenige Mikrosekunden statt
+der Millisekunden für den Start von "ip addr". Je Schnittstelle wird nur die primäre IPv4 geliefert. psutil wird nur
+geladen, wenn ioctl nicht verfügbar ist.
+"""
+
+
+SIOCGIFADDR = 0x8915    # Linux: IPv4 einer Schnittstelle
+IFNAMSIZ = 16           # Maximale Länge eines Schnittstellennamens einschließlich Nullbyte
+IFREQ = struct.Struct("256s")
+
+
+def interface_address(name: str) -> str:
+    """
+    :param name: Name der Schnittstelle, z.B. "wlan0"
+    :return: Primäre IPv4 der Schnittstelle, None wenn die Schnittstelle nicht existiert oder keine IPv4 hat
+    """
+    if fcntl is None:
+        return next((address for interface, address in _psutil_addresses() if interface == name), None)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            request = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, IFREQ.pack(name.encode()[:IFNAMSIZ - 1]))
+        except OSError:
+            return None
+    # struct ifreq: Name (16 Byte), struct sockaddr_in mit Familie (2), Port (2) und Adresse (4)
+    return socket.inet_ntoa(request[IFNAMSIZ + 4:IFNAMSIZ + 8])
+
+
+def addresses() -> list:
+    """
+    :return: Liste aus (Schnittstelle, IPv4) aller Schnittstellen mit IPv4, in der Reihenfolge ihrer Indizes
+    """
+    if fcntl is None or not hasattr(socket, "if_nameindex"):
+        return _psutil_addresses()
+    found = []
+    for _, name in socket.if_nameindex():
+        address = interface_address(name)
+        if address is not None:
+            found.append((name, address))
+    return found
+
+
+def _psutil_addresses() -> list:
+    import psutil  # Nur ohne ioctl benötigt
+    return [(name, entry.address) for name, entries in psutil.net_if_addrs().items() for entry in entries
+            if entry.family == socket.AF_INET]
@@ -0,0 +1,160 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+
+"""
+Logging für die Sende- und Empfangsschleifen. Detaillierte Nachrichten laufen über eigene Kind-Logger je
+Nachrichtenklasse (z.B. "<logger>.tx", "<logger>.rx") auf Level DEBUG und kosten bei ausgeschaltetem Detail-Logging nur
+eine isEnabledFor-Abfrage. Optional schreibt ein Hintergrund-Thread die Log-Datei, sodass die Schleifen nie auf
+Datei oder Konsole warten, und ein Filter reduziert einzelne Nachrichtenklassen per Sampling oder Ratenlimit.
+"""
+
+
+TX = "tx"   # Gesendete Nachrichten
+RX = "rx"   # Empfangene Nachrichten
+
+_listeners = []
+_channels = {}
+
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Reicht den Record unformatiert an die Queue weiter, formatiert wird erst im Listener-Thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lässt je Nachrichtenklasse (letzter Teil des Logger-Namens) nur jede n-te Nachricht und höchstens eine
+    bestimmte Anzahl Nachrichten pro Sekunde durch. Nachrichten mit Level WARNING oder höher passieren immer. Die
+    Zähler sind gesperrt, da Sende- und Empfangs-Threads gleichzeitig protokollieren.
+    """
+
+    def __init__(self, sample: dict = None, max_per_second: dict = None):
+        """
+        :param sample: Nachrichtenklasse -> n, nur jede n-te Nachricht wird geschrieben
+        :param max_per_second: Nachrichtenklasse -> maximale Anzahl Nachrichten pro Sekunde
+        """
+        super().__init__()
+        self.sample = sample or {}
+        self.max_per_second = max_per_second or {}
+        self.counters = {}
+        self.windows = {}
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        message_class = record.name.rpartition(".")[2]
+        with self._lock:
+            every = self.sample.get(message_class)
+            if every and every > 1:
+                count = self.counters.get(message_class, 0)
+                self.counters[message_class] = count + 1
+                if count % every:
+                    self.suppressed += 1
+                    return False
+
+            limit = self.max_per_second.get(message_class)
+            if limit is not None:
+                second = int(time.monotonic())
+                window_start, count = self.windows.get(message_class, (second, 0))
+                if window_start != second:
+                    window_start, count = second, 0
+                if count >= limit:
+                    self.suppressed += 1
+                    return False
+                self.windows[message_class] = (window_start, count + 1)
+        return True
+
+
+def channel(logging_object: logging.Logger, message_class: str) -> logging.Logger:
+    """
+    Gibt den Kind-Logger einer Nachrichtenklasse zurück.
+    :param logging_object: Logger des Geräts
+    :param message_class: Nachrichtenklasse, z.B. TX oder RX
+    :return: Kind-Logger
+    """
+    # Zwischenspeichern, da getChild bei jedem Aufruf das globale Logging-Lock nimmt
+    key = (logging_object.name, message_class)
+    child = _channels.get(key)
+    if child is None:
+        child = _channels[key] = logging_object.getChild(message_class)
+    return child
+
+
+def configure(name: str, background: bool = False, detail: bool = True,
+              sample: dict = None, max_per_second: dict = None) -> logging.Logger:
+    """
+    Konfiguriert Datei- und Konsolenausgabe für den Logger name.
+    :param name: Name der Log-Datei und des Loggers
+    :param background: True schreibt über eine Queue in einem Hintergrund-Thread
+    :param detail: True protokolliert jede gesendete und empfangene Nachricht (Level DEBUG der Kind-Logger)
+    :param sample: Nachrichtenklasse -> n, nur jede n-te Nachricht wird geschrieben
+    :param max_per_second: Nachrichtenklasse -> maximale Anzahl Nachrichten pro Sekunde
+    :return: Logger-Objekt
+    """
+    handlers = [
+        logging.FileHandler(name),
+        logging.StreamHandler()
+    ]
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    sampling_filter = SamplingFilter(sample, max_per_second) if sample or max_per_second else None
+
+    if background:
+        # Schleifen legen nur den Record in die Queue, formatiert und geschrieben wird im Listener-Thread
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        handlers = [_RecordQueueHandler(log_queue)]
+
+    if sampling_filter:
+        for handler in handlers:
+            handler.addFilter(sampling_filter)
+
+    logging.basicConfig(handlers=handlers, level=logging.INFO)
+
+    logging_object = logging.getLogger(name)
+    level = logging.DEBUG if detail else logging.INFO
+    for message_class in (TX, RX):
+        channel(logging_object, message_class).setLevel(level)
+    return logging_object
+
+
+def stop():
+    """
+    Beendet alle Hintergrund-Listener und schreibt noch wartende Log-Einträge.
+    :return: None
+    """
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def after_fork():
+    """
+    Startet die Hintergrund-Listener in einem per fork erzeugten Prozess neu. Der Listener-Thread des Elternprozesses
+    existiert im Kindprozess nicht, ohne Neustart würden dessen Log-Einträge nur in der Queue gesammelt.
+    :return: None
+    """
+    for index, listener in enumerate(_listeners):
+        restarted = logging.handlers.QueueListener(listener.queue, *listener.handlers,
+                                                   respect_handler_level=listener.respect_handler_level)
+        restarted.start()
+        _listeners[index] = restarted
+
+
+atexit.register(stop)
+os.register_at_fork(after_in_child=after_fork)
@@ -0,0 +1,444 @@
+import collections
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+
+"""
+Laufzeitmetriken eines Geräts (Server, Client oder Teilnehmer). Die Sende- und Empfangsschleifen erhöhen nur Attribute
+vorab angelegter Zählerobjekte (Counter, PeerCounters) ohne Lock; jedes Attribut wird von genau einem Thread
+geschrieben, bei mehreren Empfangs-Threads für denselben Teilnehmer können vereinzelt Zählungen verloren gehen. Gauges
+und Quellen sind Funktionen, die erst beim Abruf einer Momentaufnahme aufgerufen werden (z.B. Warteschlangentiefen,
+Größe der Teilnehmertabelle, Scheduler-Statistik) und in den Schleifen nichts kosten.
+
+StatsServer stellt die Momentaufnahme als JSON über einen lokalen Unix-Domain-Socket bereit und schreibt sie
+periodisch als JSON-Zeile in eine Datei. Über denselben Socket lässt sich im laufenden Prozess ein Sampling-Profiler
+ein- und ausschalten, der die Stacks aller Threads in festen Abständen abtastet. Befehle (eine Zeile je Verbindung):
+
+    stats                           Momentaufnahme aller Metriken
+    profile start [Intervall ms]    Profiler starten, standardmäßig alle 10 ms
+    profile stop                    Profiler anhalten, die Auswertung bleibt erhalten
+    profile [Anzahl]                Häufigste Funktionen der Auswertung, standardmäßig 20
+
+z.B. echo "profile start 5" | socat - UNIX-CONNECT:server.stats oder metrics.query("server.stats", "stats").
+"""
+
+
+MAX_COMMAND = 256   # Maximale Länge eines Befehls in Byte
+
+
+class Counter:
+    """
+    Monoton steigender Zähler.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, count: int = 1):
+        """
+        :param count: Zuwachs
+        :return: None
+        """
+        self.value += count
+
+
+class PeerCounters:
+    """
+    Nachrichten und Bytes von und zu einer Gegenstelle (Client, Server oder Teilnehmer).
+    """
+    __slots__ = ("messages_in", "bytes_in", "messages_out", "bytes_out")
+
+    def __init__(self):
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+
+    def received(self, size: int, count: int = 1):
+        """
+        :param size: Empfangene Bytes
+        :param count: Anzahl empfangener Nachrichten
+        :return: None
+        """
+        self.messages_in += count
+        self.bytes_in += size
+
+    def sent(self, size: int, count: int = 1):
+        """
+        :param size: Gesendete Bytes
+        :param count: Anzahl gesendeter Nachrichten
+        :return: None
+        """
+        self.messages_out += count
+        self.bytes_out += size
+
+    def merge(self, other: "PeerCounters"):
+        """
+        Addiert die Zähler einer anderen Gegenstelle.
+        :param other: Zähler
+        :return: None
+        """
+        self.messages_in += other.messages_in
+        self.bytes_in += other.bytes_in
+        self.messages_out += other.messages_out
+        self.bytes_out += other.bytes_out
+
+    def to_dict(self) -> dict:
+        """
+        :return: Alle Zähler
+        """
+        return {"messages_in": self.messages_in, "bytes_in": self.bytes_in,
+                "messages_out": self.messages_out, "bytes_out": self.bytes_out}
+
+
+class Registry:
+    """
+    Sammlung aller Metriken eines Prozesses. Anlegen und Entfernen ist threadsicher, das Erhöhen der Zähler erfolgt ohne
+    Lock. Die Anzahl der Threads und die Laufzeit sind immer enthalten.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._counters = {}
+        self._gauges = {}
+        self._sources = {}
+        self._peers = {}
+        # Summe aller entfernten Gegenstellen, damit die Gesamtwerte nicht mit ihnen sinken
+        self._retired = PeerCounters()
+        self._lock = threading.Lock()
+        self.gauge("threads", threading.active_count)
+
+    def counter(self, name: str) -> Counter:
+        """
+        :param name: Name des Zählers, z.B. "tick_overruns"
+        :return: Zähler, bei erstem Aufruf neu angelegt
+        """
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, Counter())
+        return counter
+
+    def gauge(self, name: str, callback):
+        """
+        Registriert einen Messwert, der bei jeder Momentaufnahme abgefragt wird. Ein vorhandener Messwert gleichen
+        Namens wird ersetzt.
+        :param name: Name des Messwerts, z.B. "peers"
+        :param callback: Funktion ohne Argumente, die eine Zahl zurückgibt
+        :return: None
+        """
+        with self._lock:
+            self._gauges[name] = callback
+
+    def source(self, name: str, callback):
+        """
+        Registriert eine Quelle mehrerer Werte, z.B. die Statistik eines Schedulers. Eine vorhandene Quelle gleichen
+        Namens wird ersetzt.
+        :param name: Name des Abschnitts in der Momentaufnahme
+        :param callback: Funktion ohne Argumente, die ein JSON-serialisierbares Dictionary zurückgibt
+        :return: None
+        """
+        with self._lock:
+            self._sources[name] = callback
+
+    def peer(self, key) -> PeerCounters:
+        """
+        :param key: Gegenstelle, z.B. IPv4 oder (IPv4, Port)
+        :return: Zähler der Gegenstelle, bei erstem Aufruf neu angelegt
+        """
+        counters = self._peers.get(key)
+        if counters is None:
+            with self._lock:
+                counters = self._peers.setdefault(key, PeerCounters())
+        return counters
+
+    def forget_peer(self, key):
+        """
+        Entfernt die Zähler einer abgemeldeten Gegenstelle, ihre Werte bleiben in den Gesamtwerten enthalten.
+        :param key: Gegenstelle
+        :return: None
+        """
+        with self._lock:
+            counters = self._peers.pop(key, None)
+            if counters is not None:
+                self._retired.merge(counters)
+
+    def snapshot(self) -> dict:
+        """
+        Fragt alle Gauges und Quellen ab. Fehler einer Quelle werden als Text in die Momentaufnahme übernommen.
+        :return: Zähler, Messwerte, Zähler je Gegenstelle mit Gesamtwerten und ein Abschnitt je Quelle
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            sources = dict(self._sources)
+            peers = dict(self._peers)
+            totals = PeerCounters()
+            totals.merge(self._retired)
+        snapshot = {"time": time.time(), "uptime_s": time.monotonic() - self.started,
+                    "counters": {name: counter.value for name, counter in counters.items()},
+                    "gauges": {name: _call(callback) for name, callback in gauges.items()}}
+        for counters in peers.values():
+            totals.merge(counters)
+        snapshot["peers"] = {_key(key): counters.to_dict() for key, counters in peers.items()}
+        snapshot["peer_totals"] = totals.to_dict()
+        for name, callback in sources.items():
+            snapshot[name] = _call(callback)
+        return snapshot
+
+
+def _call(callback):
+    try:
+        return callback()
+    except Exception as e:
+        return f"Fehler: {e}"
+
+
+def _key(key) -> str:
+    if isinstance(key, tuple):
+        return ":".join(str(part) for part in key)
+    return str(key)
+
+
+class SamplingProfiler:
+    """
+    Sampling-Profiler für einen laufenden Prozess: ein Hintergrund-Thread liest in festen Abständen die aktuellen Stacks
+    aller anderen Threads (sys._current_frames) und zählt je Funktion, wie oft sie gerade ausgeführt wurde (eigene Zeit)
+    bzw. auf dem Stack lag (Gesamtzeit). Ohne laufende Abtastung entstehen keine Kosten. Blockierende Aufrufe in C
+    (select, recv, sleep) zählen als eigene Zeit der aufrufenden Python-Funktion.
+    """
+
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = 0
+        self.own = collections.Counter()
+        self.total = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, reset: bool = True):
+        """
+        Startet die Abtastung, ein bereits laufender Profiler übernimmt nur das neue Intervall.
+        :param interval: Abstand der Abtastungen in Sekunden
+        :param reset: True verwirft die bisherige Auswertung
+        :return: None
+        """
+        if interval <= 0:
+            raise ValueError(f"Intervall muss positiv sein: {interval}")
+        self.interval = interval
+        if self.running:
+            return
+        if reset:
+            with self._lock:
+                self.samples = 0
+                self.own.clear()
+                self.total.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Hält die Abtastung an, die Auswertung bleibt erhalten.
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = sys._current_frames()
+            with self._lock:
+                for ident, frame in stacks.items():
+                    if ident == own_thread:
+                        continue
+                    self.samples += 1
+                    self.own[_location(frame)] += 1
+                    seen = set()
+                    while frame is not None:
+                        location = _location(frame)
+                        # Rekursive Aufrufe nur einmal je Stack zählen
+                        if location not in seen:
+                            seen.add(location)
+                            self.total[location] += 1
+                        frame = frame.f_back
+
+    def report(self, limit: int = 20) -> dict:
+        """
+        :param limit: Anzahl der aufgeführten Funktionen
+        :return: Anzahl der Abtastungen und die häufigsten Funktionen nach eigener und nach Gesamtzeit in Prozent der
+        Abtastungen aller Threads
+        """
+        with self._lock:
+            samples = self.samples
+            own = self.own.most_common(limit)
+            total = self.total.most_common(limit)
+        scale = 100 / samples if samples else 0.0
+        return {"running": self.running, "interval_ms": self.interval * 1e3, "samples": samples,
+                "own": [{"function": location, "percent": count * scale} for location, count in own],
+                "total": [{"function": location, "percent": count * scale} for location, count in total]}
+
+
+def _location(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}:{code.co_name}"
+
+
+class StatsServer:
+    """
+    Stellt die Metriken eines Prozesses über einen Unix-Domain-Socket bereit und schreibt periodisch Momentaufnahmen.
+    Beides läuft auf einem Hintergrund-Thread, der zwischen den Abfragen in select wartet.
+    """
+
+    def __init__(self, registry: Registry, path: str = None, dump_path: str = None, dump_interval: float = 10.0):
+        """
+        :param registry: Metriken des Prozesses
+        :param path: Pfad des Unix-Domain-Sockets, None ohne Abfrage
+        :param dump_path: Datei, an die alle dump_interval Sekunden eine Momentaufnahme als JSON-Zeile angehängt wird,
+        None ohne Momentaufnahmen
+        :param dump_interval: Abstand der Momentaufnahmen in Sekunden
+        """
+        if dump_path and dump_interval <= 0:
+            raise ValueError(f"Intervall muss positiv sein: {dump_interval}")
+        self.registry = registry
+        self.path = path
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.profiler = SamplingProfiler()
+        self._socket = None
+        self._thread = None
+        self._stopped = False
+
+    def start(self) -> "StatsServer":
+        """
+        Bindet den Socket und startet den Hintergrund-Thread. Eine verwaiste Socket-Datei eines beendeten Prozesses wird
+        ersetzt.
+        :return: self
+        """
+        if self.path:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.bind(self.path)
+            # Nur der eigene Benutzer darf Metriken abfragen und den Profiler schalten
+            os.chmod(self.path, 0o600)
+            self._socket.listen(4)
+        self._thread = threading.Thread(target=self._run, name="stats", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Beendet den Hintergrund-Thread, schreibt eine letzte Momentaufnahme und entfernt die Socket-Datei.
+        :return: None
+        """
+        self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+        self.profiler.stop()
+        if self._socket is not None:
+            self._socket.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        if self.dump_path:
+            self.dump()
+
+    def dump(self):
+        """
+        Hängt eine Momentaufnahme als JSON-Zeile an dump_path an.
+        :return: None
+        """
+        with open(self.dump_path, "a") as dump_file:
+            dump_file.write(json.dumps(self.registry.snapshot()) + "\n")
+
+    def _run(self):
+        next_dump = time.monotonic() + self.dump_interval
+        sockets = [self._socket] if self._socket is not None else []
+        while not self._stopped:
+            # Kurzes Intervall, damit close() ohne Verbindung zurückkehrt
+            wait = 0.5
+            if self.dump_path:
+                wait = max(0.0, min(wait, next_dump - time.monotonic()))
+            readable, _, _ = select.select(sockets, [], [], wait)
+            if readable:
+                self._answer()
+            if self.dump_path and time.monotonic() >= next_dump:
+                try:
+                    self.dump()
+                except OSError:
+                    pass
+                next_dump += self.dump_interval
+                if next_dump <= time.monotonic():
+                    next_dump = time.monotonic() + self.dump_interval
+
+    def _answer(self):
+        try:
+            connection, _ = self._socket.accept()
+        except OSError:
+            return
+        with connection:
+            connection.settimeout(1.0)
+            try:
+                command = connection.recv(MAX_COMMAND).decode("ascii", "replace")
+                connection.sendall(json.dumps(self.execute(command)).encode() + b"\n")
+            except OSError:
+                pass
+
+    def execute(self, command: str) -> dict:
+        """
+        Führt einen Befehl aus (siehe Modulbeschreibung).
+        :param command: Befehl, z.B. "stats" oder "profile start 5"
+        :return: Antwort
+        """
+        words = command.split()
+        try:
+            if not words or words == ["stats"]:
+                return self.registry.snapshot()
+            if words[0] == "profile":
+                if len(words) > 1 and words[1] == "start":
+                    self.profiler.start(float(words[2]) / 1e3 if len(words) > 2 else 0.01)
+                elif len(words) > 1 and words[1] == "stop":
+                    self.profiler.stop()
+                else:
+                    return self.profiler.report(int(words[1]) if len(words) > 1 else 20)
+                return {"running": self.profiler.running, "interval_ms": self.profiler.interval * 1e3}
+        except ValueError as e:
+            return {"error": str(e)}
+        return {"error": f"Unbekannter Befehl: {command.strip()}"}
+
+
+def query(path: str, command: str = "stats", timeout: float = 5.0) -> dict:
+    """
+    Sendet einen Befehl an den StatsServer eines anderen Prozesses.
+    :param path: Pfad des Unix-Domain-Sockets
+    :param command: Befehl (siehe Modulbeschreibung)
+    :param timeout: Maximale Wartezeit in Sekunden
+    :return: Antwort
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(command.encode("ascii"))
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
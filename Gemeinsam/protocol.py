@@ -0,0 +1,482 @@
+import socket
+import struct
+from collections import namedtuple
+
+
+"""
+Binäres Nachrichtenformat für die Kommunikation zwischen Fahrzeugen, Server und Teilnehmern.
+
+Jede Nachricht (Frame) besteht aus einem 2 Byte langen Längenfeld (Anzahl der folgenden Bytes, Network Byte Order),
+gefolgt vom Nachrichtentyp (1 Byte), Flags (1 Byte) und dem Inhalt. Über TCP werden Frames hintereinander gesendet
+und mit FrameDecoder wieder getrennt, über UDP enthält ein Datagramm einen oder mehrere vollständige Frames.
+
+Zustandsnachricht (MSG_STATE), 36 Byte:
+    Länge (H) | Typ (B) | Flags (B) | Fahrzeug-ID (I) | Sequenznummer (I) | Zeitstempel in ns (Q) |
+    x in m (f) | y in m (f) | Geschwindigkeit in m/s (f) | Richtung in Grad (f)
+
+Die oberen 4 Bit der Flags einer Zustandsnachricht enthalten die verbleibende Anzahl an Weiterleitungen (TTL) im
+Mesh-Netzwerk, Fahrzeug-ID und Sequenznummer identifizieren die Nachricht beim Weiterleiten.
+
+Zeitabgleich nach NTP (MSG_TIME_REQ, 16 Byte, und MSG_TIME_RESP, 32 Byte), Zeitstempel in ns der monotonen Uhr:
+    Länge (H) | Typ (B) | Flags (B) | Fahrzeug-ID (I) | t0 Senden der Anfrage (Q)
+    Länge (H) | Typ (B) | Flags (B) | Fahrzeug-ID (I) | t0 (Q) | t1 Empfang der Anfrage (Q) | t2 Senden der Antwort (Q)
+
+Anmeldung beim Server über UDP (MSG_REGISTER, 8 Byte), wird periodisch wiederholt und hält die Anmeldung aktiv:
+    Länge (H) | Typ (B) | Flags (B) | Fahrzeug-ID (I)
+
+Wiederaufnahme einer Sitzung nach Verbindungsabbruch (MSG_RESUME, 16 Byte), der Server sendet alle gepufferten
+Zustandsnachrichten erneut, die er nach der Nachricht mit diesem Zeitstempel empfangen hat:
+    Länge (H) | Typ (B) | Flags (B) | Fahrzeug-ID (I) | Zeitstempel der zuletzt empfangenen Nachricht in ns (Q)
+
+Zustandsänderung gegenüber dem letzten Schlüsselzustand (MSG_DELTA, 18 bis 26 Byte). Alle key_interval Nachrichten
+sendet DeltaEncoder eine vollständige Zustandsnachricht (Schlüsselzustand), dazwischen nur die quantisierte Differenz
+zu diesem. Jede Differenz bezieht sich direkt auf den Schlüsselzustand, eine verlorene Differenz betrifft daher keine
+späteren. Fahrzeug-ID und Sequenznummer liegen an derselben Stelle wie in MSG_STATE:
+    Länge (H) | Typ (B) | Flags (B) | Fahrzeug-ID (I) | Sequenznummer (I) | Abstand zum Schlüsselzustand (B) |
+    Feldmaske (B) | Zeitdifferenz in µs (I) | je gesetztem Bit der Maske eine Differenz (h) für x, y, Geschwindigkeit,
+    Richtung in der Auflösung DELTA_SCALES
+
+Die Suche nach dem Server verwendet kein Frame-Format: ein Client sendet DISCOVERY_PROBE per Broadcast an den
+Discovery-Port, der Server antwortet sofort mit derselben Text-Nachricht wie in seinem periodischen Broadcast
+("<IPv4>:<Port>:<tcp|udp>").
+"""
+
+
+MSG_STATE = 1
+MSG_TIME_REQ = 2
+MSG_TIME_RESP = 3
+MSG_REGISTER = 4
+MSG_RESUME = 5
+MSG_DELTA = 6
+
+FLAG_EMERGENCY = 0x01   # Nachricht wird unabhängig von der Entfernung an alle weitergeleitet
+TTL_SHIFT = 4           # Obere 4 Bit der Flags: verbleibende Weiterleitungen
+MAX_TTL = 0x0F
+
+LENGTH = struct.Struct("!H")
+HEADER = struct.Struct("!HBB")
+STATE_FRAME = struct.Struct("!HBBIIQffff")
+TIME_REQ_FRAME = struct.Struct("!HBBIQ")
+TIME_RESP_FRAME = struct.Struct("!HBBIQQQ")
+REGISTER_FRAME = struct.Struct("!HBBI")
+RESUME_FRAME = struct.Struct("!HBBIQ")
+DELTA_FRAME = struct.Struct("!HBBIIBBI")
+DELTA_FIELD = struct.Struct("!h")
+DELTA_SCALES = (1000.0, 1000.0, 1000.0, 100.0)    # mm, mm, mm/s, 0,01 Grad
+DELTA_LIMIT = 0x7FFF
+SENDER = struct.Struct("!I")
+TIMESTAMP = struct.Struct("!Q")
+TIMESTAMP_OFFSET = HEADER.size + 8
+POSITION = struct.Struct("!ff")
+POSITION_OFFSET = HEADER.size + 16
+SEQUENCE = struct.Struct("!I")
+SEQUENCE_OFFSET = HEADER.size + 4
+DISCOVERY_PROBE = b"discover"
+DELTA_MASK_OFFSET = HEADER.size + 9
+
+# Mindestgröße je Nachrichtentyp, kürzere Frames werden beim Zerlegen verworfen
+MIN_SIZES = {MSG_STATE: STATE_FRAME.size, MSG_TIME_REQ: TIME_REQ_FRAME.size, MSG_TIME_RESP: TIME_RESP_FRAME.size,
+             MSG_REGISTER: REGISTER_FRAME.size, MSG_RESUME: RESUME_FRAME.size, MSG_DELTA: DELTA_FRAME.size}
+
+VehicleState = namedtuple("VehicleState", "vehicle_id seq timestamp x y speed heading")
+
+
+def vehicle_id(ip_address: str, suffix: int = None) -> int:
+    """
+    Bildet eine 32 Bit Fahrzeug-ID aus einer IPv4. Mit suffix (z.B. Prozess-ID) werden die unteren 16 Bit der IPv4 mit
+    den unteren 16 Bit von suffix kombiniert, damit mehrere Fahrzeuge auf einem Gerät unterscheidbar sind.
+    :param ip_address: IPv4 des Fahrzeugs
+    :param suffix: Optionale Unterscheidung mehrerer Fahrzeuge mit gleicher IPv4
+    :return: Fahrzeug-ID
+    """
+    ip_value = struct.unpack("!I", socket.inet_aton(ip_address))[0]
+    if suffix is None:
+        return ip_value
+    return ((ip_value & 0xFFFF) << 16) | (suffix & 0xFFFF)
+
+
+def encode_state(state: VehicleState, flags: int = 0, ttl: int = 0) -> bytes:
+    """
+    Kodiert einen Fahrzeugzustand als vollständigen Frame.
+    :param state: Fahrzeugzustand
+    :param flags: Flags der Nachricht
+    :param ttl: Anzahl der Weiterleitungen im Mesh-Netzwerk (0 bis MAX_TTL), 0 wird nicht weitergeleitet
+    :return: Frame
+    """
+    flags |= min(ttl, MAX_TTL) << TTL_SHIFT
+    return STATE_FRAME.pack(STATE_FRAME.size - LENGTH.size, MSG_STATE, flags, *state)
+
+
+def decode_state(frame) -> VehicleState:
+    """
+    Dekodiert einen Zustands-Frame.
+    :param frame: Vollständiger Frame (bytes, bytearray oder memoryview)
+    :return: Fahrzeugzustand
+    """
+    return VehicleState._make(STATE_FRAME.unpack_from(frame)[3:])
+
+
+def encode_time_request(own_id: int, t0: int) -> bytes:
+    """
+    Kodiert eine Anfrage zum Zeitabgleich.
+    :param own_id: Fahrzeug-ID des Anfragenden
+    :param t0: Sendezeitpunkt der Anfrage in ns (time.monotonic_ns())
+    :return: Frame
+    """
+    return TIME_REQ_FRAME.pack(TIME_REQ_FRAME.size - LENGTH.size, MSG_TIME_REQ, 0, own_id, t0)
+
+
+def decode_time_request(frame) -> (int, int):
+    """
+    :param frame: Vollständiger Frame vom Typ MSG_TIME_REQ
+    :return: Fahrzeug-ID des Anfragenden, t0
+    """
+    return TIME_REQ_FRAME.unpack_from(frame)[3:]
+
+
+def encode_time_response(own_id: int, t0: int, t1: int, t2: int) -> bytes:
+    """
+    Kodiert die Antwort auf eine Anfrage zum Zeitabgleich.
+    :param own_id: Fahrzeug-ID des Antwortenden (0 für den Server)
+    :param t0: Sendezeitpunkt der Anfrage (Uhr des Anfragenden)
+    :param t1: Empfangszeitpunkt der Anfrage (eigene Uhr)
+    :param t2: Sendezeitpunkt der Antwort (eigene Uhr)
+    :return: Frame
+    """
+    return TIME_RESP_FRAME.pack(TIME_RESP_FRAME.size - LENGTH.size, MSG_TIME_RESP, 0, own_id, t0, t1, t2)
+
+
+def decode_time_response(frame) -> (int, int, int, int):
+    """
+    :param frame: Vollständiger Frame vom Typ MSG_TIME_RESP
+    :return: Fahrzeug-ID des Antwortenden, t0, t1, t2
+    """
+    return TIME_RESP_FRAME.unpack_from(frame)[3:]
+
+
+def encode_register(own_id: int) -> bytes:
+    """
+    Kodiert eine Anmeldung beim Server.
+    :param own_id: Fahrzeug-ID des Clients
+    :return: Frame
+    """
+    return REGISTER_FRAME.pack(REGISTER_FRAME.size - LENGTH.size, MSG_REGISTER, 0, own_id)
+
+
+def encode_resume(own_id: int, since: int) -> bytes:
+    """
+    Kodiert eine Wiederaufnahme der Sitzung.
+    :param own_id: Fahrzeug-ID des Clients
+    :param since: Zeitstempel der zuletzt empfangenen Zustandsnachricht in ns (Uhr des Servers)
+    :return: Frame
+    """
+    return RESUME_FRAME.pack(RESUME_FRAME.size - LENGTH.size, MSG_RESUME, 0, own_id, since)
+
+
+def decode_resume(frame) -> (int, int):
+    """
+    Dekodiert eine Wiederaufnahme.
+    :param frame: Vollständiger Frame
+    :return: Fahrzeug-ID, Zeitstempel in ns
+    """
+    return RESUME_FRAME.unpack_from(frame)[3:]
+
+
+def valid(frame) -> bool:
+    """
+    Prüft, ob ein Frame lang genug für seinen Nachrichtentyp ist, damit kein Empfänger beim Lesen der Felder scheitert.
+    Unbekannte Typen brauchen nur den Header.
+    :param frame: Frame einschließlich Längenfeld
+    :return: True, wenn der Frame gelesen werden kann
+    """
+    size = len(frame)
+    if size < HEADER.size:
+        return False
+    frame_type = frame[2]
+    if size < MIN_SIZES.get(frame_type, HEADER.size):
+        return False
+    if frame_type == MSG_DELTA:
+        # Je gesetztem Bit der Maske folgt eine Differenz
+        fields = bin(frame[DELTA_MASK_OFFSET] & (1 << len(DELTA_SCALES)) - 1).count("1")
+        return size >= DELTA_FRAME.size + DELTA_FIELD.size * fields
+    return True
+
+
+def message_type(frame) -> int:
+    """
+    Gibt den Nachrichtentyp eines Frames zurück.
+    :param frame: Vollständiger Frame
+    :return: Nachrichtentyp
+    """
+    return frame[2]
+
+
+def is_state(frame) -> bool:
+    """
+    :param frame: Vollständiger Frame
+    :return: True für Zustandsnachrichten (MSG_STATE) und Zustandsänderungen (MSG_DELTA)
+    """
+    return frame[2] == MSG_STATE or frame[2] == MSG_DELTA
+
+
+def flags(frame) -> int:
+    """
+    Gibt die Flags eines Frames zurück.
+    :param frame: Vollständiger Frame
+    :return: Flags
+    """
+    return frame[3]
+
+
+def ttl(frame) -> int:
+    """
+    Gibt die verbleibende Anzahl an Weiterleitungen eines Frames zurück.
+    :param frame: Vollständiger Frame
+    :return: TTL
+    """
+    return frame[3] >> TTL_SHIFT
+
+
+def with_ttl(frame, value: int) -> bytes:
+    """
+    Gibt eine Kopie eines Frames mit neuer TTL zurück, die übrigen Flags bleiben erhalten.
+    :param frame: Vollständiger Frame
+    :param value: Neue TTL (0 bis MAX_TTL)
+    :return: Frame
+    """
+    buffer = bytearray(frame)
+    buffer[3] = (buffer[3] & ~(MAX_TTL << TTL_SHIFT) & 0xFF) | (min(value, MAX_TTL) << TTL_SHIFT)
+    return bytes(buffer)
+
+
+def sequence(frame) -> int:
+    """
+    Gibt die Sequenznummer eines Zustands-Frames zurück, ohne den Frame vollständig zu dekodieren.
+    :param frame: Vollständiger Frame vom Typ MSG_STATE oder MSG_DELTA
+    :return: Sequenznummer
+    """
+    return SEQUENCE.unpack_from(frame, SEQUENCE_OFFSET)[0]
+
+
+def position(frame) -> (float, float):
+    """
+    Gibt die Position eines Zustands-Frames zurück, ohne den Frame vollständig zu dekodieren.
+    :param frame: Vollständiger Frame vom Typ MSG_STATE
+    :return: x [m], y [m]
+    """
+    return POSITION.unpack_from(frame, POSITION_OFFSET)
+
+
+def with_timestamp(frame, timestamp: int) -> bytes:
+    """
+    Gibt eine Kopie eines Zustands-Frames mit neuem Zeitstempel zurück, z.B. beim Wiedereinspielen eines Mitschnitts.
+    Andere Nachrichtentypen werden unverändert kopiert.
+    :param frame: Vollständiger Frame
+    :param timestamp: Neuer Zeitstempel in ns
+    :return: Frame
+    """
+    if message_type(frame) != MSG_STATE:
+        return bytes(frame)
+    buffer = bytearray(frame)
+    TIMESTAMP.pack_into(buffer, TIMESTAMP_OFFSET, timestamp)
+    return bytes(buffer)
+
+
+def sender_id(frame) -> int:
+    """
+    Gibt die Fahrzeug-ID des Absenders zurück, ohne den Frame vollständig zu dekodieren. Alle Nachrichtentypen mit
+    Absender tragen die Fahrzeug-ID direkt nach dem Header.
+    :param frame: Vollständiger Frame
+    :return: Fahrzeug-ID, 0 wenn der Frame keine enthält
+    """
+    if len(frame) < HEADER.size + SENDER.size:
+        return 0
+    return SENDER.unpack_from(frame, HEADER.size)[0]
+
+
+def describe(frame) -> str:
+    """
+    Lesbare Darstellung eines Frames für Log-Ausgaben.
+    :param frame: Vollständiger Frame
+    :return: Beschreibung
+    """
+    if message_type(frame) == MSG_STATE and len(frame) >= STATE_FRAME.size:
+        state = decode_state(frame)
+        return (f"{state.vehicle_id:08x}: {state.seq} (x={state.x:.2f}, y={state.y:.2f}, "
+                f"v={state.speed:.2f}, h={state.heading:.1f})")
+    return f"Typ {message_type(frame)}, {len(frame)} Byte"
+
+
+def iter_frames(data):
+    """
+    Zerlegt einen vollständig empfangenen Puffer (z.B. ein UDP-Datagramm) in Frames. Ein unvollständiger Rest und Frames,
+    die für ihren Typ zu kurz sind (valid()), werden verworfen.
+    :param data: Empfangene Daten
+    :return: Generator über die Frames als bytes
+    """
+    offset = 0
+    size = len(data)
+    while size - offset >= LENGTH.size:
+        end = offset + LENGTH.size + LENGTH.unpack_from(data, offset)[0]
+        if end > size:
+            return
+        frame = bytes(data[offset:end])
+        if valid(frame):
+            yield frame
+        offset = end
+
+
+class FrameDecoder:
+    """
+    Streaming-Decoder für TCP: sammelt Teilstücke und gibt nur vollständige und gültige (valid()) Frames zurück.
+    """
+    __slots__ = ("_buffer",)
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data) -> list:
+        """
+        Fügt empfangene Daten hinzu und gibt alle nun vollständigen Frames zurück.
+        :param data: Empfangene Daten beliebiger Länge
+        :return: Liste vollständiger Frames (bytes)
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        offset = 0
+        size = len(buffer)
+        while size - offset >= LENGTH.size:
+            end = offset + LENGTH.size + LENGTH.unpack_from(buffer, offset)[0]
+            if end > size:
+                break
+            frame = bytes(buffer[offset:end])
+            if valid(frame):
+                frames.append(frame)
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+    def pending(self) -> int:
+        """
+        :return: Anzahl gepufferter Bytes eines unvollständigen Frames
+        """
+        return len(self._buffer)
+
+
+class DeltaEncoder:
+    """
+    Kodiert die Zustände eines Fahrzeugs abwechselnd als Schlüsselzustand (MSG_STATE) und als Differenz zu diesem
+    (MSG_DELTA). Ein Schlüsselzustand wird auch vorzeitig gesendet, wenn eine Differenz nicht in den Wertebereich passt.
+    """
+    __slots__ = ("key_interval", "_key", "_count")
+
+    def __init__(self, key_interval: int = 20):
+        """
+        :param key_interval: Abstand der Schlüsselzustände in Nachrichten (1 bis 256), z.B. die Sendefrequenz für einen
+        Schlüsselzustand je Sekunde; bestimmt, wie lange ein neuer oder von Verlust betroffener Empfänger warten muss
+        """
+        if not 1 <= key_interval <= 256:
+            raise ValueError(f"Abstand der Schlüsselzustände muss zwischen 1 und 256 liegen: {key_interval}")
+        self.key_interval = key_interval
+        self._key = None
+        self._count = 0
+
+    def encode(self, state: VehicleState, flags: int = 0, ttl: int = 0) -> bytes:
+        """
+        :param state: Fahrzeugzustand, Sequenznummern steigen
+        :param flags: Flags der Nachricht
+        :param ttl: Anzahl der Weiterleitungen im Mesh-Netzwerk
+        :return: Frame vom Typ MSG_STATE oder MSG_DELTA
+        """
+        if self._key is not None and self._count < self.key_interval:
+            frame = encode_delta(self._key, state, flags | min(ttl, MAX_TTL) << TTL_SHIFT)
+            if frame is not None:
+                self._count += 1
+                return frame
+        frame = encode_state(state, flags, ttl)
+        # Differenzen beziehen sich auf die übertragenen float32-Werte, wie sie der Empfänger kennt
+        self._key = decode_state(frame)
+        self._count = 1
+        return frame
+
+    def reset(self):
+        """
+        Die nächste Nachricht wird ein Schlüsselzustand, z.B. damit ein neuer Empfänger nicht bis zum nächsten regulären
+        Schlüsselzustand warten muss. Darf von einem anderen Thread als encode() aufgerufen werden.
+        :return: None
+        """
+        self._key = None
+
+
+def encode_delta(key: VehicleState, state: VehicleState, flags: int = 0) -> bytes:
+    """
+    Kodiert einen Fahrzeugzustand als Differenz zu einem Schlüsselzustand.
+    :param key: Zuletzt gesendeter Schlüsselzustand
+    :param state: Fahrzeugzustand
+    :param flags: Flags der Nachricht einschließlich TTL
+    :return: Frame, None wenn Sequenznummer, Zeitstempel oder eine Differenz nicht in den Wertebereich passen
+    """
+    distance = state.seq - key.seq
+    elapsed = (state.timestamp - key.timestamp) // 1000
+    if not 0 < distance <= 0xFF or not 0 <= elapsed <= 0xFFFFFFFF:
+        return None
+    mask = 0
+    fields = []
+    for bit, (value, key_value, scale) in enumerate(zip(state[3:], key[3:], DELTA_SCALES)):
+        difference = round((value - key_value) * scale)
+        if difference:
+            if abs(difference) > DELTA_LIMIT:
+                return None
+            mask |= 1 << bit
+            fields.append(difference)
+    size = DELTA_FRAME.size + DELTA_FIELD.size * len(fields)
+    header = DELTA_FRAME.pack(size - LENGTH.size, MSG_DELTA, flags, state.vehicle_id, state.seq, distance, mask,
+                              elapsed)
+    return header + struct.pack(f"!{len(fields)}h", *fields)
+
+
+class DeltaDecoder:
+    """
+    Empfangsseitiger Cache des letzten Schlüsselzustands je Fahrzeug. Differenzen, deren Schlüsselzustand nicht
+    vorliegt (verloren oder vor dem eigenen Start gesendet), werden bis zum nächsten Schlüsselzustand verworfen.
+    """
+    __slots__ = ("_keys", "missing")
+
+    def __init__(self):
+        self._keys = {}
+        self.missing = 0
+
+    def decode(self, frame) -> VehicleState:
+        """
+        :param frame: Vollständiger Frame vom Typ MSG_STATE oder MSG_DELTA
+        :return: Fahrzeugzustand, None wenn der Schlüsselzustand einer Differenz fehlt
+        """
+        if frame[2] == MSG_STATE:
+            state = decode_state(frame)
+            self._keys[state.vehicle_id] = state
+            return state
+        _, _, _, sender, seq, distance, mask, elapsed = DELTA_FRAME.unpack_from(frame)
+        key = self._keys.get(sender)
+        if key is None or key.seq != seq - distance:
+            self.missing += 1
+            return None
+        values = list(key[3:])
+        offset = DELTA_FRAME.size
+        for bit, scale in enumerate(DELTA_SCALES):
+            if mask & 1 << bit:
+                values[bit] += DELTA_FIELD.unpack_from(frame, offset)[0] / scale
+                offset += DELTA_FIELD.size
+        return VehicleState(sender, seq, key.timestamp + elapsed * 1000, *values)
+
+    def forget(self, sender: int):
+        """
+        Entfernt den Schlüsselzustand eines Fahrzeugs.
+        :param sender: Fahrzeug-ID
+        :return: None
+        """
+        self._keys.pop(sender, None)
+
+    def __len__(self) -> int:
+        return len(self._keys)
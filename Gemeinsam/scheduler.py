@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from . import instrumentation
+
+
+"""
+Periodische Aufgaben auf einem Thread. Jede Aufgabe hat eine eigene Periode; geplant wird mit absoluten Zeitpunkten
+der monotonen Uhr (Start + n * Periode), sodass sich die Laufzeit der Aufgaben nicht auf die Frequenz auswirkt. Je
+Aufgabe werden Verspätung beim Start (Jitter), Laufzeit und Überläufe gezählt. Ist ein Zeitpunkt bereits verstrichen,
+wenn die vorherige Ausführung endet, werden die verpassten Takte nach der Policy der Aufgabe nachgeholt (CATCH_UP) oder
+ausgelassen (SKIP).
+"""
+
+
+SKIP = "skip"           # Verpasste Takte auslassen, nächster Takt im ursprünglichen Raster
+CATCH_UP = "catch_up"   # Verpasste Takte direkt nacheinander nachholen (höchstens max_backlog)
+POLICIES = (SKIP, CATCH_UP)
+
+
+class Task:
+    """
+    Periodische Aufgabe mit Statistik.
+    """
+    __slots__ = ("name", "period", "callback", "policy", "max_backlog", "next_due", "started", "runs", "overruns",
+                 "skipped", "jitter", "max_duration", "cancelled")
+
+    def __init__(self, name: str, period: float, callback, policy: str, max_backlog: int, first_due: float):
+        self.name = name
+        self.period = period
+        self.callback = callback
+        self.policy = policy
+        self.max_backlog = max_backlog
+        self.next_due = first_due
+        self.started = None
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter = instrumentation.LatencyHistogram()
+        self.max_duration = 0.0
+        self.cancelled = False
+
+    def stats(self, now: float) -> dict:
+        """
+        :param now: Aktueller Zeitpunkt (time.monotonic())
+        :return: Soll- und Ist-Frequenz, Jitter, Laufzeit, Überläufe und ausgelassene Takte
+        """
+        elapsed = now - self.started if self.started is not None else 0.0
+        return {"rate_hz": 1 / self.period,
+                "actual_hz": self.runs / elapsed if elapsed > 0 else 0.0,
+                "runs": self.runs,
+                "overruns": self.overruns,
+                "skipped": self.skipped,
+                "jitter_p50_us": self.jitter.percentile(0.5) / 1e3,
+                "jitter_p99_us": self.jitter.percentile(0.99) / 1e3,
+                "jitter_max_us": self.jitter.max / 1e3,
+                "max_duration_us": self.max_duration * 1e6}
+
+
+class Scheduler:
+    """
+    Führt mehrere periodische Aufgaben mit unterschiedlichen Frequenzen auf dem Thread aus, der run() aufruft.
+    Aufgaben dürfen aus anderen Threads hinzugefügt, geändert und entfernt werden.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def add(self, name: str, period: float, callback, policy: str = SKIP, max_backlog: int = 10,
+            phase: float = 0.0) -> Task:
+        """
+        Plant eine periodische Aufgabe ein.
+        :param name: Eindeutiger Name, z.B. "state" oder "discovery"
+        :param period: Periode in Sekunden
+        :param callback: Funktion ohne Argumente
+        :param policy: SKIP oder CATCH_UP
+        :param max_backlog: Maximale Anzahl nachgeholter Takte bei CATCH_UP, ältere werden ausgelassen
+        :param phase: Verzögerung der ersten Ausführung in Sekunden
+        :return: Aufgabe
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unbekannte Policy: {policy}")
+        if period <= 0:
+            raise ValueError(f"Periode muss positiv sein: {period}")
+        task = Task(name, period, callback, policy, max_backlog, time.monotonic() + phase)
+        with self._lock:
+            self.tasks[name] = task
+        self._wakeup.set()
+        return task
+
+    def remove(self, name: str):
+        """
+        Entfernt eine Aufgabe.
+        :param name: Name der Aufgabe
+        :return: None
+        """
+        with self._lock:
+            task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancelled = True
+            self._wakeup.set()
+
+    def set_period(self, name: str, period: float):
+        """
+        Ändert die Periode einer Aufgabe ab ihrer nächsten Ausführung.
+        :param name: Name der Aufgabe
+        :param period: Neue Periode in Sekunden
+        :return: None
+        """
+        if period <= 0:
+            raise ValueError(f"Periode muss positiv sein: {period}")
+        with self._lock:
+            task = self.tasks[name]
+            # Nächsten Zeitpunkt vom letzten geplanten Zeitpunkt aus neu berechnen
+            task.next_due += period - task.period
+            task.period = period
+        self._wakeup.set()
+
+    def stop(self):
+        """
+        Beendet run() nach der laufenden Aufgabe.
+        :return: None
+        """
+        self._stopped = True
+        self._wakeup.set()
+
+    def run(self):
+        """
+        Führt die Aufgaben aus, bis stop() aufgerufen wird. Ausnahmen der Aufgaben werden an den Aufrufer
+        weitergegeben.
+        :return: None
+        """
+        while not self._stopped:
+            with self._lock:
+                task = min(self.tasks.values(), key=lambda entry: entry.next_due, default=None)
+            if task is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            delay = task.next_due - time.monotonic()
+            if delay > 0:
+                # Neue oder geänderte Aufgaben wecken den Scheduler vorzeitig
+                if self._wakeup.wait(delay):
+                    self._wakeup.clear()
+                    continue
+            if task.cancelled:
+                continue
+            self._run_task(task)
+
+    def _run_task(self, task: Task):
+        due = task.next_due
+        start = time.monotonic()
+        if task.started is None:
+            task.started = start
+        task.jitter.record(int((start - due) * 1e9))
+        task.callback()
+        end = time.monotonic()
+        task.runs += 1
+        task.max_duration = max(task.max_duration, end - start)
+
+        next_due = due + task.period
+        if next_due <= end:
+            task.overruns += 1
+            missed = int((end - next_due) / task.period) + 1
+            if task.policy == SKIP:
+                task.skipped += missed
+                next_due += missed * task.period
+            elif missed > task.max_backlog:
+                # Rückstand begrenzen, die ältesten Takte werden ausgelassen
+                task.skipped += missed - task.max_backlog
+                next_due += (missed - task.max_backlog) * task.period
+        task.next_due = next_due
+
+    def stats(self) -> dict:
+        """
+        :return: Name -> Statistik aller Aufgaben
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {name: task.stats(now) for name, task in self.tasks.items()}
+
+    def log_stats(self, logging_object: logging.Logger):
+        """
+        Schreibt Ist-Frequenz, Jitter und Überläufe aller Aufgaben ins Log, als Warnung bei ausgelassenen Takten.
+        :param logging_object: Logger des Geräts
+        :return: None
+        """
+        for name, stats in self.stats().items():
+            message = (f"Takt {name}: {stats['actual_hz']:.2f}/{stats['rate_hz']:.2f} Hz, Jitter p50 "
+                       f"{stats['jitter_p50_us']:.0f} µs, p99 {stats['jitter_p99_us']:.0f} µs, max "
+                       f"{stats['jitter_max_us']:.0f} µs, {stats['overruns']} Überläufe, {stats['skipped']} ausgelassen")
+            if stats["skipped"]:
+                logging_object.warning(message)
+            else:
+                logging_object.info(message)
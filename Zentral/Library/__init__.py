@@ -0,0 +1,12 @@
+import os
+
+
+"""
+Module, die der zentrale und der dezentrale Betrieb gemeinsam nutzen (z.B. Protokoll, Messung, Mitschnitt), liegen
+nur einmal im Verzeichnis Gemeinsam und werden hier als Teil dieses Pakets eingebunden: from Library import protocol
+bzw. from . import protocol lädt Gemeinsam/protocol.py. Module in diesem Verzeichnis haben Vorrang.
+"""
+
+
+__path__.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             "Gemeinsam"))
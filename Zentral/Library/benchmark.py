@@ -0,0 +1,317 @@
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import threading
+import time
+from . import impairment
+from . import instrumentation
+from . import protocol
+from . import server
+
+
+"""
+Lastgenerator und Benchmark für den Server auf Loopback. Der echte server.start läuft in einem eigenen Prozess,
+N simulierte Fahrzeuge senden als asyncio-Clients (verteilt auf mehrere Prozesse) mit F Hz. Gemessen werden
+Durchsatz, CPU-Zeit und Speicher des Servers sowie zugestellte und verlorene Nachrichten und die Latenz. Mit einem
+Szenario (siehe impairment) verbinden sich die Fahrzeuge über einen beeinträchtigenden Proxy im Benchmark-Prozess mit
+dem Server; jedes Fahrzeug hat dort je Richtung einen eigenen Kanal.
+"""
+
+
+HOST = "127.0.0.1"
+
+
+def usage() -> dict:
+    """
+    :return: Bisher verbrauchte CPU-Zeit [s] und maximaler Speicher [kB] des aktuellen Prozesses und seiner laufenden
+    Kindprozesse (z.B. Worker im Modus "multiprocess")
+    """
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = ru.ru_utime + ru.ru_stime
+    rss = ru.ru_maxrss
+    for child in multiprocessing.active_children():
+        child_cpu, child_rss = _proc_usage(child.pid)
+        cpu += child_cpu
+        rss += child_rss
+    return {"cpu_s": cpu, "max_rss_kb": rss}
+
+
+def _proc_usage(pid: int) -> (float, int):
+    """
+    Liest CPU-Zeit und aktuellen Speicher eines laufenden Prozesses aus /proc (getrusage erfasst Kindprozesse erst nach
+    deren Ende).
+    :param pid: Prozess-ID
+    :return: CPU-Zeit [s], Speicher [kB]
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rpartition(")")[2].split()
+    except OSError:
+        return 0.0, 0
+    ticks = os.sysconf("SC_CLK_TCK")
+    # Felder ab Feld 3 (state): utime ist Feld 14, stime Feld 15, rss (Seiten) Feld 24
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    return cpu, rss
+
+
+def quiet_logger(name: str) -> logging.Logger:
+    """
+    Logger für Benchmark-Prozesse, der nur Warnungen und Fehler ausgibt, damit das Logging die Messung nicht verfälscht.
+    :param name: Name des Loggers
+    :return: Logger-Objekt
+    """
+    logging_object = logging.getLogger(name)
+    logging_object.setLevel(logging.WARNING)
+    return logging_object
+
+
+class LatencyStats:
+    """
+    Zähler und Latenzhistogramm eines Lastgenerator-Prozesses.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.latency = instrumentation.LatencyHistogram()
+
+    def add(self, latency_ns: int):
+        self.received += 1
+        self.latency.record(latency_ns)
+
+    def merge(self, other: dict):
+        self.sent += other["sent"]
+        self.received += other["received"]
+        self.latency.merge(other["latency"])
+
+    def to_dict(self) -> dict:
+        return {"sent": self.sent, "received": self.received, "latency": self.latency}
+
+
+def _server_process(connection, port: int, mode: str, queue_limit: int, overflow_policy: str,
+                    batch_interval: float, worker_count: int):
+    """
+    Prozess mit dem echten Server. Beantwortet Anfragen "usage" über connection, bis "stop" empfangen wird.
+    """
+    logging_object = quiet_logger("benchmark.server")
+    server_thread = threading.Thread(
+        target=server.start,
+        args=(logging_object, port, port + 1, 3600, mode, queue_limit, overflow_policy, batch_interval),
+        kwargs={"server_ip": HOST, "broadcast_address": "127.255.255.255", "worker_count": worker_count})
+    server_thread.daemon = True
+    server_thread.start()
+    while connection.recv() == "usage":
+        connection.send(usage())
+    connection.send(usage())
+    # Worker-Prozesse beenden, os._exit überspringt das Aufräumen von multiprocessing
+    for child in multiprocessing.active_children():
+        child.terminate()
+    os._exit(0)
+
+
+async def _receive(reader: asyncio.StreamReader, stats: LatencyStats):
+    decoder = protocol.FrameDecoder()
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        now = time.monotonic_ns()
+        for frame in decoder.feed(data):
+            if protocol.message_type(frame) == protocol.MSG_STATE:
+                stats.add(now - protocol.TIMESTAMP.unpack_from(frame, protocol.TIMESTAMP_OFFSET)[0])
+
+
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    """
+    Empfang eines simulierten Fahrzeugs im Servermodus "udp".
+    """
+
+    def __init__(self, stats: LatencyStats):
+        self.stats = stats
+
+    def datagram_received(self, data: bytes, address: tuple):
+        now = time.monotonic_ns()
+        for frame in protocol.iter_frames(data):
+            if protocol.message_type(frame) == protocol.MSG_STATE:
+                self.stats.add(now - protocol.TIMESTAMP.unpack_from(frame, protocol.TIMESTAMP_OFFSET)[0])
+
+
+async def _vehicle(own_id: int, port: int, frequency: float, start_at: float, duration: float, grace: float,
+                   stats: LatencyStats, datagram: bool = False):
+    """
+    Simuliertes Fahrzeug: sendet im Messzeitraum Zustands-Frames mit frequency Hz und zählt empfangene Frames.
+    """
+    if datagram:
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _DatagramReceiver(stats), remote_addr=(HOST, port))
+        transport.sendto(protocol.encode_register(own_id))
+        send = transport.sendto
+        receive_task = None
+    else:
+        reader, transport = await asyncio.open_connection(HOST, port)
+        transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send = transport.write
+        receive_task = asyncio.ensure_future(_receive(reader, stats))
+
+    period = 1 / frequency
+    # Fahrzeuge senden versetzt innerhalb einer Periode statt alle gleichzeitig
+    phase = (own_id * 0.618034) % 1.0 * period
+    seq = 0
+    while True:
+        # Absolute Sendezeitpunkte, damit die Frequenz nicht driftet
+        due = start_at + phase + seq * period
+        if due >= start_at + duration:
+            break
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        state = protocol.VehicleState(own_id, seq, time.monotonic_ns(), 0.0, 0.0, 0.0, 0.0)
+        send(protocol.encode_state(state))
+        seq += 1
+    stats.sent += seq
+
+    await asyncio.sleep(max(0.0, start_at + duration + grace - time.monotonic()))
+    if receive_task is not None:
+        receive_task.cancel()
+    transport.close()
+
+
+async def _vehicles(ids: list, port: int, frequency: float, start_at: float, duration: float, grace: float,
+                    stats: LatencyStats, datagram: bool):
+    await asyncio.gather(*(_vehicle(own_id, port, frequency, start_at, duration, grace, stats, datagram)
+                           for own_id in ids))
+
+
+def _load_process(result_queue, ids: list, port: int, frequency: float, start_at: float, duration: float,
+                  grace: float, datagram: bool):
+    """
+    Lastgenerator-Prozess mit mehreren simulierten Fahrzeugen in einem asyncio-Event-Loop.
+    """
+    stats = LatencyStats()
+    asyncio.run(_vehicles(ids, port, frequency, start_at, duration, grace, stats, datagram))
+    result = stats.to_dict()
+    result.update(usage())
+    result_queue.put(result)
+    result_queue.close()
+    result_queue.join_thread()
+    os._exit(0)
+
+
+def run(logging_object: logging.Logger, vehicles: int, frequency: float, duration: float, mode: str = "eventloop",
+        batch_interval: float = 0, processes: int = 1, port: int = 50100, queue_limit: int = 256,
+        overflow_policy: str = "drop_oldest", setup_time: float = 2.0, grace: float = 1.0,
+        worker_count: int = None, scenario=None, proxy_port: int = None) -> dict:
+    """
+    Führt einen Benchmark-Lauf aus.
+    :param logging_object: Logger
+    :param vehicles: Anzahl simulierter Fahrzeuge
+    :param frequency: Sendefrequenz je Fahrzeug in Hz
+    :param duration: Messdauer in Sekunden
+    :param mode: Servermodus ("threaded", "eventloop", "multiprocess" oder "udp")
+    :param batch_interval: Taktdauer für gebündeltes Senden, 0 = aus
+    :param processes: Anzahl der Lastgenerator-Prozesse
+    :param port: Port des Servers
+    :param queue_limit: Maximale Anzahl wartender Nachrichten je Client
+    :param overflow_policy: Verhalten bei voller Warteschlange
+    :param setup_time: Zeit für Serverstart und Verbindungsaufbau vor der Messung
+    :param grace: Wartezeit nach der Messung für noch unterwegs befindliche Nachrichten
+    :param worker_count: Anzahl der Worker-Prozesse im Modus "multiprocess"
+    :param scenario: Kanalbedingungen (Name aus impairment.SCENARIOS, Pfad einer JSON-Datei oder impairment.Scenario),
+    None ohne Proxy; die Phasen des Szenarios beginnen mit dem Messzeitraum
+    :param proxy_port: Port des Proxys, standardmäßig port + 2
+    :return: Bericht als Dictionary
+    """
+    parent_connection, child_connection = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(
+        target=_server_process,
+        args=(child_connection, port, mode, queue_limit, overflow_policy, batch_interval, worker_count))
+    server_process.start()
+    time.sleep(0.5)
+
+    start_at = time.monotonic() + setup_time
+    scenario = impairment.load(scenario)
+    proxy = None
+    load_port = port
+    if scenario is not None:
+        scenario.epoch = start_at
+        load_port = proxy_port or port + 2
+        proxy = impairment.Proxy((HOST, load_port), (HOST, port), impairment.UDP if mode == "udp" else impairment.TCP,
+                                 scenario).start()
+    result_queue = multiprocessing.Queue()
+    ids = list(range(1, vehicles + 1))
+    load_processes = []
+    for index in range(processes):
+        process = multiprocessing.Process(
+            target=_load_process,
+            args=(result_queue, ids[index::processes], load_port, frequency, start_at, duration, grace,
+                  mode == "udp"))
+        process.start()
+        load_processes.append(process)
+
+    time.sleep(max(0.0, start_at - time.monotonic()))
+    parent_connection.send("usage")
+    server_before = parent_connection.recv()
+    time.sleep(max(0.0, start_at + duration + grace - time.monotonic()))
+    parent_connection.send("stop")
+    server_after = parent_connection.recv()
+    server_process.join()
+
+    stats = LatencyStats()
+    load_cpu = 0.0
+    for _ in load_processes:
+        result = result_queue.get()
+        stats.merge(result)
+        load_cpu += result["cpu_s"]
+    for process in load_processes:
+        process.join()
+    if proxy is not None:
+        proxy.close()
+
+    expected = stats.sent * (vehicles - 1)
+    server_cpu = server_after["cpu_s"] - server_before["cpu_s"]
+    report = {
+        "topology": "zentral",
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "mode": mode,
+        "batch_interval": batch_interval,
+        "worker_count": worker_count,
+        "vehicles": vehicles,
+        "frequency": frequency,
+        "duration": duration,
+        "processes": processes,
+        "scenario": scenario.name if scenario is not None else None,
+        "sent": stats.sent,
+        "expected": expected,
+        "delivered": stats.received,
+        "lost": max(0, expected - stats.received),
+        "loss_ratio": (expected - stats.received) / expected if expected else 0.0,
+        "throughput_msgs_per_s": stats.received / duration,
+        "server_cpu_s": server_cpu,
+        "server_cpu_us_per_msg": server_cpu / stats.received * 1e6 if stats.received else None,
+        "server_max_rss_kb": server_after["max_rss_kb"],
+        "load_cpu_s": load_cpu,
+        "latency": stats.latency.to_dict(),
+    }
+    if proxy is not None:
+        report["impairment"] = proxy.stats()
+    logging_object.info(f"Benchmark {mode} (batch {batch_interval}): {vehicles} Fahrzeuge, "
+                        f"{report['throughput_msgs_per_s']:.0f} Nachrichten/s, Verlust {report['loss_ratio']:.2%}, "
+                        f"Server-CPU {server_cpu:.2f} s, Szenario {report['scenario']}")
+    return report
+
+
+def write_report(report: dict, path: str):
+    """
+    Hängt einen Bericht als JSON-Zeile an eine Datei an, damit Läufe über die Zeit verglichen werden können.
+    :param report: Bericht aus run()
+    :param path: Pfad der Berichtsdatei (JSON Lines)
+    :return: None
+    """
+    with open(path, "a") as report_file:
+        report_file.write(json.dumps(report) + "\n")
@@ -1,67 +1,274 @@
+import select
 import socket
 import threading
 import time
 import logging
 import os
+import math
+import random
+import struct
+from . import buffers
+from . import congestion
+from . import instrumentation
+from . import log_pipeline
+from . import metrics
+from . import protocol
+from . import scheduler
 
 
 """*****************************************************************************************************************"""
 
 
-def send_data(logging_object: logging.Logger, client_socket: socket.socket, frequency: int):
+class Session:
     """
-    Sendet Daten an Server mit gegebener Frequenz.
+    Zustand eines Clients, der über Verbindungsabbrüche hinweg erhalten bleibt.
+    """
+    __slots__ = ("seq", "ticks", "last_received", "reconnects")
+
+    def __init__(self):
+        self.seq = 0                # Nächste eigene Sequenznummer, läuft nach Wiederverbindung weiter
+        self.ticks = 0              # Anzahl der Prüfungen des eigenen Zustands, ohne Überlastregelung gleich seq
+        self.last_received = None   # Zeitstempel in ns der zuletzt empfangenen vollständigen Zustandsnachricht
+        self.reconnects = 0
+
+
+def read_vehicle_state(own_id: int, counter: int, frequency: int) -> (float, float, float, float):
+    """
+    Liefert den aktuellen Zustand des Fahrzeugs. Hier Pseudodaten: Kreisfahrt mit 10 m/s auf einem Kreis mit 50 m
+    Radius, Startwinkel abhängig von der Fahrzeug-ID.
+    :param own_id: Fahrzeug-ID des Clients
+    :param counter: Nummer der Nachricht
+    :param frequency: Frequenz für Nachrichtenübertragung in Hz
+    :return: x [m], y [m], Geschwindigkeit [m/s], Richtung [Grad]
+    """
+    speed = 10.0
+    radius = 50.0
+    angle = math.radians(own_id % 360) + counter / frequency * speed / radius
+    return radius * math.cos(angle), radius * math.sin(angle), speed, math.degrees(angle + math.pi / 2) % 360
+
+
+def send_data(logging_object: logging.Logger, client_socket: socket.socket, frequency: int, own_id: int,
+              monitor: instrumentation.Instrumentation = None, sync_interval: float = 1.0,
+              stats_interval: float = 60.0, keepalive: float = None, session: Session = None,
+              key_interval: int = None, counters: metrics.PeerCounters = None, registry: metrics.Registry = None,
+              controller: congestion.RateController = None):
+    """
+    Sendet Daten an Server mit gegebener Frequenz. Zustandsnachrichten, Zeitanfragen und Anmeldungen werden von einem
+    Scheduler mit festen Zeitpunkten auf diesem Thread gesendet.
     :param logging_object: Logger des Clients
     :param client_socket: Verbindung zwischen Server und Client
     :param frequency: Frequenz für Nachrichtenübertragung in Hz
+    :param own_id: Fahrzeug-ID des Clients
+    :param monitor: Messung des Clients; mit monitor werden Zeitanfragen an den Server gesendet und die Zeitstempel in
+    der Uhr des Servers angegeben, sodass Empfänger auf anderen Geräten die Latenz berechnen können
+    :param sync_interval: Abstand der Zeitanfragen in Sekunden
+    :param stats_interval: Abstand in Sekunden, in dem Ist-Frequenz, Jitter und Überläufe ins Log geschrieben werden
+    :param keepalive: Abstand in Sekunden, in dem die Anmeldung beim Server wiederholt wird (UDP), None ohne Anmeldung
+    :param session: Sitzung des Clients, die Sequenznummer wird dort fortgeschrieben
+    :param key_interval: Mit key_interval wird nur jeder key_interval-te Zustand vollständig gesendet, dazwischen die
+    Differenz zu diesem (protocol.MSG_DELTA); None sendet jeden Zustand vollständig
+    :param counters: Zähler gesendeter Nachrichten und Bytes an den Server
+    :param registry: Metriken des Clients, erhält die Statistik des Schedulers (Abschnitt "scheduler")
+    :param controller: Optionale Überlastregelung; der Zustand wird dann mit deren max_frequency geprüft und nur mit
+    der geregelten Frequenz oder bei deutlicher Änderung gesendet, frequency wird nicht verwendet
     :return: None
     """
-    # Sendet Daten mit einem Zähler an den Server
-    name = client_socket.getsockname()
-    counter = 0
-    period_duration = 1 / frequency
+    # Sendet den Fahrzeugzustand mit Sequenznummer und Zeitstempel an den Server
+    tx_log = log_pipeline.channel(logging_object, log_pipeline.TX)
+    if session is None:
+        session = Session()
+    # Jede Verbindung beginnt mit einem Schlüsselzustand
+    encoder = protocol.DeltaEncoder(key_interval) if key_interval else None
+    if counters is None:
+        counters = metrics.PeerCounters()
+    if controller is not None:
+        frequency = controller.max_frequency
+
+    def send_state():
+        counter = session.seq
+        offset = monitor.offset(instrumentation.SERVER_ID) if monitor is not None else 0
+        x, y, speed, heading = read_vehicle_state(own_id, session.ticks, frequency)
+        session.ticks += 1
+        state = protocol.VehicleState(own_id, counter, time.monotonic_ns() + offset, x, y, speed, heading)
+        if controller is not None and not controller.due(state, time.monotonic()):
+            return
+        message = encoder.encode(state) if encoder is not None else protocol.encode_state(state)
+        client_socket.sendall(message)
+        counters.sent(len(message))
+        if controller is not None:
+            controller.sent(len(message))
+        tx_log.debug("Nachricht gesendet an Server: %s", state)
+        session.seq = counter + 1
+
+    def send_time_request():
+        request = protocol.encode_time_request(own_id, time.monotonic_ns())
+        client_socket.sendall(request)
+        counters.sent(len(request))
+
+    def send_register():
+        register = protocol.encode_register(own_id)
+        client_socket.sendall(register)
+        counters.sent(len(register))
+
+    schedule = scheduler.Scheduler()
+    if keepalive is not None:
+        schedule.add("register", keepalive, send_register)
+    schedule.add("state", 1 / frequency, send_state)
+    if monitor is not None:
+        schedule.add("sync", sync_interval, send_time_request)
+    if controller is not None:
+        # Der Server sendet jede Nachricht einzeln an jeden Client, dazu kommt die Übertragung zum Server
+        schedule.add("dcc", controller.interval,
+                     lambda: controller.update(len(monitor.sequences.senders) + 1 if monitor is not None else 1,
+                                               encoder))
+    schedule.add("stats", stats_interval, lambda: log_stats(logging_object, schedule, controller), phase=stats_interval)
+    if registry is not None:
+        # Ersetzt den Scheduler der vorherigen Verbindung
+        registry.source("scheduler", schedule.stats)
+        if controller is not None:
+            registry.source("congestion", controller.stats)
     try:
-        while True:
-            message = f"{name}: {str(counter)}"
-            client_socket.sendall(message.encode())
-            logging_object.info(f"Nachricht gesendet an Server: {message}")
-            counter += 1
-            time.sleep(period_duration)
+        schedule.run()
     except KeyboardInterrupt:
         logging_object.info("Übertragung manuell abgebrochen.")
     except Exception as e:
         logging_object.info(f"Error: {e}")
+    log_stats(logging_object, schedule, controller)
+    # Empfangs-Thread wecken, damit beide Threads die Verbindung aufgeben
+    shutdown(client_socket)
+
+
+def log_stats(logging_object: logging.Logger, schedule: scheduler.Scheduler,
+              controller: congestion.RateController = None):
+    """
+    Schreibt die Statistik des Sende-Threads ins Log.
+    :param logging_object: Logger des Clients
+    :param schedule: Scheduler des Sende-Threads
+    :param controller: Optionale Überlastregelung
+    :return: None
+    """
+    schedule.log_stats(logging_object)
+    if controller is not None:
+        stats = controller.stats()
+        logging_object.info(f"Überlastregelung: {stats['frequency_hz']:.1f} Hz, Kanallast {stats['load']:.0%}, "
+                            f"{stats['sent']} Zustände gesendet, davon {stats['triggered']} vorzeitig")
 
 
-def receive_data(logging_object: logging.Logger, client_socket: socket.socket):
+def receive_data(logging_object: logging.Logger, client_socket: socket.socket,
+                 monitor: instrumentation.Instrumentation = None, report_interval: float = 10.0,
+                 latency_budget: float = None, datagram: bool = False, session: Session = None, fleet_table=None,
+                 counters: metrics.PeerCounters = None, controller: congestion.RateController = None):
     """
-    Empfängt Nachrichten des Servers und damit indirekt von anderen Clients.
+    Empfängt Nachrichten des Servers und damit indirekt von anderen Clients. Über UDP werden verspätete und doppelte
+    Zustandsnachrichten verworfen, da bereits ein neuerer Zustand des Fahrzeugs empfangen wurde. Zustandsänderungen
+    (MSG_DELTA) werden mit dem letzten Schlüsselzustand des Absenders zu vollständigen Zuständen ergänzt. Empfangen
+    wird in feste Puffer (buffers), Frames werden ohne Kopie als memoryview ausgewertet; über UDP werden je Aufruf
+    alle bereitliegenden Datagramme gelesen.
     :param logging_object: Logger des Clients
     :param client_socket: Verbindung zwischen Server und Client
+    :param monitor: Messung des Clients für Verlust, Umsortierung und Latenz
+    :param report_interval: Abstand in Sekunden, in dem die Messung ins Log geschrieben wird
+    :param latency_budget: Latenzbudget in ms, bei Überschreitung durch p99 wird eine Warnung geschrieben
+    :param datagram: True, wenn client_socket ein verbundener UDP-Socket ist (ein oder mehrere Frames je Datagramm)
+    :param session: Sitzung des Clients, in der der neueste empfangene Zeitstempel für die Wiederaufnahme steht
+    :param fleet_table: Optionale fleet.FleetTable, in die jeder empfangene Zustand eingetragen wird
+    :param counters: Zähler empfangener Nachrichten und Bytes vom Server
+    :param controller: Optionale Überlastregelung, die aus den vom Server weitergeleiteten Bytes die Kanallast schätzt
     :return: None
     """
-    # Empfängt Daten vom Server_Library
+    # Empfängt Daten vom Server_Library und setzt sie zu vollständigen Nachrichten zusammen
+    rx_log = log_pipeline.channel(logging_object, log_pipeline.RX)
+    if datagram:
+        receiver = buffers.DatagramReceiver(client_socket)
+    else:
+        receiver = buffers.StreamReceiver(65536)
+    states = protocol.DeltaDecoder()
+    if counters is None:
+        counters = metrics.PeerCounters()
+    next_report = time.monotonic() + report_interval
+    stale = 0
     try:
         while True:
-            data = client_socket.recv(1024).decode()
-            if data:
-                logging_object.info(f"Nachricht vom Server empfangen: {data}")
+            if datagram:
+                frames = receiver.frames()
+                if frames is not None:
+                    # Absender ist immer der Server
+                    frames = [frame for frame, _ in frames]
+            else:
+                frames = receiver.receive(client_socket)
+            if frames is not None:
+                now = time.monotonic_ns()
+                size = sum(map(len, frames))
+                counters.received(size, len(frames))
+                if controller is not None:
+                    controller.received(size, len(frames))
+                for frame in frames:
+                    frame_type = protocol.message_type(frame)
+                    if frame_type == protocol.MSG_STATE or frame_type == protocol.MSG_DELTA:
+                        state = states.decode(frame)
+                        if state is None:
+                            continue
+                        if monitor is not None:
+                            result = monitor.observe(state, now, monitor.offset(instrumentation.SERVER_ID))
+                            if datagram and result in (instrumentation.REORDERED, instrumentation.DUPLICATE):
+                                stale += 1
+                                continue
+                        if session is not None and frame_type == protocol.MSG_STATE:
+                            # Der Server sucht diesen Frame im Verlauf, Zustandsänderungen puffert er nicht
+                            session.last_received = state.timestamp
+                        if fleet_table is not None:
+                            fleet_table.update(state)
+                        rx_log.debug("Nachricht vom Server empfangen: %s", state)
+                    elif frame_type == protocol.MSG_TIME_RESP and monitor is not None:
+                        monitor.time_response(frame, instrumentation.SERVER_ID, now)
+                if monitor is not None and time.monotonic() >= next_report:
+                    monitor.log_summary(logging_object, latency_budget)
+                    next_report += report_interval
             else:
                 logging_object.info("Verbindung zum Server beendet.")
                 break
     except KeyboardInterrupt:
         logging_object.info("Empfang manuell abgebrochen.")
+    except (socket.timeout, BlockingIOError):
+        logging_object.info("Keine Nachricht vom Server innerhalb des Timeouts, Verbindung wird aufgegeben.")
     except Exception as e:
         logging_object.info(f"Error: {e}")
+    if monitor is not None:
+        monitor.log_summary(logging_object, latency_budget)
+    if stale:
+        logging_object.info(f"{stale} veraltete Nachrichten verworfen.")
+    if states.missing:
+        logging_object.info(f"{states.missing} Zustandsänderungen ohne Schlüsselzustand verworfen.")
+    # Sende-Thread beenden, damit beide Threads die Verbindung aufgeben
+    shutdown(client_socket)
+
+
+def shutdown(client_socket: socket.socket):
+    """
+    Beendet eine Verbindung in beide Richtungen, blockierende Aufrufe anderer Threads kehren zurück.
+    :param client_socket: Verbindung zwischen Server und Client
+    :return: None
+    """
+    try:
+        client_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
 
 
 """*****************************************************************************************************************"""
 
 
-def create_logger(name: str):
+def create_logger(name: str, background: bool = False, detail: bool = True,
+                  sample: dict = None, max_per_second: dict = None):
     """
-    Erstellt einen neuen Logger, löscht die alte Log-Datei und gibt Logger-Objekt zurück.
+    Erstellt einen neuen Logger, löscht die alte Log-Datei und gibt Logger-Objekt zurück. Einzelne Nachrichten der
+    Sende- und Empfangsschleifen werden nur mit detail protokolliert und können per sample bzw. max_per_second
+    reduziert werden.
     :param name: Name der Log-datei
+    :param background: True schreibt Log-Einträge über eine Queue in einem Hintergrund-Thread
+    :param detail: True protokolliert jede gesendete und empfangene Nachricht
+    :param sample: Nachrichtenklasse ("tx", "rx") -> n, nur jede n-te Nachricht wird geschrieben
+    :param max_per_second: Nachrichtenklasse ("tx", "rx") -> maximale Anzahl Nachrichten pro Sekunde
     :return: Logger-Objekt
     """
     # Log-Datei entfernen, falls sie existiert
@@ -69,71 +276,265 @@ def create_logger(name: str):
         os.remove(name)
 
     # Logger konfigurieren
-    logging.basicConfig(
-        handlers=[
-            logging.FileHandler(name),
-            logging.StreamHandler()
-        ],
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s')
+    return log_pipeline.configure(name, background, detail, sample, max_per_second)
+
 
-    return logging.getLogger(name)
+def parse_server_info(text: str) -> (str, int, str):
+    """
+    Liest IPv4, Port und Transportprotokoll aus einer Broadcast-Nachricht des Servers ("<IPv4>:<Port>[:<tcp|udp>]").
+    :param text: Nachricht
+    :return: IPv4, Port, "tcp" oder "udp"
+    """
+    server_ip, port, *transport = text.strip().split(":")
+    # Ältere Server nennen kein Transportprotokoll und bieten nur TCP an
+    return server_ip, int(port), transport[0] if transport else "tcp"
 
 
-def discover_server(logging_object: logging.Logger, broadcast_port: int) -> (str, int):
+def discover_server(logging_object: logging.Logger, broadcast_port: int, discovery_port: int = None,
+                    discovery_address: str = "<broadcast>", probe_interval: float = 0.05,
+                    probe_limit: float = 2.0) -> (str, int, str):
     """
-    Empfängt Broadcast-Nachricht des Servers mit IPv4 und Port zur Kommunikation mit Server.
+    Sucht den Server: mit discovery_port wird sofort eine Suchanfrage per Broadcast gesendet, die der Server direkt
+    beantwortet; bleibt die Antwort aus, wird sie mit wachsendem Abstand wiederholt. Gleichzeitig wird auf die
+    periodische Broadcast-Nachricht des Servers gewartet, die erste Nachricht von beiden wird verwendet.
     :param logging_object: Logger des Clients
     :param broadcast_port: Broadcast-Port des Servers
-    :return: IPv4, Port
+    :param discovery_port: Port für Suchanfragen des Servers, None wartet nur auf die Broadcast-Nachricht
+    :param discovery_address: Zieladresse der Suchanfrage (z.B. 127.255.255.255 für Tests auf Loopback)
+    :param probe_interval: Abstand in Sekunden vor der ersten Wiederholung der Suchanfrage, danach verdoppelt
+    :param probe_limit: Maximaler Abstand der Suchanfragen in Sekunden
+    :return: IPv4, Port, "tcp" oder "udp"
     """
     # Wartet auf eine Broadcast-Nachricht vom Server und gibt die Server-IP und den Port zurück
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     sock.bind(("", broadcast_port))
+    sockets = [sock]
+    probe = None
+    if discovery_port:
+        # Eigener Socket, die Antwort kommt per Unicast an dessen Port
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sockets.append(probe)
 
     try:
-        logging_object.info("Warte auf Broadcast-Nachricht vom Server...")
-        data, addr = sock.recvfrom(1024)
-        server_ip, port = data.decode().split(":")
-        logging_object.info(f"Server gefunden: {server_ip}:{port}")
-        sock.close()
-        return server_ip, int(port)
+        logging_object.info("Suche Server...")
+        next_probe = time.monotonic()
+        interval = probe_interval
+        while True:
+            wait = None
+            if probe is not None:
+                if time.monotonic() >= next_probe:
+                    try:
+                        probe.sendto(protocol.DISCOVERY_PROBE, (discovery_address, discovery_port))
+                    except OSError as e:
+                        # z.B. noch keine Verbindung zum Netzwerk, die Broadcast-Nachricht bleibt als Rückfallebene
+                        logging_object.info(f"Suchanfrage fehlgeschlagen: {e}")
+                    next_probe = time.monotonic() + interval
+                    interval = min(interval * 2, probe_limit)
+                wait = max(0.0, next_probe - time.monotonic())
+            readable, _, _ = select.select(sockets, [], [], wait)
+            if readable:
+                data, addr = readable[0].recvfrom(1024)
+                server_ip, port, transport = parse_server_info(data.decode())
+                logging_object.info(f"Server gefunden: {server_ip}:{port} ({transport})")
+                return server_ip, port, transport
     except Exception as e:
         logging_object.error(f"Error: {e}")
-        return None, None
+        return None, None, None
+    finally:
+        sock.close()
+        if probe is not None:
+            probe.close()
+
+
+def load_server_address(path: str) -> (str, int, str):
+    """
+    Liest die zuletzt verwendete Serveradresse, damit ein Neustart nicht auf die nächste Broadcast-Nachricht wartet.
+    :param path: Pfad der Cache-Datei
+    :return: IPv4, Port, Transportprotokoll oder None, wenn keine gültige Adresse gespeichert ist
+    """
+    try:
+        with open(path) as cache_file:
+            return parse_server_info(cache_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def save_server_address(path: str, server_ip: str, port: int, transport: str):
+    """
+    Speichert die Serveradresse einer erfolgreichen Verbindung.
+    :param path: Pfad der Cache-Datei
+    :param server_ip: IPv4 des Servers
+    :param port: Port des Servers
+    :param transport: "tcp" oder "udp"
+    :return: None
+    """
+    try:
+        with open(path, "w") as cache_file:
+            cache_file.write(f"{server_ip}:{port}:{transport}\n")
+    except OSError:
+        pass
+
+
+def backoff_delay(attempt: int, base: float = 0.05, limit: float = 5.0) -> float:
+    """
+    Wartezeit vor einem Verbindungsversuch: exponentiell wachsende Obergrenze mit zufälliger Wartezeit darunter, damit
+    nach einem Ausfall des Servers nicht alle Clients gleichzeitig neu verbinden.
+    :param attempt: Anzahl der bisher fehlgeschlagenen Versuche
+    :param base: Obergrenze beim ersten Versuch in Sekunden
+    :param limit: Maximale Obergrenze in Sekunden
+    :return: Wartezeit in Sekunden
+    """
+    return random.uniform(0, min(limit, base * 2 ** attempt))
+
+
+def connect(server_ip: str, port: int, transport: str, link_timeout: float = None) -> socket.socket:
+    """
+    Verbindet den Client mit dem Server.
+    :param server_ip: IPv4 des Servers
+    :param port: Port des Servers
+    :param transport: "tcp" oder "udp"
+    :param link_timeout: Zeit in Sekunden ohne Nachricht des Servers, nach der die Verbindung als unterbrochen gilt
+    :return: Verbundener Socket
+    """
+    if transport == "udp":
+        # Verbundener UDP-Socket: send/recv nur mit dem Server
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Zustandsnachrichten sind klein und zeitkritisch, nicht auf Nagle warten
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client_socket.settimeout(link_timeout)
+    try:
+        client_socket.connect((server_ip, port))
+    except OSError:
+        client_socket.close()
+        raise
+    client_socket.settimeout(None)
+    if link_timeout:
+        # Timeout im Kernel statt settimeout(): ein blockierendes recv kehrt bei shutdown() auch über UDP zurück
+        seconds = int(link_timeout)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO,
+                                 struct.pack("ll", seconds, int((link_timeout - seconds) * 1e6)))
+    return client_socket
 
 
-def start(logging_object: logging.Logger, frequency: int, broadcast_port: int):
+def start(logging_object: logging.Logger, frequency: int, broadcast_port: int, own_id: int = None,
+          report_interval: float = 10.0, latency_budget: float = None, keepalive: float = 1.0,
+          cache_path: str = None, link_timeout: float = 3.0, retries: int = 3, key_interval: int = None,
+          fleet_table=None, stats_path: str = None, stats_dump: str = None, stats_interval: float = 10.0,
+          discovery_port: int = None, discovery_address: str = "<broadcast>",
+          rate_controller: congestion.RateController = None):
     """
-    Startet den Client und ruft jeweils einen Sende- und Empfangsthread auf.
+    Startet den Client und ruft jeweils einen Sende- und Empfangsthread auf. Nach einem Verbindungsabbruch wird sofort
+    (mit kurzer zufälliger Wartezeit) die bekannte Serveradresse erneut versucht und die Sitzung wieder aufgenommen:
+    der Server sendet alle verpassten Nachrichten aus seinem Verlauf. Erst nach retries Fehlversuchen wird auf die
+    nächste Broadcast-Nachricht gewartet.
     :param logging_object: Logger des Clients
     :param frequency: Sendefrequenz
     :param broadcast_port: Broadcast-Port des Servers
+    :param own_id: Fahrzeug-ID, standardmäßig aus IPv4 und Prozess-ID gebildet
+    :param report_interval: Abstand in Sekunden, in dem Verlust und Latenz ins Log geschrieben werden
+    :param latency_budget: Latenzbudget in ms, bei Überschreitung durch p99 wird eine Warnung geschrieben
+    :param keepalive: Abstand in Sekunden, in dem sich der Client bei einem UDP-Server erneut anmeldet
+    :param cache_path: Datei, in der die zuletzt verwendete Serveradresse für einen schnellen Neustart gespeichert wird
+    (None = immer auf die Broadcast-Nachricht warten)
+    :param link_timeout: Zeit in Sekunden ohne Nachricht des Servers (auch ohne Antworten auf Zeitanfragen), nach der
+    die Verbindung als unterbrochen gilt
+    :param retries: Anzahl fehlgeschlagener Verbindungsversuche, nach der die Serveradresse neu gesucht wird
+    :param key_interval: Abstand der vollständig gesendeten Schlüsselzustände in Nachrichten, dazwischen werden nur
+    Differenzen gesendet; None sendet jeden Zustand vollständig
+    :param fleet_table: Optionale fleet.FleetTable mit dem neuesten Zustand aller anderen Fahrzeuge, die von der
+    Anwendung abgefragt wird (Abstände, nächste Fahrzeuge, Zeit bis zur Kollision); bleibt über Wiederverbindungen
+    erhalten
+    :param stats_path: Pfad eines Unix-Domain-Sockets, über den Metriken (Nachrichten und Bytes zum Server, Überläufe
+    des Sendetakts, Empfangsmessung, Threads) abgefragt und der Sampling-Profiler geschaltet werden (siehe metrics),
+    None ohne Abfrage
+    :param stats_dump: Datei, an die alle stats_interval Sekunden eine Momentaufnahme der Metriken als JSON-Zeile
+    angehängt wird, None ohne Momentaufnahmen
+    :param stats_interval: Abstand der Momentaufnahmen in Sekunden
+    :param discovery_port: Port, an dem der Server Suchanfragen sofort beantwortet; None wartet bei unbekannter
+    Serveradresse auf die nächste Broadcast-Nachricht
+    :param discovery_address: Zieladresse der Suchanfragen
+    :param rate_controller: Optionale Überlastregelung (congestion.RateController), die die Sendefrequenz zwischen
+    ihren Grenzen an die Kanallast anpasst und bei deutlichen Zustandsänderungen sofort sendet; frequency wird dann
+    nicht verwendet
     :return: None
     """
-    server_ip, port = discover_server(logging_object, broadcast_port)
-    if not server_ip:
-        logging_object.error("Fehler beim Empfangen der Serverinformationen. Starte neu...")
-        start(logging_object, frequency, broadcast_port)
+    monitor = instrumentation.Instrumentation()
+    session = Session()
+    registry = metrics.Registry()
+    registry.gauge("reconnects", lambda: session.reconnects)
+    registry.source("reception", monitor.summary)
+    if fleet_table is not None:
+        registry.gauge("fleet", fleet_table.__len__)
+    if stats_path or stats_dump:
+        metrics.StatsServer(registry, stats_path, stats_dump, stats_interval).start()
+    address = load_server_address(cache_path) if cache_path else None
+    failures = 0
+    while True:
+        if address is None:
+            address = discover_server(logging_object, broadcast_port, discovery_port, discovery_address)
+            if address[0] is None:
+                logging_object.error("Fehler beim Empfangen der Serverinformationen. Starte neu...")
+                address = None
+                time.sleep(backoff_delay(failures))
+                failures += 1
+                continue
 
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.connect((server_ip, port))
-    logging_object.info(f"Verbunden mit dem Server: {server_ip}")
+        server_ip, port, transport = address
+        try:
+            client_socket = connect(server_ip, port, transport, link_timeout)
+        except OSError as e:
+            failures += 1
+            logging_object.info(f"Verbindung mit {server_ip}:{port} fehlgeschlagen ({failures}. Versuch): {e}")
+            if failures >= retries:
+                # Server vermutlich unter neuer Adresse, auf die nächste Broadcast-Nachricht warten
+                address = None
+            time.sleep(backoff_delay(failures))
+            continue
+        failures = 0
+        if cache_path:
+            save_server_address(cache_path, server_ip, port, transport)
+        logging_object.info(f"Verbunden mit dem Server: {server_ip} ({transport})")
+        if own_id is None:
+            own_id = protocol.vehicle_id(client_socket.getsockname()[0], os.getpid())
 
-    # Erstelle einen Thread zum Senden und einen zum Empfangen
-    send_thread = threading.Thread(target=send_data, args=(logging_object, client_socket, frequency))
-    receive_thread = threading.Thread(target=receive_data, args=(logging_object, client_socket))
+        datagram = transport == "udp"
+        try:
+            if session.last_received is not None:
+                # Verpasste Nachrichten seit dem Abbruch anfordern
+                client_socket.sendall(protocol.encode_resume(own_id, session.last_received))
+            elif datagram:
+                client_socket.sendall(protocol.encode_register(own_id))
+        except OSError as e:
+            logging_object.info(f"Wiederaufnahme fehlgeschlagen: {e}")
+            client_socket.close()
+            failures += 1
+            time.sleep(backoff_delay(failures))
+            continue
 
-    # Starte die Threads
-    send_thread.start()
-    receive_thread.start()
+        # Erstelle einen Thread zum Senden und einen zum Empfangen
+        counters = registry.peer((server_ip, port))
+        send_thread = threading.Thread(target=send_data,
+                                       args=(logging_object, client_socket, frequency, own_id, monitor, 1.0, 60.0,
+                                             keepalive if datagram else None, session, key_interval, counters,
+                                             registry, rate_controller))
+        receive_thread = threading.Thread(target=receive_data,
+                                          args=(logging_object, client_socket, monitor, report_interval,
+                                                latency_budget, datagram, session, fleet_table, counters,
+                                                rate_controller))
 
-    # Warten, bis beide Threads beendet sind
-    send_thread.join()
-    receive_thread.join()
+        # Starte die Threads
+        send_thread.start()
+        receive_thread.start()
 
-    client_socket.close()
+        # Warten, bis beide Threads beendet sind
+        send_thread.join()
+        receive_thread.join()
 
-    # Neustart
-    start(logging_object, frequency, broadcast_port)
+        client_socket.close()
+        session.reconnects += 1
+        logging_object.info(f"Verbindung zum Server unterbrochen, verbinde neu ({session.reconnects}. Mal)...")
+        time.sleep(backoff_delay(0))
@@ -0,0 +1,308 @@
+import heapq
+import logging
+import math
+import select
+import socket
+import time
+from . import buffers
+from . import capture
+from . import history
+from . import instrumentation
+from . import interest
+from . import metrics
+from . import protocol
+
+
+"""
+UDP-Betrieb des Servers. Clients melden sich mit einem Datagramm (MSG_REGISTER oder einer beliebigen Nachricht) an und
+werden in einer Client-Tabelle geführt, bis sie sich timeout Sekunden lang nicht mehr melden. Jede Zustandsnachricht
+wird als Datagramm an alle anderen angemeldeten Clients weitergeleitet. Ein verlorenes Datagramm hält im Gegensatz zu
+TCP keine späteren Nachrichten auf; verspätete (ältere als die zuletzt weitergeleitete) und doppelte Nachrichten eines
+Fahrzeugs werden verworfen, da bereits ein neuerer Zustand verteilt wurde. Das gilt für Schlüsselzustände und
+Zustandsänderungen (MSG_DELTA) gleichermaßen, beide tragen die Sequenznummer an derselben Stelle. Je Aufwachen werden
+alle bereitliegenden Datagramme in einen festen Pufferpool gelesen und ohne Kopie weitergeleitet; nur beim gebündelten
+Senden werden Frames bis zum nächsten Takt kopiert.
+"""
+
+
+MAX_RECEIVE = 2048      # Maximale Größe eines empfangenen Datagramms, Clients senden einzelne Frames
+RECEIVE_BATCH = 64      # Maximale Anzahl gelesener Datagramme je Aufwachen
+MAX_DATAGRAM = 1400     # Maximale Nutzlast gebündelter Datagramme an Clients, unterhalb der üblichen MTU
+
+
+class ClientEntry:
+    """
+    Eintrag eines angemeldeten Clients.
+    """
+    __slots__ = ("address", "vehicle_id", "last_seen", "counters", "registered", "delivered")
+
+    def __init__(self, address: tuple, vehicle_id: int, now: float, counters: metrics.PeerCounters):
+        self.address = address
+        self.vehicle_id = vehicle_id
+        self.last_seen = now
+        self.counters = counters
+        self.registered = None      # Anmeldezeit in ns, ab der neue Frames den Client direkt erreichen
+        self.delivered = None       # Fahrzeug-ID -> Empfangszeit des mit der Momentaufnahme gesendeten Frames
+
+
+class ClientTable:
+    """
+    Tabelle der angemeldeten Clients mit Zeitüberschreitung. Wird nur vom Thread des Servers benutzt. Ablaufzeitpunkte
+    liegen in einem Min-Heap und werden erst beim Ablauf mit der letzten Meldung verglichen.
+    """
+
+    def __init__(self, timeout: float, registry: metrics.Registry = None):
+        """
+        :param timeout: Dauer in Sekunden, bis ein Client ohne Datagramm entfernt wird
+        :param registry: Metriken des Servers, erhält Zähler je angemeldetem Client
+        """
+        self.timeout = timeout
+        self.registry = registry if registry is not None else metrics.Registry()
+        self._clients = {}
+        self._deadlines = []
+        self._snapshot = ()
+
+    def seen(self, address: tuple, vehicle_id: int, now: float) -> bool:
+        """
+        Vermerkt ein Datagramm eines Clients.
+        :param address: IPv4 und Port des Clients
+        :param vehicle_id: Fahrzeug-ID aus dem Datagramm
+        :param now: Zeitpunkt (time.monotonic())
+        :return: True, wenn der Client neu ist
+        """
+        entry = self._clients.get(address)
+        if entry is not None:
+            entry.last_seen = now
+            return False
+        self._clients[address] = ClientEntry(address, vehicle_id, now, self.registry.peer(address))
+        heapq.heappush(self._deadlines, (now + self.timeout, address))
+        self._snapshot = tuple(self._clients)
+        return True
+
+    def expire(self, now: float) -> list:
+        """
+        Entfernt alle Clients, deren letztes Datagramm länger als timeout zurückliegt.
+        :param now: Zeitpunkt (time.monotonic())
+        :return: Liste der entfernten Einträge
+        """
+        removed = []
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] < now:
+            _, address = heapq.heappop(deadlines)
+            entry = self._clients[address]
+            deadline = entry.last_seen + self.timeout
+            if deadline < now:
+                del self._clients[address]
+                self.registry.forget_peer(address)
+                removed.append(entry)
+            else:
+                heapq.heappush(deadlines, (deadline, address))
+        if removed:
+            self._snapshot = tuple(self._clients)
+        return removed
+
+    def get(self, address: tuple) -> ClientEntry:
+        """
+        :param address: IPv4 und Port des Clients
+        :return: Eintrag des Clients, None wenn er nicht angemeldet ist
+        """
+        return self._clients.get(address)
+
+    def next_deadline(self) -> float:
+        """
+        :return: Frühester möglicher Ablaufzeitpunkt (time.monotonic()), None ohne Clients
+        """
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def snapshot(self) -> tuple:
+        """
+        :return: Adressen aller angemeldeten Clients
+        """
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+
+class _Relay:
+    """
+    Verteilung empfangener Frames an die Clients, sofort oder gebündelt je Takt.
+    """
+
+    def __init__(self, server_socket: socket.socket, batching: bool, table: ClientTable):
+        self.server_socket = server_socket
+        self.batching = batching
+        self.table = table
+        # Adresse -> (wartende Frames, Größe in Byte)
+        self.pending = {}
+        self.forwarded = 0
+        self.failed = 0
+
+    def send(self, address: tuple, frame: bytes):
+        if not self.batching:
+            self.sendto(address, frame, 1)
+            return
+        frames, size = self.pending.get(address, ((), 0))
+        if size + len(frame) > MAX_DATAGRAM:
+            self.sendto(address, b"".join(frames), len(frames))
+            frames, size = (), 0
+        self.pending[address] = (frames + (frame,), size + len(frame))
+
+    def flush(self):
+        for address, (frames, _) in self.pending.items():
+            self.sendto(address, b"".join(frames), len(frames))
+        self.pending = {}
+
+    def sendto(self, address: tuple, datagram: bytes, count: int = 0):
+        """
+        Sendet ein Datagramm sofort. Ist der Sendepuffer voll oder der Client nicht erreichbar, wird es verworfen,
+        veraltete Zustände werden nicht nachgesendet.
+        """
+        try:
+            self.server_socket.sendto(datagram, address)
+            self.forwarded += count
+        except OSError:
+            self.failed += count
+            return
+        entry = self.table.get(address)
+        if entry is not None:
+            entry.counters.sent(len(datagram), max(count, 1))
+
+
+def serve(logging_object: logging.Logger, server_socket: socket.socket, timeout: float = 3.0,
+          batch_interval: float = 0, recorder: capture.CaptureWriter = None,
+          interest_grid: interest.InterestGrid = None, sender_history: history.SenderHistory = None,
+          snapshot_age: float = None, registry: metrics.Registry = None):
+    """
+    Leitet Datagramme aller Clients auf einem Thread weiter, bis eine Ausnahme auftritt.
+    :param logging_object: Logger des Servers
+    :param server_socket: Gebundener UDP-Socket des Servers
+    :param timeout: Dauer in Sekunden, bis ein Client ohne Datagramm abgemeldet wird
+    :param batch_interval: Taktdauer in Sekunden, in der Frames je Client zu einem Datagramm gebündelt werden, 0 sendet
+    jeden Frame sofort
+    :param recorder: Optionaler CaptureWriter, der jeden weitergeleiteten Frame aufzeichnet
+    :param interest_grid: Optionaler Gitterindex, Zustandsnachrichten gehen dann nur an Clients in der Nähe
+    :param sender_history: Optionaler Verlauf je Fahrzeug für Wiederaufnahmen (MSG_RESUME) und Momentaufnahmen
+    :param snapshot_age: Mit sender_history erhält ein neuer Client sofort den neuesten Zustand aller Fahrzeuge, die sich
+    in den letzten snapshot_age Sekunden gemeldet haben; None ohne Momentaufnahme
+    :param registry: Metriken des Servers, erhält Zähler je Client und den Abschnitt "udp"
+    :return: None
+    """
+    if registry is None:
+        registry = metrics.Registry()
+    server_socket.setblocking(False)
+    pool = buffers.DatagramReceiver(server_socket, MAX_RECEIVE, RECEIVE_BATCH)
+    table = ClientTable(timeout, registry)
+    # Neueste weitergeleitete Sequenznummer je Fahrzeug
+    sequences = instrumentation.SequenceTracker()
+    relay = _Relay(server_socket, batch_interval > 0, table)
+    stale = 0
+    malformed = 0
+    overruns = registry.counter("tick_overruns")
+    registry.source("udp", lambda: {"clients": len(table), "forwarded": relay.forwarded, "failed": relay.failed,
+                                    "stale": stale, "malformed": malformed})
+    next_tick = time.monotonic() + batch_interval if batch_interval else None
+    try:
+        while True:
+            deadlines = [deadline for deadline in (table.next_deadline(), next_tick) if deadline is not None]
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            readable, _, _ = select.select([server_socket], [], [], wait)
+            while readable:
+                datagrams = pool.receive(block=False)
+                # Weiterlesen, solange der Pufferpool vollständig gefüllt wurde
+                readable = len(datagrams) == RECEIVE_BATCH
+                received_at = time.monotonic_ns()
+                for data, address in datagrams:
+                    try:
+                        frames = []
+                        buffers.split_frames(data, frames)
+                        # Zu kurze Frames verwirft split_frames, unbekannte Typen melden keinen Client an
+                        if not frames or protocol.message_type(frames[0]) not in protocol.MIN_SIZES:
+                            continue
+                        new = table.seen(address, protocol.sender_id(frames[0]), time.monotonic())
+                        entry = table.get(address)
+                        if new:
+                            logging_object.info(f"Client {address} angemeldet.")
+                            # Neu gestartete Clients beginnen wieder bei Sequenznummer 0
+                            sequences.senders.pop(protocol.sender_id(frames[0]), None)
+                            if interest_grid is not None:
+                                interest_grid.add(address)
+                            entry.registered = time.monotonic_ns()
+                            if sender_history is not None and snapshot_age:
+                                newest = sender_history.newest(snapshot_age, entry.vehicle_id)
+                                for _, latest in newest.values():
+                                    relay.send(address, latest)
+                                entry.delivered = {sender: received for sender, (received, _) in newest.items()}
+                        entry.counters.received(len(data), len(frames))
+                        for frame in frames:
+                            frame_type = protocol.message_type(frame)
+                            if frame_type == protocol.MSG_TIME_REQ:
+                                _, t0 = protocol.decode_time_request(frame)
+                                response = protocol.encode_time_response(instrumentation.SERVER_ID, t0, received_at,
+                                                                         time.monotonic_ns())
+                                relay.sendto(address, response)
+                            elif frame_type == protocol.MSG_RESUME and sender_history is not None:
+                                own_id, since = protocol.decode_resume(frame)
+                                # Bereits mit der Momentaufnahme oder direkt gesendete Frames auslassen
+                                for missed in sender_history.since(since, own_id, entry.registered, entry.delivered):
+                                    relay.send(address, missed)
+                            elif frame_type == protocol.MSG_STATE or frame_type == protocol.MSG_DELTA:
+                                result = sequences.observe(protocol.sender_id(frame), protocol.sequence(frame))
+                                if result in (instrumentation.REORDERED, instrumentation.DUPLICATE):
+                                    stale += 1
+                                    continue
+                                if relay.batching:
+                                    # Der Empfangspuffer wird vor dem nächsten Takt überschrieben
+                                    frame = bytes(frame)
+                                if recorder is not None:
+                                    recorder.write(frame, capture.FORWARDED)
+                                if sender_history is not None:
+                                    sender_history.record((frame,))
+                                for receiver in _receivers(table, interest_grid, frame, address):
+                                    if receiver != address:
+                                        relay.send(receiver, frame)
+                    except Exception as e:
+                        # Fehlerhafte Datagramme eines Clients dürfen den Relay nicht beenden
+                        malformed += 1
+                        logging_object.info(f"Fehlerhaftes Datagramm von {address} verworfen: {e!r}")
+
+            now = time.monotonic()
+            if next_tick is not None and now >= next_tick:
+                relay.flush()
+                next_tick += batch_interval
+                if next_tick <= now:
+                    # Verpasste Takte nicht nachholen
+                    next_tick = now + batch_interval
+                    overruns.add()
+            for entry in table.expire(now):
+                logging_object.info(f"Client {entry.address} ohne Rückmeldung abgemeldet.")
+                sequences.senders.pop(entry.vehicle_id, None)
+                if sender_history is not None:
+                    sender_history.forget(entry.vehicle_id)
+                relay.pending.pop(entry.address, None)
+                if interest_grid is not None:
+                    interest_grid.remove(entry.address)
+    finally:
+        logging_object.info(f"UDP-Betrieb beendet: {relay.forwarded} Frames weitergeleitet, {relay.failed} nicht "
+                            f"gesendet, {stale} veraltete verworfen")
+
+
+def _receivers(table: ClientTable, interest_grid: interest.InterestGrid, frame, address: tuple):
+    """
+    :return: Adressen der Clients, an die ein Zustands-Frame weitergeleitet wird
+    """
+    if interest_grid is None:
+        return table.snapshot()
+    if protocol.message_type(frame) == protocol.MSG_STATE:
+        position = protocol.position(frame)
+        if not all(map(math.isfinite, position)):
+            # Ungültige Positionen (NaN, inf) wie fehlende behandeln
+            position = None
+        else:
+            interest_grid.update(address, *position)
+    else:
+        # Zustandsänderungen gehen an die Clients im Umkreis des letzten Schlüsselzustands
+        position = interest_grid.position(address)
+    if position is None or protocol.flags(frame) & protocol.FLAG_EMERGENCY:
+        return table.snapshot()
+    return interest_grid.receivers(*position)
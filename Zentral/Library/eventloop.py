@@ -0,0 +1,282 @@
+import socket
+import selectors
+import logging
+import resource
+import time
+from . import buffers
+from . import fanout
+from . import instrumentation
+from . import log_pipeline
+from . import protocol
+
+
+class Connection:
+    """
+    Zustand einer Client-Verbindung im Event-Loop: Socket, Adresse, Empfangspuffer, Ausgangswarteschlange und die
+    bereits entnommenen, noch nicht vollständig gesendeten Puffer.
+    """
+    __slots__ = ("sock", "address", "receiver", "outbox", "out_buffers", "writing")
+
+    def __init__(self, sock: socket.socket, address, outbox: fanout.Outbox):
+        self.sock = sock
+        self.address = address
+        self.receiver = buffers.StreamReceiver()
+        self.outbox = outbox
+        self.out_buffers = []
+        self.writing = False
+
+
+def raise_file_limit(logging_object: logging.Logger):
+    """
+    Hebt das Soft-Limit offener Dateideskriptoren auf das Hard-Limit an, damit tausende Verbindungen möglich sind.
+    :param logging_object: Logger des Servers
+    :return: None
+    """
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            logging_object.info(f"Limit offener Dateien von {soft} auf {hard} angehoben.")
+    except (ValueError, OSError) as e:
+        logging_object.info(f"Limit offener Dateien konnte nicht angehoben werden: {e}")
+
+
+def _accept(logging_object: logging.Logger, selector: selectors.BaseSelector,
+            server_socket: socket.socket, connections: dict, hub: fanout.FanoutHub):
+    """
+    Nimmt alle wartenden Verbindungen an und registriert sie im Selector.
+    :param logging_object: Logger des Servers
+    :param selector: Selector des Event-Loops
+    :param server_socket: Lauschender Server-Socket
+    :param connections: Dictionary aller Verbindungen (Socket -> Connection)
+    :param hub: Verwaltung aller Ausgangswarteschlangen
+    :return: None
+    """
+    while True:
+        try:
+            client_socket, client_address = server_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        client_socket.setblocking(False)
+        # Frames werden bereits gebündelt gesendet, Nagle würde sie nur zusätzlich verzögern
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = Connection(client_socket, client_address, hub.register(client_socket, client_address))
+        connections[client_socket] = connection
+        selector.register(client_socket, selectors.EVENT_READ, connection)
+        logging_object.info(f"Neue Verbindung von {client_address}")
+        if connection.outbox.depth():
+            # Momentaufnahme der Flotte aus register() sofort senden
+            _flush(logging_object, selector, connection, connections, hub)
+
+
+def _close(logging_object: logging.Logger, selector: selectors.BaseSelector,
+           connection: Connection, connections: dict, hub: fanout.FanoutHub):
+    """
+    Entfernt eine Verbindung aus dem Selector und schließt den Socket.
+    :param logging_object: Logger des Servers
+    :param selector: Selector des Event-Loops
+    :param connection: Zu schließende Verbindung
+    :param connections: Dictionary aller Verbindungen (Socket -> Connection)
+    :param hub: Verwaltung aller Ausgangswarteschlangen
+    :return: None
+    """
+    if connection is None or connections.pop(connection.sock, None) is None:
+        return
+    hub.unregister(connection.outbox)
+    selector.unregister(connection.sock)
+    connection.sock.close()
+    logging_object.info(f"Verbindung beendet mit {connection.address} "
+                        f"({connection.outbox.sent} gesendet, {connection.outbox.dropped} verworfen)")
+
+
+def _flush(logging_object: logging.Logger, selector: selectors.BaseSelector,
+           connection: Connection, connections: dict, hub: fanout.FanoutHub):
+    """
+    Übernimmt wartende Frames aus der Ausgangswarteschlange, sendet sie ohne Kopie mit einem sendmsg-Aufruf so weit
+    wie ohne Blockieren möglich und meldet die Verbindung für EVENT_WRITE an, solange Daten übrig sind. Während der
+    Socket blockiert, sammeln sich neue Frames nur in der begrenzten Warteschlange.
+    :param logging_object: Logger des Servers
+    :param selector: Selector des Event-Loops
+    :param connection: Verbindung, deren Puffer gesendet wird
+    :param connections: Dictionary aller Verbindungen (Socket -> Connection)
+    :param hub: Verwaltung aller Ausgangswarteschlangen
+    :return: None
+    """
+    if not connection.out_buffers:
+        connection.out_buffers = connection.outbox.take()
+        connection.outbox.counters.sent(sum(map(len, connection.out_buffers)), len(connection.out_buffers))
+    try:
+        sent = fanout.send_buffers(connection.sock, connection.out_buffers)
+    except (BlockingIOError, InterruptedError):
+        sent = 0
+    except OSError as e:
+        logging_object.info(f"Senden an {connection.address} fehlgeschlagen: {e}")
+        _close(logging_object, selector, connection, connections, hub)
+        return
+    connection.out_buffers = fanout.advance(connection.out_buffers, sent)
+
+    # Nur bei Zustandswechsel den Selector anpassen
+    pending = bool(connection.out_buffers) or connection.outbox.depth() > 0
+    if pending and not connection.writing:
+        selector.modify(connection.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, connection)
+        connection.writing = True
+    elif not pending and connection.writing:
+        selector.modify(connection.sock, selectors.EVENT_READ, connection)
+        connection.writing = False
+
+
+def _flush_all(logging_object: logging.Logger, selector: selectors.BaseSelector,
+               connections: dict, hub: fanout.FanoutHub, sender: Connection = None):
+    """
+    Sendet an alle Clients mit wartenden Frames, deren Socket gerade nicht blockiert.
+    :param logging_object: Logger des Servers
+    :param selector: Selector des Event-Loops
+    :param connections: Dictionary aller Verbindungen (Socket -> Connection)
+    :param hub: Verwaltung aller Ausgangswarteschlangen
+    :param sender: Verbindung, die übersprungen wird (Absender der neuen Frames)
+    :return: None
+    """
+    for outbox in hub.clients():
+        receiver = connections.get(outbox.sock)
+        if receiver is not None and receiver is not sender and not receiver.writing and outbox.depth():
+            _flush(logging_object, selector, receiver, connections, hub)
+
+
+def _receive(logging_object: logging.Logger, selector: selectors.BaseSelector,
+             connection: Connection, connections: dict, hub: fanout.FanoutHub, batching: bool, link=None):
+    """
+    Liest die verfügbaren Daten eines Clients, beantwortet Zeitanfragen und Wiederaufnahmen und reiht alle übrigen
+    Frames bei allen anderen Clients ein.
+    Ohne Bündelung wird sofort an alle Clients gesendet, deren Socket gerade nicht blockiert.
+    :param logging_object: Logger des Servers
+    :param selector: Selector des Event-Loops
+    :param connection: Verbindung, von der gelesen wird
+    :param connections: Dictionary aller Verbindungen (Socket -> Connection)
+    :param hub: Verwaltung aller Ausgangswarteschlangen
+    :param batching: True, wenn erst zum nächsten Takt gesendet wird
+    :param link: Kanäle zu anderen Worker-Prozessen, an die die Frames zusätzlich weitergeleitet werden
+    :return: None
+    """
+    try:
+        views = connection.receiver.receive(connection.sock)
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError:
+        logging_object.info(f"Verbindung mit {connection.address} unerwartet getrennt.")
+        _close(logging_object, selector, connection, connections, hub)
+        return
+    if views is None:
+        logging_object.info(f"Verbindung mit {connection.address} geschlossen.")
+        _close(logging_object, selector, connection, connections, hub)
+        return
+
+    connection.outbox.counters.received(sum(map(len, views)), len(views))
+    # Frames bleiben in den Warteschlangen über den nächsten Empfang hinaus bestehen und werden einmal kopiert
+    frames, responses = instrumentation.time_responses([bytes(view) for view in views], time.monotonic_ns())
+    for response in responses:
+        connection.outbox.put(response)
+    frames, replayed = hub.resume(frames, connection.outbox)
+    if responses or replayed:
+        # Antworten auf Zeitanfragen und Wiederaufnahmen sofort senden, auch bei gebündeltem Senden
+        if not connection.writing:
+            _flush(logging_object, selector, connection, connections, hub)
+    if not frames or connection.sock not in connections:
+        return
+    rx_log = log_pipeline.channel(logging_object, log_pipeline.RX)
+    if rx_log.isEnabledFor(logging.DEBUG):
+        for frame in frames:
+            rx_log.debug("Empfangene Nachricht von %s: %s", connection.address, protocol.describe(frame))
+
+    if link is not None:
+        link.forward(frames)
+    for outbox in hub.publish(frames, connection.outbox):
+        logging_object.info(f"Warteschlange von {outbox.address} voll, Verbindung wird getrennt.")
+        _close(logging_object, selector, connections.get(outbox.sock), connections, hub)
+    if not batching:
+        _flush_all(logging_object, selector, connections, hub, connection)
+
+
+def _receive_link(logging_object: logging.Logger, selector: selectors.BaseSelector, link,
+                  connections: dict, hub: fanout.FanoutHub, batching: bool):
+    """
+    Reiht die Frames anderer Worker bei allen eigenen Clients ein.
+    :param logging_object: Logger des Servers
+    :param selector: Selector des Event-Loops
+    :param link: Kanäle zu den anderen Workern (workers.WorkerLink)
+    :param connections: Dictionary aller Verbindungen (Socket -> Connection)
+    :param hub: Verwaltung aller Ausgangswarteschlangen
+    :param batching: True, wenn erst zum nächsten Takt gesendet wird
+    :return: None
+    """
+    frames = link.receive()
+    if not frames:
+        return
+    # Bereits vom empfangenden Worker aufgezeichnet
+    for outbox in hub.publish(frames, None, record=False):
+        logging_object.info(f"Warteschlange von {outbox.address} voll, Verbindung wird getrennt.")
+        _close(logging_object, selector, connections.get(outbox.sock), connections, hub)
+    if not batching:
+        _flush_all(logging_object, selector, connections, hub)
+
+
+def serve(logging_object: logging.Logger, server_socket: socket.socket, hub: fanout.FanoutHub,
+          batch_interval: float = 0, link=None):
+    """
+    Single-Thread-Server auf Basis von selectors: Annahme, Empfang und Weiterleitung aller Verbindungen in einer
+    Schleife ohne Thread pro Client. Mit batch_interval werden alle in einem Takt empfangenen Nachrichten gesammelt
+    und je Client mit einem einzigen sendmsg-Aufruf gesendet.
+    :param logging_object: Logger des Servers
+    :param server_socket: Gebundener und lauschender Server-Socket
+    :param hub: Verwaltung aller Ausgangswarteschlangen mit Grenze und Policy
+    :param batch_interval: Taktdauer in Sekunden für gebündeltes Senden, 0 sendet sofort
+    :param link: Kanäle zu anderen Worker-Prozessen (workers.WorkerLink), None im Einzelprozess-Betrieb
+    :return: None
+    """
+    raise_file_limit(logging_object)
+    server_socket.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ, None)
+    if link is not None:
+        selector.register(link, selectors.EVENT_READ, link)
+    connections = {}
+    batching = batch_interval > 0
+    overruns = hub.registry.counter("tick_overruns")
+    next_tick = time.monotonic() + batch_interval
+
+    try:
+        while True:
+            timeout = max(0.0, next_tick - time.monotonic()) if batching else None
+            for key, mask in selector.select(timeout):
+                connection = key.data
+                if connection is None:
+                    _accept(logging_object, selector, server_socket, connections, hub)
+                    continue
+                if connection is link:
+                    _receive_link(logging_object, selector, link, connections, hub, batching)
+                    continue
+                # Verbindung wurde evtl. in diesem Durchlauf bereits geschlossen
+                if connection.sock not in connections:
+                    continue
+                try:
+                    if mask & selectors.EVENT_WRITE:
+                        _flush(logging_object, selector, connection, connections, hub)
+                    if mask & selectors.EVENT_READ and connection.sock in connections:
+                        _receive(logging_object, selector, connection, connections, hub, batching, link)
+                except Exception as e:
+                    # Fehlerhafte Daten eines Clients beenden nur dessen Verbindung, nicht den Event-Loop
+                    logging_object.info(f"Fehler bei Verbindung mit {connection.address}, wird getrennt: {e!r}")
+                    _close(logging_object, selector, connection, connections, hub)
+
+            if batching and time.monotonic() >= next_tick:
+                if link is not None:
+                    link.flush()
+                _flush_all(logging_object, selector, connections, hub)
+                next_tick += batch_interval
+                # Verpasste Takte nicht nachholen
+                if next_tick < time.monotonic():
+                    next_tick = time.monotonic() + batch_interval
+                    overruns.add()
+    finally:
+        for connection in list(connections.values()):
+            _close(logging_object, selector, connection, connections, hub)
+        selector.close()
@@ -0,0 +1,385 @@
+import math
+import os
+import socket
+import threading
+import time
+from . import capture
+from . import history
+from . import interest
+from . import metrics
+from . import protocol
+
+
+"""
+Weiterleitung von Nachrichten an viele Clients über begrenzte Ausgangswarteschlangen je Client. Der Empfang eines
+Clients blockiert dadurch nie wegen eines langsamen Empfängers; volle Warteschlangen werden nach einer Policy
+behandelt.
+"""
+
+
+DROP_OLDEST = "drop_oldest"      # Älteste Nachricht verwerfen, neue einreihen
+DROP_NEWEST = "drop_newest"      # Neue Nachricht verwerfen
+DISCONNECT = "disconnect"        # Langsamen Client trennen
+CONFLATE = "conflate"            # Je Fahrzeug nur den neuesten Zustand vorhalten, ältere werden ersetzt
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT, CONFLATE)
+
+# Maximale Anzahl an Puffern pro sendmsg-Aufruf
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+def send_buffers(sock: socket.socket, buffers: list) -> int:
+    """
+    Sendet mehrere Puffer mit einem einzigen Systemaufruf (Scatter/Gather), ohne sie vorher zusammenzukopieren.
+    :param sock: Verbindung zum Client
+    :param buffers: Liste von Frames (bytes oder memoryview)
+    :return: Anzahl gesendeter Bytes
+    """
+    if len(buffers) > IOV_MAX:
+        return sock.sendmsg(buffers[:IOV_MAX])
+    return sock.sendmsg(buffers)
+
+
+def advance(buffers: list, sent: int) -> list:
+    """
+    Entfernt bereits gesendete Bytes vom Anfang einer Pufferliste. Ein teilweise gesendeter Puffer wird als
+    memoryview ohne Kopie gekürzt.
+    :param buffers: Liste von Puffern
+    :param sent: Anzahl gesendeter Bytes
+    :return: Liste der noch zu sendenden Puffer
+    """
+    index = 0
+    while index < len(buffers) and sent >= len(buffers[index]):
+        sent -= len(buffers[index])
+        index += 1
+    remaining = buffers[index:]
+    if sent:
+        remaining[0] = memoryview(remaining[0])[sent:]
+    return remaining
+
+
+def sendall_buffers(sock: socket.socket, buffers: list):
+    """
+    Blockierendes Senden einer Pufferliste mit sendmsg, bis alle Bytes übertragen sind.
+    :param sock: Verbindung zum Client
+    :param buffers: Liste von Puffern
+    :return: None
+    """
+    while buffers:
+        buffers = advance(buffers, send_buffers(sock, buffers))
+
+
+class Outbox:
+    """
+    Begrenzte Ausgangswarteschlange eines Clients mit Zählern für gesendete und verworfene Nachrichten. Mit der Policy
+    CONFLATE liegen Zustandsnachrichten in einem Dictionary Fahrzeug-ID -> neueste Frames: ein Client, der nicht
+    mithält, erhält beim nächsten Senden nur den neuesten Zustand jedes Fahrzeugs, und die Warteschlange wächst
+    höchstens auf die doppelte Anzahl der Fahrzeuge. Ersetzt eine Zustandsänderung (MSG_DELTA) einen noch nicht
+    gesendeten Schlüsselzustand, bleibt dieser vor ihr erhalten, damit der Client sie ergänzen kann. In counters zählen
+    Empfangs- und Sendeschleife Nachrichten und Bytes des Clients.
+    """
+    __slots__ = ("sock", "address", "limit", "policy", "frames", "latest", "condition", "closed", "sent", "dropped",
+                 "conflated", "counters", "registered", "delivered")
+
+    def __init__(self, sock: socket.socket, address, limit: int, policy: str, counters: metrics.PeerCounters = None):
+        self.sock = sock
+        self.address = address
+        self.limit = limit
+        self.policy = policy
+        self.frames = []
+        self.latest = {}
+        self.condition = threading.Condition(threading.Lock())
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.counters = counters if counters is not None else metrics.PeerCounters()
+        self.registered = None      # Anmeldezeit in ns, ab der neue Frames den Client direkt erreichen
+        self.delivered = None       # Fahrzeug-ID -> Empfangszeit des mit der Momentaufnahme gesendeten Frames
+
+    def put(self, frame: bytes) -> bool:
+        """
+        Reiht einen Frame ein und wendet bei voller Warteschlange die Policy an.
+        :param frame: Vollständiger Frame
+        :return: False, wenn der Client laut Policy getrennt werden muss
+        """
+        with self.condition:
+            if self.closed:
+                return True
+            if self.policy == CONFLATE and protocol.is_state(frame):
+                sender = protocol.sender_id(frame)
+                pending = self.latest.get(sender)
+                # Nicht gesendete ältere Zustände ersetzen, Position in der Reihenfolge bleibt erhalten
+                if pending is None:
+                    if not self.frames and not self.latest:
+                        self.condition.notify()
+                    self.latest[sender] = (frame,)
+                elif (protocol.message_type(frame) == protocol.MSG_DELTA
+                      and protocol.message_type(pending[0]) == protocol.MSG_STATE):
+                    self.conflated += len(pending) - 1
+                    self.latest[sender] = (pending[0], frame)
+                else:
+                    self.conflated += len(pending)
+                    self.latest[sender] = (frame,)
+                return True
+            if len(self.frames) >= self.limit:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return True
+                if self.policy == DISCONNECT:
+                    self.closed = True
+                    self.condition.notify()
+                    return False
+                del self.frames[0]
+            self.frames.append(frame)
+            if len(self.frames) == 1 and not self.latest:
+                self.condition.notify()
+        return True
+
+    def take(self) -> list:
+        """
+        Entnimmt alle wartenden Frames ohne zu blockieren.
+        :return: Liste der Frames in Eingangsreihenfolge
+        """
+        with self.condition:
+            frames = self._drain()
+        self.sent += len(frames)
+        return frames
+
+    def _drain(self) -> list:
+        frames, self.frames = self.frames, []
+        if self.latest:
+            for pending in self.latest.values():
+                frames.extend(pending)
+            self.latest = {}
+        return frames
+
+    def wait(self, timeout: float = None) -> list:
+        """
+        Wartet, bis Frames vorliegen oder die Warteschlange geschlossen wird, und entnimmt alle Frames.
+        :param timeout: Maximale Wartezeit in Sekunden
+        :return: Liste der Frames, leer bei Timeout oder geschlossener Warteschlange
+        """
+        with self.condition:
+            if not self.frames and not self.latest and not self.closed:
+                self.condition.wait(timeout)
+            frames = self._drain()
+        self.sent += len(frames)
+        return frames
+
+    def close(self):
+        """
+        Schließt die Warteschlange und weckt einen wartenden Schreib-Thread.
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            self.frames = []
+            self.latest = {}
+            self.condition.notify()
+
+    def depth(self) -> int:
+        """
+        :return: Anzahl wartender Frames
+        """
+        return len(self.frames) + sum(len(pending) for pending in self.latest.values())
+
+
+class FanoutHub:
+    """
+    Threadsichere Registrierung aller Clients. Die Weiterleitung iteriert über eine unveränderliche Momentaufnahme,
+    die nur beim An- und Abmelden unter Lock neu erstellt wird.
+    """
+
+    def __init__(self, limit: int = 256, policy: str = DROP_OLDEST, recorder: capture.CaptureWriter = None,
+                 interest_grid: interest.InterestGrid = None, sender_history: history.SenderHistory = None,
+                 snapshot_age: float = None, registry: metrics.Registry = None):
+        """
+        :param limit: Maximale Anzahl wartender Frames je Client
+        :param policy: Verhalten bei voller Warteschlange
+        :param recorder: Optionaler CaptureWriter, der jeden weitergeleiteten Frame aufzeichnet
+        :param interest_grid: Optionaler Gitterindex; Zustandsnachrichten werden dann nur an Clients in der Nähe des
+        Absenders weitergeleitet, Nachrichten mit FLAG_EMERGENCY weiterhin an alle
+        :param sender_history: Optionaler Verlauf je Fahrzeug, aus dem Clients nach einem Verbindungsabbruch verpasste
+        Nachrichten erhalten (MSG_RESUME)
+        :param snapshot_age: Mit sender_history erhält ein neuer Client sofort den neuesten Zustand aller Fahrzeuge, die
+        sich in den letzten snapshot_age Sekunden gemeldet haben; None ohne Momentaufnahme
+        :param registry: Metriken des Servers, erhält Zähler je Client und den Abschnitt "fanout" (stats())
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unbekannte Policy für volle Warteschlangen: {policy}")
+        self.limit = limit
+        self.policy = policy
+        self.recorder = recorder
+        self.interest_grid = interest_grid
+        self.sender_history = sender_history
+        self.snapshot_age = snapshot_age
+        self.registry = registry if registry is not None else metrics.Registry()
+        self.registry.source("fanout", self.stats)
+        self.dropped = 0
+        self.conflated = 0
+        self.filtered = 0
+        self._lock = threading.Lock()
+        self._outboxes = {}
+        self._snapshot = ()
+
+    def register(self, sock: socket.socket, address) -> Outbox:
+        """
+        Meldet einen Client an und reiht bei aktivierter Momentaufnahme den neuesten Zustand aller Fahrzeuge ein.
+        :param sock: Verbindung zum Client
+        :param address: Adresse des Clients
+        :return: Ausgangswarteschlange des Clients
+        """
+        outbox = Outbox(sock, address, self.limit, self.policy, self.registry.peer(address))
+        with self._lock:
+            self._outboxes[sock] = outbox
+            self._snapshot = tuple(self._outboxes.values())
+            # Ab jetzt erreichen neue Frames den Client direkt, sie gehören weder in die Momentaufnahme noch in eine
+            # Wiederaufnahme
+            outbox.registered = time.monotonic_ns()
+        if self.interest_grid is not None:
+            self.interest_grid.add(outbox)
+        if self.sender_history is not None and self.snapshot_age:
+            newest = self.sender_history.newest(self.snapshot_age, before=outbox.registered)
+            for _, frame in newest.values():
+                outbox.put(frame)
+            outbox.delivered = {sender: received for sender, (received, _) in newest.items()}
+        return outbox
+
+    def unregister(self, outbox: Outbox):
+        """
+        Meldet einen Client ab und schließt seine Warteschlange.
+        :param outbox: Ausgangswarteschlange des Clients
+        :return: None
+        """
+        with self._lock:
+            if self._outboxes.pop(outbox.sock, None) is None:
+                return
+            self._snapshot = tuple(self._outboxes.values())
+            self.dropped += outbox.dropped
+            self.conflated += outbox.conflated
+        self.registry.forget_peer(outbox.address)
+        if self.interest_grid is not None:
+            self.interest_grid.remove(outbox)
+        outbox.close()
+
+    def clients(self) -> tuple:
+        """
+        :return: Momentaufnahme aller angemeldeten Ausgangswarteschlangen
+        """
+        return self._snapshot
+
+    def publish(self, frames: list, sender: Outbox, record: bool = True) -> list:
+        """
+        Reiht die Frames eines Clients bei allen anderen Clients ein.
+        :param frames: Vollständige Frames
+        :param sender: Ausgangswarteschlange des sendenden Clients, None wenn die Frames von außerhalb kommen
+        :param record: False zeichnet die Frames nicht auf (z.B. bereits von einem anderen Worker aufgezeichnet)
+        :return: Liste der Warteschlangen, deren Clients laut Policy getrennt werden müssen
+        """
+        if record and self.recorder is not None:
+            self.recorder.write_all(frames, capture.FORWARDED)
+        if self.sender_history is not None:
+            self.sender_history.record(frames)
+        if self.interest_grid is not None:
+            return self._publish_nearby(frames, sender)
+        overflowed = []
+        for outbox in self._snapshot:
+            if outbox is sender:
+                continue
+            for frame in frames:
+                if not outbox.put(frame):
+                    overflowed.append(outbox)
+                    break
+        return overflowed
+
+    def resume(self, frames: list, outbox: Outbox) -> (list, int):
+        """
+        Beantwortet Wiederaufnahmen (MSG_RESUME) eines Clients: alle im Verlauf gepufferten Zustands-Frames anderer
+        Fahrzeuge, die nach dem zuletzt vom Client empfangenen Frame beim Server eingingen, werden bei ihm eingereiht.
+        Ausgelassen werden Frames, die der Client bereits erhalten hat: seit der Anmeldung direkt weitergeleitete und
+        die der Momentaufnahme samt älteren Frames desselben Fahrzeugs.
+        :param frames: Empfangene Frames des Clients
+        :param outbox: Ausgangswarteschlange des Clients
+        :return: Weiterzuleitende Frames ohne Wiederaufnahmen, Anzahl erneut eingereihter Frames
+        """
+        if not any(protocol.message_type(frame) == protocol.MSG_RESUME for frame in frames):
+            return frames, 0
+        replayed = 0
+        for frame in frames:
+            if protocol.message_type(frame) == protocol.MSG_RESUME and self.sender_history is not None:
+                own_id, since = protocol.decode_resume(frame)
+                for missed in self.sender_history.since(since, own_id, outbox.registered, outbox.delivered):
+                    outbox.put(missed)
+                    replayed += 1
+        return [frame for frame in frames if protocol.message_type(frame) != protocol.MSG_RESUME], replayed
+
+    def _publish_nearby(self, frames: list, sender: Outbox) -> list:
+        """
+        Reiht jeden Zustands-Frame nur bei Clients im Umkreis seiner Position ein und aktualisiert dabei die Position
+        des Absenders. Zustandsänderungen (MSG_DELTA) werden nicht dekodiert, sie gehen an die Clients im Umkreis der
+        Position aus dem letzten Schlüsselzustand. Notfall- und andere Nachrichten sowie Zustände mit nicht endlicher
+        Position gehen an alle Clients.
+        """
+        grid = self.interest_grid
+        overflowed = []
+        for frame in frames:
+            frame_type = protocol.message_type(frame)
+            if frame_type == protocol.MSG_STATE:
+                position = protocol.position(frame)
+                # Frames mit ungültiger Position (NaN, inf) gehen wie solche ohne Position an alle Clients
+                if not all(map(math.isfinite, position)):
+                    position = None
+                elif sender is not None:
+                    grid.update(sender, *position)
+            elif frame_type == protocol.MSG_DELTA:
+                position = grid.position(sender) if sender is not None else None
+            else:
+                position = None
+            if position is not None:
+                x, y = position
+                if protocol.flags(frame) & protocol.FLAG_EMERGENCY:
+                    receivers = self._snapshot
+                else:
+                    receivers = grid.receivers(x, y)
+                    self.filtered += len(self._snapshot) - len(receivers)
+            else:
+                receivers = self._snapshot
+            for outbox in receivers:
+                if outbox is sender or outbox in overflowed:
+                    continue
+                if not outbox.put(frame):
+                    overflowed.append(outbox)
+        return overflowed
+
+    def dropped_total(self) -> int:
+        """
+        :return: Anzahl verworfener Nachrichten aller aktuellen und ehemaligen Clients
+        """
+        return self.dropped + sum(outbox.dropped for outbox in self._snapshot)
+
+    def conflated_total(self) -> int:
+        """
+        :return: Anzahl durch neuere Zustände ersetzter Nachrichten aller aktuellen und ehemaligen Clients (CONFLATE)
+        """
+        return self.conflated + sum(outbox.conflated for outbox in self._snapshot)
+
+    def stats(self) -> dict:
+        """
+        :return: Anzahl der Clients, Tiefe der Ausgangswarteschlangen (Summe und Maximum) und verworfene, ersetzte und
+        wegen Entfernung nicht weitergeleitete Nachrichten
+        """
+        depths = []
+        for outbox in self._snapshot:
+            # Schreib-Threads verändern die Warteschlangen gleichzeitig
+            with outbox.condition:
+                depths.append(outbox.depth())
+        return {"clients": len(depths),
+                "queue_depth_total": sum(depths),
+                "queue_depth_max": max(depths, default=0),
+                "dropped": self.dropped_total(),
+                "conflated": self.conflated_total(),
+                "filtered": self.filtered}
@@ -0,0 +1,136 @@
+import collections
+import threading
+import time
+from . import protocol
+
+
+"""
+Verlauf der zuletzt weitergeleiteten Zustandsnachrichten je Fahrzeug. Jedes Fahrzeug hat einen Ringpuffer fester Tiefe,
+der Speicherbedarf ist damit auf Fahrzeuge * Tiefe Frames begrenzt. Nimmt ein Client nach einem Verbindungsabbruch die
+Sitzung wieder auf (MSG_RESUME), werden ihm alle gepufferten Frames erneut gesendet, die der Server nach dem Frame mit
+seinem zuletzt empfangenen Zeitstempel empfangen hat. Der jeweils neueste Frame je Fahrzeug dient als Momentaufnahme der
+Flotte für neu verbundene Clients. Zustandsänderungen (MSG_DELTA) werden mit dem Schlüsselzustand ihres Absenders zu
+vollständigen Zustands-Frames ergänzt, Momentaufnahme und Wiederaufnahme enthalten also auch bei Differenz-Kodierung den
+neuesten Zustand.
+
+Alter, Reihenfolge und Abmeldung richten sich nach der Empfangszeit in der Uhr des Servers, die mit jedem Frame
+gespeichert wird. Der Zeitstempel im Frame stammt vom Absender und ist vor dessen erstem Zeitabgleich in seiner eigenen
+Uhr angegeben.
+"""
+
+
+class SenderHistory:
+    """
+    Threadsicherer Verlauf je Fahrzeug (Fahrzeug-ID -> Ringpuffer der letzten depth (Empfangszeit, Zustands-Frame)).
+    """
+
+    def __init__(self, depth: int = 20):
+        """
+        :param depth: Anzahl gepufferter Frames je Fahrzeug, z.B. Frequenz * überbrückbare Unterbrechung in Sekunden
+        """
+        if depth < 1:
+            raise ValueError(f"Tiefe muss mindestens 1 sein: {depth}")
+        self.depth = depth
+        self._frames = {}
+        self._decoder = protocol.DeltaDecoder()
+        self._lock = threading.Lock()
+
+    def record(self, frames: list):
+        """
+        Übernimmt die Zustands-Frames aus frames, andere Nachrichtentypen werden ignoriert. Zustandsänderungen werden
+        als vollständiger Zustand gespeichert, solche ohne bekannten Schlüsselzustand übergangen.
+        :param frames: Vollständige Frames
+        :return: None
+        """
+        received = time.monotonic_ns()
+        with self._lock:
+            for frame in frames:
+                frame_type = protocol.message_type(frame)
+                if frame_type == protocol.MSG_STATE:
+                    # Schlüsselzustand für nachfolgende Zustandsänderungen merken
+                    state = self._decoder.decode(frame)
+                    frame = bytes(frame)
+                elif frame_type == protocol.MSG_DELTA:
+                    state = self._decoder.decode(frame)
+                    if state is None:
+                        continue
+                    frame = protocol.encode_state(state, protocol.flags(frame))
+                else:
+                    continue
+                ring = self._frames.get(state.vehicle_id)
+                if ring is None:
+                    ring = self._frames[state.vehicle_id] = collections.deque(maxlen=self.depth)
+                ring.append((received, frame))
+
+    def since(self, timestamp: int, exclude: int = None, before: int = None, delivered: dict = None) -> list:
+        """
+        Gibt alle Frames zurück, die nach dem Frame mit dem Zeitstempel timestamp empfangen wurden. Ist dieser nicht mehr
+        im Verlauf, werden ersatzweise die Zeitstempel der Frames mit timestamp verglichen.
+        :param timestamp: Zeitstempel in ns des zuletzt vom Client empfangenen Frames (ausschließlich)
+        :param exclude: Fahrzeug-ID, deren Frames nicht zurückgegeben werden (z.B. der anfragende Client selbst)
+        :param before: Empfangszeit in ns (time.monotonic_ns()); danach empfangene Frames werden ausgelassen (z.B. bereits
+        direkt an den Client weitergeleitet), None ohne Einschränkung
+        :param delivered: Fahrzeug-ID -> Empfangszeit des bereits an den Client gesendeten neuesten Frames (z.B. aus der
+        Momentaufnahme, siehe newest()); dieser und ältere Frames des Fahrzeugs werden ausgelassen
+        :return: Gepufferte Frames, aufsteigend nach Empfangszeit
+        """
+        with self._lock:
+            entries = [(received, frame, sender) for sender, ring in self._frames.items() if sender != exclude
+                       for received, frame in ring]
+        cutoff = max((received for received, frame, _ in entries if _timestamp(frame) == timestamp), default=None)
+        if cutoff is None:
+            entries = [entry for entry in entries if _timestamp(entry[1]) > timestamp]
+        else:
+            entries = [entry for entry in entries if entry[0] > cutoff]
+        if before is not None:
+            entries = [entry for entry in entries if entry[0] < before]
+        if delivered:
+            entries = [entry for entry in entries if entry[0] > delivered.get(entry[2], -1)]
+        entries.sort(key=lambda entry: entry[0])
+        return [frame for _, frame, _ in entries]
+
+    def latest(self, max_age: float = None, exclude: int = None, before: int = None) -> list:
+        """
+        Gibt den neuesten Frame jedes Fahrzeugs zurück (siehe newest()).
+        :return: Neuester Frame je Fahrzeug
+        """
+        return [frame for _, frame in self.newest(max_age, exclude, before).values()]
+
+    def newest(self, max_age: float = None, exclude: int = None, before: int = None) -> dict:
+        """
+        Gibt den neuesten Frame jedes Fahrzeugs mit seiner Empfangszeit zurück. Fahrzeuge, deren neuester Frame vor mehr
+        als max_age Sekunden empfangen wurde, gelten als abgemeldet und werden aus dem Verlauf entfernt.
+        :param max_age: Maximales Alter in Sekunden seit dem Empfang, None ohne Begrenzung
+        :param exclude: Fahrzeug-ID, deren Frame nicht zurückgegeben wird
+        :param before: Empfangszeit in ns (time.monotonic_ns()); Fahrzeuge, deren neuester Frame danach empfangen wurde,
+        werden ausgelassen (z.B. bereits direkt an einen Client weitergeleitet), None ohne Einschränkung
+        :return: Fahrzeug-ID -> (Empfangszeit in ns, neuester Frame)
+        """
+        oldest = time.monotonic_ns() - int(max_age * 1e9) if max_age is not None else None
+        entries = {}
+        with self._lock:
+            for sender, ring in list(self._frames.items()):
+                received, frame = ring[-1]
+                if oldest is not None and received < oldest:
+                    del self._frames[sender]
+                    self._decoder.forget(sender)
+                elif sender != exclude and (before is None or received < before):
+                    entries[sender] = (received, frame)
+        return entries
+
+    def forget(self, sender: int):
+        """
+        Entfernt den Verlauf eines Fahrzeugs.
+        :param sender: Fahrzeug-ID
+        :return: None
+        """
+        with self._lock:
+            self._frames.pop(sender, None)
+            self._decoder.forget(sender)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+def _timestamp(frame) -> int:
+    return protocol.TIMESTAMP.unpack_from(frame, protocol.TIMESTAMP_OFFSET)[0]
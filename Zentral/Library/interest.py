@@ -0,0 +1,120 @@
+import math
+import threading
+
+
+"""
+Interessenverwaltung für den Server: ein Fahrzeug erhält nur Nachrichten von Fahrzeugen in seiner Umgebung. Die
+zuletzt gemeldete Position jedes Clients liegt in einem Gitter mit Zellgröße radius; gesucht wird nur in der Zelle des
+Absenders und ihren acht Nachbarn. Eine neue Position verschiebt den Client höchstens von einer Zelle in eine andere,
+das Gitter wird nie neu aufgebaut.
+"""
+
+
+class InterestGrid:
+    """
+    Threadsicherer Gitterindex der Client-Positionen. Clients werden über ein beliebiges hashbares Objekt (z.B. ihre
+    Ausgangswarteschlange) identifiziert.
+    """
+
+    def __init__(self, radius: float):
+        """
+        :param radius: Reichweite in m, innerhalb der Nachrichten weitergeleitet werden
+        """
+        if radius <= 0:
+            raise ValueError(f"Radius muss positiv sein: {radius}")
+        self.radius = radius
+        self._radius_squared = radius * radius
+        self._cells = {}
+        self._positions = {}
+        # Clients ohne bisher gemeldete Position erhalten alle Nachrichten
+        self._unplaced = set()
+        self._lock = threading.Lock()
+
+    def _cell(self, x: float, y: float) -> (int, int):
+        return math.floor(x / self.radius), math.floor(y / self.radius)
+
+    def add(self, client):
+        """
+        Meldet einen Client ohne Position an.
+        :param client: Client
+        :return: None
+        """
+        with self._lock:
+            if client not in self._positions:
+                self._unplaced.add(client)
+
+    def remove(self, client):
+        """
+        Entfernt einen Client.
+        :param client: Client
+        :return: None
+        """
+        with self._lock:
+            self._unplaced.discard(client)
+            entry = self._positions.pop(client, None)
+            if entry is not None:
+                self._leave(client, entry[2])
+
+    def _leave(self, client, cell: tuple):
+        members = self._cells[cell]
+        members.discard(client)
+        if not members:
+            del self._cells[cell]
+
+    def update(self, client, x: float, y: float):
+        """
+        Speichert die zuletzt gemeldete Position eines Clients. Nicht endliche Koordinaten (NaN, inf) werden ignoriert,
+        der Client behält seine bisherige Position.
+        :param client: Client
+        :param x: x [m]
+        :param y: y [m]
+        :return: None
+        """
+        if not (math.isfinite(x) and math.isfinite(y)):
+            return
+        cell = self._cell(x, y)
+        with self._lock:
+            entry = self._positions.get(client)
+            if entry is None:
+                self._unplaced.discard(client)
+                self._cells.setdefault(cell, set()).add(client)
+            elif entry[2] != cell:
+                self._leave(client, entry[2])
+                self._cells.setdefault(cell, set()).add(client)
+            self._positions[client] = (x, y, cell)
+
+    def position(self, client) -> (float, float):
+        """
+        :param client: Client
+        :return: Zuletzt gemeldete Position x [m], y [m], None ohne Position
+        """
+        with self._lock:
+            entry = self._positions.get(client)
+        return entry[:2] if entry is not None else None
+
+    def receivers(self, x: float, y: float) -> list:
+        """
+        :param x: x [m] des Absenders
+        :param y: y [m] des Absenders
+        :return: Alle Clients innerhalb von radius um (x, y) und alle Clients ohne Position
+        """
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError(f"Position muss endlich sein: ({x}, {y})")
+        cell_x, cell_y = self._cell(x, y)
+        radius_squared = self._radius_squared
+        with self._lock:
+            result = list(self._unplaced)
+            positions = self._positions
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    members = self._cells.get((cell_x + dx, cell_y + dy))
+                    if not members:
+                        continue
+                    for client in members:
+                        other_x, other_y, _ = positions[client]
+                        if (other_x - x) ** 2 + (other_y - y) ** 2 <= radius_squared:
+                            result.append(client)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._positions) + len(self._unplaced)
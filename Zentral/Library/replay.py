@@ -0,0 +1,67 @@
+import logging
+import selectors
+import socket
+import threading
+import time
+from . import capture
+from . import protocol
+
+
+def _drain(selector: selectors.BaseSelector):
+    """
+    Liest und verwirft alle Daten, die der Server an die Replay-Verbindungen weiterleitet, damit deren
+    Ausgangswarteschlangen im Server nicht volllaufen.
+    :param selector: Selector mit allen Replay-Verbindungen
+    :return: None
+    """
+    while selector.get_map():
+        for key, _ in selector.select(0.5):
+            try:
+                data = key.fileobj.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                selector.unregister(key.fileobj)
+
+
+def replay_to_server(logging_object: logging.Logger, path: str, server_ip: str, port: int, speed: float = 1.0,
+                     restamp: bool = True, direction: int = capture.FORWARDED) -> int:
+    """
+    Spielt einen Mitschnitt in einen laufenden Server ein. Für jedes Fahrzeug im Mitschnitt wird eine eigene
+    Verbindung aufgebaut, die Frames werden im aufgezeichneten Zeitverlauf gesendet.
+    :param logging_object: Logger
+    :param path: Pfad der Capture-Datei
+    :param server_ip: IPv4 des Servers
+    :param port: Port des Servers
+    :param speed: Zeitfaktor (1 = Echtzeit, N = N-fach schneller, 0 = so schnell wie möglich)
+    :param restamp: True ersetzt den Zeitstempel der Zustands-Frames durch den aktuellen Sendezeitpunkt
+    :param direction: Nur Einträge dieser Richtung einspielen, None für alle
+    :return: Anzahl gesendeter Frames
+    """
+    reader = capture.CaptureReader(path)
+    connections = {}
+    selector = selectors.DefaultSelector()
+    sent = 0
+    try:
+        for vehicle in reader.vehicles():
+            connection = socket.create_connection((server_ip, port))
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connections[vehicle] = connection
+            selector.register(connection, selectors.EVENT_READ)
+        drain_thread = threading.Thread(target=_drain, args=(selector,))
+        drain_thread.daemon = True
+        drain_thread.start()
+        logging_object.info(f"Replay von {len(reader)} Einträgen mit {len(connections)} Fahrzeugen "
+                            f"an {server_ip}:{port} (Faktor {speed})")
+
+        for timestamp, vehicle, _, frame in capture.paced(reader, speed, direction):
+            if restamp:
+                frame = protocol.with_timestamp(frame, time.monotonic_ns())
+            connections[vehicle].sendall(frame)
+            sent += 1
+    finally:
+        for connection in connections.values():
+            connection.close()
+        reader.close()
+    logging_object.info(f"Replay beendet: {sent} Frames gesendet.")
+    return sent
@@ -3,93 +3,177 @@ import threading
 import logging
 import time
 import os
-import psutil  # Modul für den Zugriff auf Netzwerkinterfaces
+from . import buffers
+from . import capture
+from . import datagram
+from . import eventloop
+from . import fanout
+from . import history
+from . import instrumentation
+from . import interest
+from . import interfaces
+from . import log_pipeline
+from . import metrics
+from . import protocol
+from . import scheduler
+from . import workers
 
 
 """*****************************************************************************************************************"""
 
 
-def send_to_clients(logging_object: logging.Logger, data: str, clients_set: set, client_socket: socket.socket):
+def send_to_clients(logging_object: logging.Logger, frames: list, hub: fanout.FanoutHub, sender: fanout.Outbox):
     """
-    Funktion, die bei Verbindung eines Clients A mit dem Server aufgerufen wird und die Daten des Clients A an alle
-    anderen Clients aus clients_list schickt.
+    Funktion, die bei Verbindung eines Clients A mit dem Server aufgerufen wird und die Daten des Clients A in die
+    Ausgangswarteschlangen aller anderen Clients einreiht. Gesendet wird von den Schreib-Threads der Empfänger.
     :param logging_object: Logger, um Nachrichten vom Server an Clients zu speichern
-    :param data: Daten eines Clients, die gesendet werden sollen
-    :param clients_set: Set aller Clients inklusive Client A
-    :param client_socket: Verbindung zwischen Server und Client A
+    :param frames: Vollständige Frames eines Clients, die unverändert weitergeleitet werden
+    :param hub: Verwaltung aller Clients und ihrer Ausgangswarteschlangen
+    :param sender: Ausgangswarteschlange des Clients A
     :return: None
     """
-    for client in clients_set:
-        if client != client_socket:
-            client.sendall(data.encode())
-            logging_object.info(f"Nachricht an {client.getpeername()} von {client_socket.getpeername()} {data}")
+    for outbox in hub.publish(frames, sender):
+        logging_object.info(f"Warteschlange von {outbox.address} voll, Verbindung wird getrennt.")
+        disconnect(outbox)
+    tx_log = log_pipeline.channel(logging_object, log_pipeline.TX)
+    if tx_log.isEnabledFor(logging.DEBUG):
+        # Anzahl der Empfänger nur ermitteln, wenn sie auch protokolliert wird
+        tx_log.debug("%d Nachricht(en) von %s an %d Clients weitergeleitet", len(frames), sender.address,
+                     len(hub.clients()) - 1)
 
 
-def receive_from_client(logging_object: logging.Logger, client_socket: socket.socket, address: str):
+def receive_from_client(logging_object: logging.Logger, client_socket: socket.socket, address: str,
+                        receiver: buffers.StreamReceiver) -> list:
     """
-    Funktion, die bei Verbindung eines Clients A mit dem Server aufgerufen wird und die Daten des Clients A empfängt
-    und zurückgibt.
+    Funktion, die bei Verbindung eines Clients A mit dem Server aufgerufen wird und die Daten des Clients A empfängt,
+    in vollständige Frames zerlegt und zurückgibt. Die Frames werden einmal aus dem Empfangspuffer kopiert, da sie in
+    den Warteschlangen der anderen Clients über den nächsten Empfang hinaus bestehen.
     :param logging_object: Logger des Servers, um Kommunikation zwischen Client und Server zu speichern
     :param client_socket: Verbindung zwischen Server und Client A
     :param address: IPv4 und Port des Clients
-    :return: data
+    :param receiver: Empfangspuffer der Verbindung, hält unvollständige Frames zwischen den Aufrufen
+    :return: Liste vollständiger Frames, None wenn die Verbindung beendet wurde
     """
+    rx_log = log_pipeline.channel(logging_object, log_pipeline.RX)
     try:
         while True:
-            data = client_socket.recv(1024).decode()
-            if data:
-                logging_object.info(f"Empfangene Nachricht von {address}: {data}")
-                return data
+            views = receiver.receive(client_socket)
+            if views is not None:
+                frames = [bytes(view) for view in views]
+                if frames:
+                    if rx_log.isEnabledFor(logging.DEBUG):
+                        for frame in frames:
+                            rx_log.debug("Empfangene Nachricht von %s: %s", address, protocol.describe(frame))
+                    return frames
             else:
                 logging_object.info(f"Verbindung mit {address} geschlossen.")
                 break
-    except ConnectionResetError:
+    except OSError:
         logging_object.info(f"Verbindung mit {address} unerwartet getrennt.")
 
 
 """*****************************************************************************************************************"""
 
 
-def create_logger(name: str):
+def create_logger(name: str, background: bool = False, detail: bool = True,
+                  sample: dict = None, max_per_second: dict = None):
     """
-    Erstellt einen neuen Logger, löscht die alte Log-Datei und gibt Logger-Objekt zurück.
+    Erstellt einen neuen Logger, löscht die alte Log-Datei und gibt Logger-Objekt zurück. Einzelne Nachrichten der
+    Sende- und Empfangsschleifen werden nur mit detail protokolliert und können per sample bzw. max_per_second
+    reduziert werden.
     :param name: Name der Log-datei
+    :param background: True schreibt Log-Einträge über eine Queue in einem Hintergrund-Thread
+    :param detail: True protokolliert jede gesendete und empfangene Nachricht
+    :param sample: Nachrichtenklasse ("tx", "rx") -> n, nur jede n-te Nachricht wird geschrieben
+    :param max_per_second: Nachrichtenklasse ("tx", "rx") -> maximale Anzahl Nachrichten pro Sekunde
     :return: Logger-Objekt
     """
     if os.path.exists(name):
         os.remove(name)
 
     # Logger konfigurieren
-    logging.basicConfig(
-        handlers=[
-            logging.FileHandler(name),
-            logging.StreamHandler()
-        ],
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s')
-
-    return logging.getLogger(name)
+    return log_pipeline.configure(name, background, detail, sample, max_per_second)
 
 
 def broadcast_server_info(logging_object: logging.Logger, port_server: int,
-                          port_broadcast: int, server_ip: str, interval:  int):
+                          port_broadcast: int, server_ip: str, interval:  int, broadcast_address: str = "<broadcast>",
+                          transport: str = "tcp"):
     """
-    Sendet periodisch alle *interval* Sekunden eine Broadcast-Nachricht an alle Teilnehmer mit IPv4 und Port des
-    Servers.
+    Sendet periodisch alle *interval* Sekunden eine Broadcast-Nachricht an alle Teilnehmer mit IPv4, Port und
+    Transportprotokoll des Servers ("<IPv4>:<Port>:<tcp|udp>").
     :param logging_object: Logger des Servers
     :param port_server: Port des Servers für Kommunikation
     :param port_broadcast: Port des Servers für Broadcasting
     :param server_ip: IPv4 des Servers
     :param interval: Sendeintervall der Broadcast-Nachricht
+    :param broadcast_address: Zieladresse der Broadcast-Nachricht
+    :param transport: Vom Server angebotenes Transportprotokoll, "tcp" oder "udp"
     :return: None
     """
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    message = f"{server_ip}:{port_server}"
-    while True:
-        sock.sendto(message.encode(), ('<broadcast>', port_broadcast))
+    message = f"{server_ip}:{port_server}:{transport}"
+
+    def announce():
+        sock.sendto(message.encode(), (broadcast_address, port_broadcast))
         logging_object.info(f"Broadcast Nachricht gesendet: {message}")
-        time.sleep(interval)
+
+    schedule = scheduler.Scheduler()
+    schedule.add("discovery", interval, announce)
+    schedule.run()
+
+
+def answer_discovery(logging_object: logging.Logger, port_discovery: int, server_ip: str, port_server: int,
+                     transport: str = "tcp"):
+    """
+    Beantwortet Suchanfragen von Clients (protocol.DISCOVERY_PROBE) sofort mit IPv4, Port und Transportprotokoll des
+    Servers, sodass ein Client nicht auf die nächste Broadcast-Nachricht warten muss.
+    :param logging_object: Logger des Servers
+    :param port_discovery: Port, an dem Suchanfragen per Broadcast empfangen werden
+    :param server_ip: IPv4 des Servers
+    :param port_server: Port des Servers für Kommunikation
+    :param transport: Vom Server angebotenes Transportprotokoll, "tcp" oder "udp"
+    :return: None
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", port_discovery))
+    message = f"{server_ip}:{port_server}:{transport}".encode()
+    while True:
+        try:
+            data, address = sock.recvfrom(64)
+            if data.strip() == protocol.DISCOVERY_PROBE:
+                sock.sendto(message, address)
+                logging_object.info(f"Suchanfrage von {address} beantwortet.")
+        except OSError as e:
+            logging_object.info(f"Fehler beim Beantworten einer Suchanfrage: {e}")
+
+
+def start_discovery(logging_object: logging.Logger, port_server: int, port_broadcast: int, server_ip: str,
+                    interval: int, broadcast_address: str, transport: str, port_discovery: int = None):
+    """
+    Startet die periodische Broadcast-Nachricht und, mit port_discovery, die Beantwortung von Suchanfragen in
+    Hintergrund-Threads.
+    :param logging_object: Logger des Servers
+    :param port_server: Port des Servers für Kommunikation
+    :param port_broadcast: Port des Servers für Broadcasting
+    :param server_ip: IPv4 des Servers
+    :param interval: Sendeintervall der Broadcast-Nachricht
+    :param broadcast_address: Zieladresse der Broadcast-Nachricht
+    :param transport: Vom Server angebotenes Transportprotokoll, "tcp" oder "udp"
+    :param port_discovery: Port für Suchanfragen von Clients, None nur mit Broadcast-Nachricht
+    :return: None
+    """
+    broadcast_thread = threading.Thread(
+        target=broadcast_server_info,
+        args=(logging_object, port_server, port_broadcast, server_ip, interval, broadcast_address, transport))
+    broadcast_thread.daemon = True
+    broadcast_thread.start()
+    if port_discovery:
+        discovery_thread = threading.Thread(target=answer_discovery,
+                                            args=(logging_object, port_discovery, server_ip, port_server, transport))
+        discovery_thread.daemon = True
+        discovery_thread.start()
 
 
 def get_localip(logging_object: logging.Logger) -> str:
@@ -99,17 +183,17 @@ def get_localip(logging_object: logging.Logger) -> str:
     :return: IPv4 des Geräts
     """
     timeout = 30
-    interval = 1
+    # Die Abfrage kostet nur ioctl-Aufrufe, eine noch fehlende Adresse (z.B. während DHCP) wird engmaschig gesucht
+    interval = 0.1
     # Versucht eine gültige lokale IP-Adresse zu finden, andernfalls wird der Server heruntergefahren
-    start_time = time.time()
+    start_time = time.monotonic()
 
-    while time.time() - start_time < timeout:
-        for [_, addrs] in psutil.net_if_addrs().items():
-            for addr in addrs:
-                # Prüft auf IPv4-Adresse, die nicht die Loopback-Adresse ist
-                if addr.family == socket.AF_INET and addr.address != "127.0.0.1":
-                    logging_object.info(f"Gefundene lokale IP-Adresse: {addr.address}")
-                    return addr.address
+    while time.monotonic() - start_time < timeout:
+        for _, address in interfaces.addresses():
+            # Prüft auf eine IPv4-Adresse, die nicht die Loopback-Adresse ist
+            if address != "127.0.0.1":
+                logging_object.info(f"Gefundene lokale IP-Adresse: {address}")
+                return address
 
         # [interval] warten, bevor erneut gesucht wird
         time.sleep(interval)
@@ -120,72 +204,230 @@ def get_localip(logging_object: logging.Logger) -> str:
                      "Überprüfen Sie die Verbindung mit dem Router.")
 
 
-def handle_client(server_logging_object: logging.Logger, clients_set: set,
-                  client_socket: socket.socket, client_address: str):
+def disconnect(outbox: fanout.Outbox):
     """
-    Bearbeitet das Senden und Empfangen von Nachrichten eines Clients.
+    Trennt einen Client: schließt seine Warteschlange und beendet die Verbindung in beide Richtungen, damit Empfangs-
+    und Schreib-Thread zurückkehren.
+    :param outbox: Ausgangswarteschlange des Clients
+    :return: None
+    """
+    outbox.close()
+    try:
+        outbox.sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def write_to_client(logging_object: logging.Logger, outbox: fanout.Outbox, batch_interval: float = 0,
+                    overruns: metrics.Counter = None):
+    """
+    Schreib-Thread eines Clients: leert die Ausgangswarteschlange unabhängig vom Empfang aller Clients. Die wartenden
+    Frames werden ohne Kopie mit einem sendmsg-Aufruf gesendet. Mit batch_interval werden alle Frames eines Takts
+    gesammelt und gemeinsam gesendet.
+    :param logging_object: Logger des Servers
+    :param outbox: Ausgangswarteschlange des Clients
+    :param batch_interval: Taktdauer in Sekunden für gebündeltes Senden, 0 sendet sofort
+    :param overruns: Zähler verpasster Takte
+    :return: None
+    """
+    if overruns is None:
+        overruns = metrics.Counter()
+    next_tick = time.monotonic() + batch_interval
+    try:
+        while not outbox.closed:
+            if batch_interval:
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    next_tick += batch_interval
+                else:
+                    # Verpasste Takte nicht nachholen
+                    next_tick = time.monotonic() + batch_interval
+                    overruns.add()
+                frames = outbox.take()
+            else:
+                frames = outbox.wait()
+            if frames:
+                fanout.sendall_buffers(outbox.sock, frames)
+                outbox.counters.sent(sum(map(len, frames)), len(frames))
+    except OSError as e:
+        logging_object.info(f"Senden an {outbox.address} fehlgeschlagen: {e}")
+    finally:
+        disconnect(outbox)
+
+
+def handle_client(server_logging_object: logging.Logger, hub: fanout.FanoutHub,
+                  client_socket: socket.socket, client_address: str, batch_interval: float = 0):
+    """
+    Bearbeitet das Empfangen von Nachrichten eines Clients und startet dessen Schreib-Thread.
     :param server_logging_object: Logger des Servers
-    :param clients_set: Set aller Clients inklusive Client A
+    :param hub: Verwaltung aller Clients und ihrer Ausgangswarteschlangen
     :param client_socket: Verbindung zwischen Server und Client A
     :param client_address: Adresse des Clients A, welcher data sendet
+    :param batch_interval: Taktdauer in Sekunden für gebündeltes Senden, 0 sendet sofort
     :return: None
     """
     server_logging_object.info(f"Neue Verbindung von {client_address}")
-    clients_set.add(client_socket)
+    # Frames werden bereits gebündelt gesendet, Nagle würde sie nur zusätzlich verzögern
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    outbox = hub.register(client_socket, client_address)
+    receiver = buffers.StreamReceiver()
+    writer_thread = threading.Thread(target=write_to_client, args=(server_logging_object, outbox, batch_interval,
+                                                                   hub.registry.counter("tick_overruns")))
+    writer_thread.daemon = True
+    writer_thread.start()
 
     try:
         while True:
-            data = receive_from_client(server_logging_object, client_socket, client_address)
-            if not data:
+            frames = receive_from_client(server_logging_object, client_socket, client_address, receiver)
+            if not frames:
                 break
-            else:
-                send_to_clients(server_logging_object, data, clients_set, client_socket)
+            outbox.counters.received(sum(map(len, frames)), len(frames))
+            # Zeitanfragen beantwortet der Server direkt, sie werden nicht weitergeleitet
+            frames, responses = instrumentation.time_responses(frames, time.monotonic_ns())
+            for response in responses:
+                outbox.put(response)
+            frames, _ = hub.resume(frames, outbox)
+            if frames:
+                send_to_clients(server_logging_object, frames, hub, outbox)
     finally:
-        clients_set.remove(client_socket)
-        server_logging_object.info(f"Verbindung beendet mit {client_address}")
+        hub.unregister(outbox)
+        disconnect(outbox)
+        writer_thread.join()
+        server_logging_object.info(f"Verbindung beendet mit {client_address} "
+                                   f"({outbox.sent} gesendet, {outbox.dropped} verworfen)")
         client_socket.close()
 
 
-def start(logging_object: logging.Logger, port_server: int, port_broadcast: int, interval_broadcast: int):
+def start(logging_object: logging.Logger, port_server: int, port_broadcast: int, interval_broadcast: int,
+          mode: str = "threaded", queue_limit: int = 256, overflow_policy: str = fanout.DROP_OLDEST,
+          batch_interval: float = 0, capture_path: str = None, server_ip: str = None,
+          broadcast_address: str = "<broadcast>", worker_count: int = None, interest_radius: float = None,
+          client_timeout: float = 3.0, resume_depth: int = 20, snapshot_age: float = 5.0, stats_path: str = None,
+          stats_dump: str = None, stats_interval: float = 10.0, port_discovery: int = None):
     """
-    Startet den Server. Wartet auf eingehende Verbindungen und erstellt pro Verbindung einen Thread mit
-    handle_client().
+    Startet den Server. Wartet auf eingehende Verbindungen und bearbeitet diese je nach Modus mit einem Thread pro
+    Verbindung (handle_client()), in einem einzigen Event-Loop (eventloop.serve()) oder in mehreren Worker-Prozessen
+    mit je einem Event-Loop (workers.serve()). Im Modus "udp" werden Datagramme ohne Verbindung weitergeleitet
+    (datagram.serve()).
     :param logging_object: Logger des Servers
     :param port_server: Port des Servers für Client-Kommunikation
     :param port_broadcast: Port für Broadcast-kommunikation
     :param interval_broadcast: Intervall der Broadcast-Nachrichten
+    :param mode: "threaded" (Thread pro Client), "eventloop" (ein Thread für alle Clients), "multiprocess" (ein
+    Event-Loop je Worker-Prozess, nutzt mehrere CPU-Kerne) oder "udp" (Datagramme statt TCP, ein verlorenes Datagramm
+    verzögert keine späteren Nachrichten)
+    :param queue_limit: Maximale Anzahl wartender Nachrichten je Client
+    :param overflow_policy: Verhalten bei voller Warteschlange: "drop_oldest", "drop_newest", "disconnect" oder
+    "conflate" (je Fahrzeug nur der neueste Zustand, die Warteschlange wächst höchstens auf die Anzahl der Fahrzeuge)
+    :param batch_interval: Taktdauer in Sekunden (z.B. 0.005 bis 0.05), in der Nachrichten gesammelt und je Client
+    gebündelt gesendet werden; 0 leitet jede Nachricht sofort weiter
+    :param capture_path: Pfad einer Capture-Datei, in der jeder weitergeleitete Frame aufgezeichnet wird
+    :param server_ip: IPv4, an die der Server gebunden wird, standardmäßig die lokale IPv4 (z.B. 127.0.0.1 für Tests)
+    :param broadcast_address: Zieladresse der Broadcast-Nachricht
+    :param worker_count: Anzahl der Worker-Prozesse im Modus "multiprocess", standardmäßig die Anzahl der CPU-Kerne
+    :param interest_radius: Reichweite in m; Zustandsnachrichten werden nur an Clients weitergeleitet, deren zuletzt
+    gemeldete Position höchstens so weit vom Absender entfernt ist (Notfallnachrichten an alle). None leitet alle an
+    alle weiter
+    :param client_timeout: Dauer in Sekunden, bis ein Client im Modus "udp" ohne Datagramm abgemeldet wird
+    :param resume_depth: Anzahl gepufferter Nachrichten je Fahrzeug, die ein Client nach einem Verbindungsabbruch
+    erneut erhält (z.B. Frequenz * überbrückbare Unterbrechung in Sekunden), 0 ohne Wiederaufnahme
+    :param snapshot_age: Ein neuer Client erhält sofort den neuesten Zustand aller Fahrzeuge, die sich in den letzten
+    snapshot_age Sekunden gemeldet haben; eine Wiederaufnahme sendet davon nichts erneut. None ohne Momentaufnahme
+    :param stats_path: Pfad eines Unix-Domain-Sockets, über den Metriken (Nachrichten und Bytes je Client,
+    Warteschlangentiefen, verpasste Takte, Threads) abgefragt und der Sampling-Profiler geschaltet werden (siehe
+    metrics); im Modus "multiprocess" je Worker <stats_path>.<Nummer>. None ohne Abfrage
+    :param stats_dump: Datei, an die alle stats_interval Sekunden eine Momentaufnahme der Metriken als JSON-Zeile
+    angehängt wird, None ohne Momentaufnahmen
+    :param stats_interval: Abstand der Momentaufnahmen in Sekunden
+    :param port_discovery: Port, an dem Suchanfragen von Clients sofort beantwortet werden; die Broadcast-Nachricht
+    bleibt für Clients ohne Suchanfrage erhalten. None ohne Suchanfragen
     :return: None
     """
-    server_ip = get_localip(logging_object)
-    clients = set()
+    if mode not in ("threaded", "eventloop", "multiprocess", "udp"):
+        raise ValueError(f"Unbekannter Servermodus: {mode}")
+
+    if server_ip is None:
+        server_ip = get_localip(logging_object)
+
+    if mode == "multiprocess":
+        # Nur der Hauptprozess sendet die Broadcast-Nachricht, die Worker binden selbst an port_server
+        start_discovery(logging_object, port_server, port_broadcast, server_ip, interval_broadcast, broadcast_address,
+                        "tcp", port_discovery)
+        logging_object.info(f"Server läuft auf {server_ip}:{port_server} ({mode}) und wartet auf Verbindungen...")
+        try:
+            workers.serve(logging_object, server_ip, port_server, worker_count, queue_limit, overflow_policy,
+                          batch_interval, capture_path, interest_radius, resume_depth, snapshot_age, stats_path,
+                          stats_dump, stats_interval)
+        except KeyboardInterrupt:
+            logging_object.info("Server wird heruntergefahren.")
+        return
+
+    recorder = capture.CaptureWriter(capture_path) if capture_path else None
+    interest_grid = interest.InterestGrid(interest_radius) if interest_radius else None
+    # Mindestens der neueste Frame je Fahrzeug wird für Momentaufnahmen gehalten
+    sender_history = history.SenderHistory(max(resume_depth, 1)) if resume_depth or snapshot_age else None
+    registry = metrics.Registry()
+    stats = None
+    if stats_path or stats_dump:
+        stats = metrics.StatsServer(registry, stats_path, stats_dump, stats_interval).start()
+
+    if mode == "udp":
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server_socket.bind((server_ip, port_server))
+        start_discovery(logging_object, port_server, port_broadcast, server_ip, interval_broadcast, broadcast_address,
+                        "udp", port_discovery)
+        logging_object.info(f"Server läuft auf {server_ip}:{port_server} ({mode}) und wartet auf Clients...")
+        try:
+            datagram.serve(logging_object, server_socket, client_timeout, batch_interval, recorder, interest_grid,
+                           sender_history, snapshot_age, registry)
+        except KeyboardInterrupt:
+            logging_object.info("Server wird heruntergefahren.")
+        finally:
+            server_socket.close()
+            if recorder is not None:
+                recorder.close()
+            if stats is not None:
+                stats.close()
+        return
+
+    hub = fanout.FanoutHub(queue_limit, overflow_policy, recorder, interest_grid, sender_history, snapshot_age,
+                           registry)
 
     if server_ip:
         # Erstelle server_socket Objekt in TCP-Konfiguration
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((server_ip, port_server))
-        server_socket.listen(250)
-        logging_object.info(f"Server läuft auf {server_ip}:{port_server} und wartet auf Verbindungen...")
+        server_socket.listen(socket.SOMAXCONN if mode == "eventloop" else 250)
+        logging_object.info(f"Server läuft auf {server_ip}:{port_server} ({mode}) und wartet auf Verbindungen...")
 
-        # Startet den Broadcast-Thread
-        broadcast_thread = threading.Thread(
-            target=broadcast_server_info,
-            args=(logging_object, port_server, port_broadcast, server_ip, interval_broadcast))
-        broadcast_thread.daemon = True
-        broadcast_thread.start()
+        # Startet Broadcast-Nachricht und Beantwortung von Suchanfragen
+        start_discovery(logging_object, port_server, port_broadcast, server_ip, interval_broadcast, broadcast_address,
+                        "tcp", port_discovery)
 
         # Starte den Client-Handler pro eingegangene Verbindung
         try:
-            while True:
-                client_socket, client_address = server_socket.accept()
-                # Startet einen Thread pro Client
-                client_thread = threading.Thread(target=handle_client,
-                                                 args=(logging_object, clients, client_socket, client_address))
-                client_thread.start()
-                logging_object.info(f"Thread für Verbindung mit {client_address} gestartet.")
+            if mode == "eventloop":
+                eventloop.serve(logging_object, server_socket, hub, batch_interval)
+            else:
+                while True:
+                    client_socket, client_address = server_socket.accept()
+                    # Startet einen Thread pro Client
+                    client_thread = threading.Thread(target=handle_client,
+                                                     args=(logging_object, hub, client_socket, client_address,
+                                                           batch_interval))
+                    client_thread.start()
+                    logging_object.info(f"Thread für Verbindung mit {client_address} gestartet.")
         except KeyboardInterrupt:
-            logging_object.info("Server wird heruntergefahren.")
+            logging_object.info(f"Server wird heruntergefahren. Verworfene Nachrichten: {hub.dropped_total()}, "
+                                f"wegen Entfernung nicht weitergeleitet: {hub.filtered}")
         finally:
             server_socket.close()
+            if recorder is not None:
+                recorder.close()
+            if stats is not None:
+                stats.close()
 
     else:
         return
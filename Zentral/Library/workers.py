@@ -0,0 +1,222 @@
+import logging
+import multiprocessing
+import os
+import socket
+from . import buffers
+from . import capture
+from . import eventloop
+from . import fanout
+from . import history
+from . import interest
+from . import log_pipeline
+from . import metrics
+
+
+"""
+Mehrprozess-Betrieb des Servers. Mehrere Worker-Prozesse binden per SO_REUSEPORT an denselben Port, der Kernel verteilt
+neue Verbindungen auf die Worker. Jeder Worker betreibt einen eigenen Event-Loop (eventloop.serve) für seine Clients.
+Frames, die ein Worker von seinen Clients empfängt, leitet er zusätzlich über Unix-Domain-Datagramm-Sockets an alle
+anderen Worker weiter, die sie an ihre Clients verteilen. Ein Datagramm enthält alle Frames eines Empfangs bzw. eines
+Takts, sodass die Anzahl der Systemaufrufe nicht mit der Anzahl der Frames wächst.
+"""
+
+
+MAX_DATAGRAM = 65536        # Maximale Größe eines Datagramms zwischen Workern
+SOCKET_BUFFER = 4 << 20     # Sende- und Empfangspuffer der Worker-Kanäle
+RECEIVE_BATCH = 8           # Anzahl der Empfangspuffer je Worker, Datagramme je Systemaufruf-Runde
+
+
+class WorkerLink:
+    """
+    Kanäle eines Workers zu allen anderen Workern: ein eigener Eingang und die Eingänge der anderen Worker.
+    """
+    __slots__ = ("index", "inbox", "receiver", "peers", "pending", "pending_size", "batching", "forwarded", "dropped")
+
+    def __init__(self, index: int, inbox: socket.socket, peers: list, batching: bool = False):
+        """
+        :param index: Nummer des Workers
+        :param inbox: Eingang dieses Workers (nicht blockierend)
+        :param peers: Eingänge aller anderen Worker (Schreib-Enden, nicht blockierend)
+        :param batching: True sammelt Frames bis flush(), sonst wird bei jedem forward() gesendet
+        """
+        self.index = index
+        self.inbox = inbox
+        self.receiver = buffers.DatagramReceiver(inbox, MAX_DATAGRAM, RECEIVE_BATCH)
+        self.peers = peers
+        self.pending = []
+        self.pending_size = 0
+        self.batching = batching
+        self.forwarded = 0
+        self.dropped = 0
+
+    def fileno(self) -> int:
+        return self.inbox.fileno()
+
+    def forward(self, frames: list):
+        """
+        Leitet Frames von eigenen Clients an alle anderen Worker weiter.
+        :param frames: Vollständige Frames
+        :return: None
+        """
+        for frame in frames:
+            if self.pending_size + len(frame) > MAX_DATAGRAM:
+                self.flush()
+            self.pending.append(frame)
+            self.pending_size += len(frame)
+        if not self.batching:
+            self.flush()
+
+    def flush(self):
+        """
+        Sendet gesammelte Frames als ein Datagramm an jeden anderen Worker. Ist der Eingang eines Workers voll, wird
+        das Datagramm für diesen Worker verworfen, damit ein überlasteter Worker die anderen nicht blockiert.
+        :return: None
+        """
+        if not self.pending:
+            return
+        datagram = b"".join(self.pending)
+        count = len(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        for peer in self.peers:
+            try:
+                peer.send(datagram)
+                self.forwarded += count
+            except (BlockingIOError, InterruptedError):
+                self.dropped += count
+
+    def receive(self) -> list:
+        """
+        Liest alle wartenden Datagramme anderer Worker.
+        :return: Liste vollständiger Frames
+        """
+        frames = []
+        while True:
+            datagrams = self.receiver.receive(block=False)
+            views = []
+            for datagram, _ in datagrams:
+                buffers.split_frames(datagram, views)
+            # Frames bleiben in den Warteschlangen der Clients über den nächsten Empfang hinaus bestehen
+            frames.extend(bytes(view) for view in views)
+            if len(datagrams) < RECEIVE_BATCH:
+                return frames
+
+
+def create_links(count: int) -> list:
+    """
+    Erstellt die Kanäle zwischen count Workern. Muss vor dem Start der Worker-Prozesse aufgerufen werden.
+    :param count: Anzahl der Worker
+    :return: Liste aus (Lese-Ende, Schreib-Ende) je Worker
+    """
+    pairs = []
+    for _ in range(count):
+        reader, writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        for end in (reader, writer):
+            end.setblocking(False)
+            try:
+                end.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+                end.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+            except OSError:
+                pass
+        pairs.append((reader, writer))
+    return pairs
+
+
+def _worker(logging_object: logging.Logger, index: int, pairs: list, server_ip: str, port_server: int,
+            queue_limit: int, overflow_policy: str, batch_interval: float, capture_path: str, interest_radius: float,
+            resume_depth: int, snapshot_age: float, stats_path: str, stats_dump: str, stats_interval: float):
+    """
+    Worker-Prozess: eigener lauschender Socket per SO_REUSEPORT und eigener Event-Loop.
+    """
+    for other, (reader, writer) in enumerate(pairs):
+        if other != index:
+            reader.close()
+    link = WorkerLink(index, pairs[index][0],
+                      [writer for other, (_, writer) in enumerate(pairs) if other != index], batch_interval > 0)
+    pairs[index][1].close()
+
+    recorder = capture.CaptureWriter(f"{capture_path}.{index}") if capture_path else None
+    # Jeder Worker kennt nur die Positionen seiner eigenen Clients, gefiltert wird beim Verteilen an diese
+    interest_grid = interest.InterestGrid(interest_radius) if interest_radius else None
+    # Frames anderer Worker laufen ebenfalls durch publish, der Verlauf enthält damit alle Fahrzeuge
+    sender_history = history.SenderHistory(max(resume_depth, 1)) if resume_depth or snapshot_age else None
+    registry = metrics.Registry()
+    registry.source("workers", lambda: {"index": index, "forwarded": link.forwarded, "dropped": link.dropped})
+    hub = fanout.FanoutHub(queue_limit, overflow_policy, recorder, interest_grid, sender_history, snapshot_age,
+                           registry)
+    stats = None
+    if stats_path or stats_dump:
+        # Jeder Worker hat eigene Metriken und einen eigenen Socket <stats_path>.<Nummer>
+        stats = metrics.StatsServer(registry, f"{stats_path}.{index}" if stats_path else None,
+                                    f"{stats_dump}.{index}" if stats_dump else None, stats_interval).start()
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind((server_ip, port_server))
+    server_socket.listen(socket.SOMAXCONN)
+    logging_object.info(f"Worker {index} (PID {os.getpid()}) wartet auf Verbindungen.")
+    try:
+        eventloop.serve(logging_object, server_socket, hub, batch_interval, link)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging_object.info(f"Worker {index} beendet: {link.forwarded} Frames an andere Worker weitergeleitet, "
+                            f"{link.dropped} verworfen, {hub.dropped_total()} bei Clients verworfen")
+        server_socket.close()
+        if recorder is not None:
+            recorder.close()
+        if stats is not None:
+            stats.close()
+        # Worker-Prozesse enden ohne atexit, wartende Log-Einträge selbst schreiben
+        log_pipeline.stop()
+
+
+def serve(logging_object: logging.Logger, server_ip: str, port_server: int, count: int = None,
+          queue_limit: int = 256, overflow_policy: str = fanout.DROP_OLDEST, batch_interval: float = 0,
+          capture_path: str = None, interest_radius: float = None, resume_depth: int = 20,
+          snapshot_age: float = 5.0, stats_path: str = None, stats_dump: str = None, stats_interval: float = 10.0):
+    """
+    Startet count Worker-Prozesse und wartet, bis alle beendet sind.
+    :param logging_object: Logger des Servers
+    :param server_ip: IPv4, an die die Worker gebunden werden
+    :param port_server: Port des Servers für Client-Kommunikation
+    :param count: Anzahl der Worker, standardmäßig die Anzahl der CPU-Kerne
+    :param queue_limit: Maximale Anzahl wartender Nachrichten je Client
+    :param overflow_policy: Verhalten bei voller Warteschlange
+    :param batch_interval: Taktdauer in Sekunden für gebündeltes Senden an Clients und andere Worker
+    :param capture_path: Pfad der Capture-Dateien, jeder Worker schreibt <capture_path>.<Nummer>
+    :param interest_radius: Reichweite in m für die Weiterleitung von Zustandsnachrichten, None leitet alle weiter
+    :param resume_depth: Anzahl gepufferter Nachrichten je Fahrzeug für Wiederaufnahmen, 0 ohne Verlauf
+    :param snapshot_age: Maximales Alter der Zustände in der Momentaufnahme für neue Clients, None ohne Momentaufnahme
+    :param stats_path: Pfad der Unix-Domain-Sockets für Metriken und Profiler, jeder Worker bindet <stats_path>.<Nummer>
+    :param stats_dump: Pfad der Dateien für periodische Momentaufnahmen, jeder Worker schreibt <stats_dump>.<Nummer>
+    :param stats_interval: Abstand der Momentaufnahmen in Sekunden
+    :return: None
+    """
+    count = count or os.cpu_count() or 1
+    pairs = create_links(count)
+    # Logger und Sockets werden an die Worker vererbt statt übertragen, das geht nur mit fork (nicht spawn/forkserver)
+    context = multiprocessing.get_context("fork")
+    processes = []
+    for index in range(count):
+        process = context.Process(
+            target=_worker,
+            args=(logging_object, index, pairs, server_ip, port_server, queue_limit, overflow_policy,
+                  batch_interval, capture_path, interest_radius, resume_depth, snapshot_age, stats_path, stats_dump,
+                  stats_interval),
+            name=f"worker-{index}")
+        process.daemon = True
+        process.start()
+        processes.append(process)
+    for reader, writer in pairs:
+        reader.close()
+        writer.close()
+    logging_object.info(f"{count} Worker gestartet.")
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
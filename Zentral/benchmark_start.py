@@ -0,0 +1,47 @@
+import logging
+from Library import benchmark
+
+
+"""
+Lastgenerator und Benchmark für den Server auf Loopback (127.0.0.1). Jeder Lauf startet einen eigenen Server und
+hängt seinen Bericht als JSON-Zeile an report_path an, sodass Änderungen über die Zeit verglichen werden können.
+
+Parameter:
+vehicles: Anzahl simulierter Fahrzeuge
+frequency [Hz]: Sendefrequenz je Fahrzeug
+duration [s]: Messdauer je Lauf
+load_processes: Anzahl der Prozesse, auf die die simulierten Fahrzeuge verteilt werden
+runs: Liste aus (server_mode, batch_interval), jeder Eintrag ist ein eigener Lauf
+worker_count: Anzahl der Worker-Prozesse für server_mode "multiprocess" (None = Anzahl der CPU-Kerne)
+queue_limit: Maximale Anzahl wartender Nachrichten je Client
+overflow_policy: Verhalten bei voller Warteschlange: "drop_oldest", "drop_newest", "disconnect" oder "conflate"
+server_port: Port des Servers während des Benchmarks
+scenarios: Kanalbedingungen, unter denen jeder Lauf gemessen wird: None (ohne Beeinträchtigung), Name aus
+impairment.SCENARIOS ("ideal", "wifi", "wifi_congested", "mesh", "outage") oder Pfad einer JSON-Datei; die Fahrzeuge
+verbinden sich dann über einen Proxy an server_port + 2
+report_path: Datei, an die die Berichte angehängt werden (JSON Lines)
+"""
+
+# Setup
+vehicles = 50
+frequency = 20
+duration = 10
+load_processes = 2
+runs = [("threaded", 0), ("eventloop", 0), ("eventloop", 0.01), ("multiprocess", 0.01), ("udp", 0), ("udp", 0.01)]
+worker_count = None
+queue_limit = 256
+overflow_policy = "drop_oldest"
+server_port = 50100
+scenarios = [None]
+report_path = "benchmark.jsonl"
+
+# Start
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger("benchmark")
+    for scenario in scenarios:
+        for server_mode, batch_interval in runs:
+            report = benchmark.run(logger, vehicles, frequency, duration, server_mode, batch_interval, load_processes,
+                                   server_port, queue_limit, overflow_policy, worker_count=worker_count,
+                                   scenario=scenario)
+            benchmark.write_report(report, report_path)
@@ -1,18 +1,71 @@
 from Library import clients
+from Library import congestion
+from Library import fleet
 
 
 """
 Parameter:
 send_freq [Hz]: Frequenz, mit der Nachrichten gesendet werden sollen
 broadcast_port: Port des Broadcasts (muss übereinstimmen mit Server_start)
+discovery_port: Port für Suchanfragen an den Server, der sofort antwortet (muss übereinstimmen mit Server_start, None =
+nur auf die Broadcast-Nachricht warten)
 logger_name: Name des Loggers
+log_background: True schreibt Log-Einträge in einem Hintergrund-Thread, Sende- und Empfangsschleifen warten nicht auf
+Datei und Konsole
+log_detail: True protokolliert jede gesendete und empfangene Nachricht
+log_sample: Nachrichtenklasse ("tx", "rx") -> n, nur jede n-te Nachricht wird protokolliert (None = alle)
+report_interval [s]: Abstand, in dem Verlust, Umsortierung und Latenz (p50/p99/p999) ins Log geschrieben werden
+latency_budget [ms]: Latenzbudget Fahrzeug zu Fahrzeug, bei Überschreitung durch p99 wird gewarnt (None = keine Prüfung)
+cache_path: Datei mit der zuletzt verwendeten Serveradresse, ein Neustart verbindet sofort statt auf den Broadcast zu
+warten (None = kein Cache)
+link_timeout [s]: Ohne Nachricht des Servers in dieser Zeit gilt die Verbindung als unterbrochen und wird neu aufgebaut
+key_interval: Nur jeder key_interval-te Zustand wird vollständig gesendet, dazwischen die Differenz zu diesem (z.B. freq
+für einen vollständigen Zustand je Sekunde, None = jeder Zustand vollständig). Alle Teilnehmer müssen Differenzen
+(MSG_DELTA) verstehen, ältere Clients verwerfen sie
+fleet_capacity: Anfängliche Anzahl der Fahrzeuge in der Zustandstabelle fleet_table, die Anwendungen abfragen (z.B.
+fleet_table.within(x, y, 50), fleet_table.nearest(x, y, 3), fleet_table.time_to_collision(x, y, v, h))
+fleet_max_age [s]: Fahrzeuge ohne Nachricht in dieser Zeit werden aus der Zustandstabelle entfernt
+stats_path: Unix-Domain-Socket für Metriken und Profiler im laufenden Betrieb, z.B. echo stats | socat -
+UNIX-CONNECT:client.stats oder echo "profile start" (None = keine Abfrage)
+stats_dump: Datei, an die periodisch eine Momentaufnahme der Metriken als JSON-Zeile angehängt wird (None = keine)
+stats_interval [s]: Abstand der Momentaufnahmen in stats_dump
+rate_control: True passt die Sendefrequenz an die Kanallast an (DCC) und sendet bei deutlichen Änderungen von Richtung,
+Geschwindigkeit oder Position sofort; freq ist dann die Höchstfrequenz (False = immer freq)
+min_freq [Hz]: Untere Grenze der Sendefrequenz bei voller Kanallast
+channel_capacity [bit/s]: Kapazität des gemeinsamen Funkkanals, aus der die Kanallast geschätzt wird
 """
 
 # Setup
 freq = 20
 broadcast_port = 50001
+discovery_port = 50002
 logger_name = "client.log"
-logger = clients.create_logger(logger_name)
+log_background = False
+log_detail = True
+log_sample = None
+report_interval = 10
+latency_budget = None
+cache_path = "server_address.txt"
+link_timeout = 3.0
+key_interval = None
+fleet_capacity = 64
+fleet_max_age = 2.0
+stats_path = None
+stats_dump = None
+stats_interval = 10.0
+rate_control = False
+min_freq = 1
+channel_capacity = 6e6
+logger = clients.create_logger(logger_name, log_background, log_detail, log_sample)
+fleet_table = fleet.FleetTable(fleet_capacity, fleet_max_age)
+rate_controller = None
+if rate_control:
+    # Bei hoher Last werden seltener Schlüsselzustände gesendet (höchstens halb so oft)
+    rate_controller = congestion.RateController(min_freq, freq, channel_capacity,
+                                                key_intervals=(key_interval, 2 * key_interval) if key_interval else None)
 
 # Start
-clients.start(logger, freq, broadcast_port)
+clients.start(logger, freq, broadcast_port, report_interval=report_interval, latency_budget=latency_budget,
+              cache_path=cache_path, link_timeout=link_timeout, key_interval=key_interval, fleet_table=fleet_table,
+              stats_path=stats_path, stats_dump=stats_dump, stats_interval=stats_interval,
+              discovery_port=discovery_port, rate_controller=rate_controller)
@@ -0,0 +1,30 @@
+from Library import clients
+from Library import replay
+
+
+"""
+Spielt einen mit server_start (capture_path) aufgezeichneten Mitschnitt in einen laufenden Server ein, z.B. für
+reproduzierbare Lasttests.
+
+Parameter:
+capture_path: Capture-Datei des Servers
+speed: Zeitfaktor (1 = Echtzeit, N = N-fach schneller, 0 = so schnell wie möglich)
+restamp: True ersetzt die Zeitstempel der Nachrichten durch den Sendezeitpunkt
+broadcast_port: Port des Broadcasts, über den der Server gefunden wird (muss übereinstimmen mit server_start)
+logger_name: Name des Loggers
+"""
+
+# Setup
+capture_path = "server.cap"
+speed = 1.0
+restamp = True
+broadcast_port = 50001
+logger_name = "replay.log"
+logger = clients.create_logger(logger_name)
+
+# Start
+server_ip, server_port, transport = clients.discover_server(logger, broadcast_port)
+if server_ip and transport != "tcp":
+    logger.error(f"Mitschnitte werden nur über TCP eingespielt, der Server bietet {transport} an.")
+elif server_ip:
+    replay.replay_to_server(logger, capture_path, server_ip, server_port, speed, restamp)
@@ -5,17 +5,67 @@ from Library import server
 Parameter:
 broadcast_port: Port des Broadcasts, muss mit client_start übereinstimmen!
 server_port: Port des Servers
+discovery_port: Port, an dem der Server Suchanfragen von Clients sofort beantwortet, muss mit client_start
+übereinstimmen! (None = Clients warten auf die Broadcast-Nachricht)
 broadcast_interval [s]: Sendet alle [broadcast_interval] Sekunden eine Broadcast-Nachricht an alle Teilnehmer mit 
 IP-Adresse und Port des Servers
 logger_name: Name des Loggers, in dem alle Serverdaten gespeichert werden
+log_background: True schreibt Log-Einträge in einem Hintergrund-Thread, Sende- und Empfangsschleifen warten nicht auf
+Datei und Konsole
+log_detail: True protokolliert jede gesendete und empfangene Nachricht
+log_sample: Nachrichtenklasse ("tx", "rx") -> n, nur jede n-te Nachricht wird protokolliert (None = alle)
+server_mode: "threaded" (ein Thread pro Client), "eventloop" (ein Thread für alle Clients, für große Flotten),
+"multiprocess" (ein Event-Loop je Worker-Prozess auf demselben Port, nutzt mehrere CPU-Kerne) oder "udp" (Datagramme
+statt TCP, ein verlorenes Paket hält keine späteren Nachrichten auf; Clients wählen das Protokoll automatisch)
+client_timeout [s]: Im Modus "udp" wird ein Client ohne Datagramm nach dieser Zeit abgemeldet
+worker_count: Anzahl der Worker-Prozesse für "multiprocess" (None = Anzahl der CPU-Kerne)
+queue_limit: Maximale Anzahl wartender Nachrichten je Client
+overflow_policy: Verhalten bei voller Warteschlange eines langsamen Clients: "drop_oldest", "drop_newest",
+"disconnect" oder "conflate" (nur der neueste Zustand je Fahrzeug wird nachgeliefert, kein Rückstau)
+batch_interval [s]: Sammelt alle Nachrichten eines Takts (z.B. 0.005 bis 0.05) und sendet sie je Client gebündelt,
+0 leitet jede Nachricht sofort weiter
+capture_path: Datei, in der jede weitergeleitete Nachricht binär aufgezeichnet wird (None = kein Mitschnitt)
+resume_depth: Anzahl gepufferter Nachrichten je Fahrzeug, die ein Client nach kurzem Verbindungsabbruch erneut erhält
+(0 = keine Wiederaufnahme)
+snapshot_age [s]: Neue Clients erhalten sofort den neuesten Zustand aller Fahrzeuge, die sich in dieser Zeit gemeldet
+haben; eine Wiederaufnahme sendet davon nichts erneut (None = keine Momentaufnahme)
+interest_radius [m]: Zustandsnachrichten werden nur an Fahrzeuge in diesem Umkreis um den Absender weitergeleitet,
+Notfallnachrichten immer an alle (None = alle Nachrichten an alle)
+stats_path: Unix-Domain-Socket für Metriken und Profiler im laufenden Betrieb, z.B. echo stats | socat -
+UNIX-CONNECT:server.stats oder echo "profile start" (None = keine Abfrage)
+stats_dump: Datei, an die periodisch eine Momentaufnahme der Metriken als JSON-Zeile angehängt wird (None = keine)
+stats_interval [s]: Abstand der Momentaufnahmen in stats_dump
 """
 
 # Setup
 broadcast_port = 50001
 server_port = 50000
+discovery_port = 50002
 broadcast_interval = 5
 logger_name = "server.log"
-logger = server.create_logger(logger_name)
+log_background = False
+log_detail = True
+log_sample = None
+server_mode = "threaded"
+worker_count = None
+client_timeout = 3.0
+queue_limit = 256
+overflow_policy = "drop_oldest"
+batch_interval = 0
+capture_path = None
+interest_radius = None
+resume_depth = 20
+snapshot_age = 5.0
+stats_path = None
+stats_dump = None
+stats_interval = 10.0
 
 # Start
-server.start(logger, server_port, broadcast_port, broadcast_interval)
+if __name__ == "__main__":
+    # Erst hier: create_logger löscht die Log-Datei, Kindprozesse importieren dieses Modul bei spawn erneut
+    logger = server.create_logger(logger_name, log_background, log_detail, log_sample)
+    server.start(logger, server_port, broadcast_port, broadcast_interval, server_mode, queue_limit, overflow_policy,
+                 batch_interval, capture_path, worker_count=worker_count,
+                 interest_radius=interest_radius, client_timeout=client_timeout,
+                 resume_depth=resume_depth, snapshot_age=snapshot_age, stats_path=stats_path,
+                 stats_dump=stats_dump, stats_interval=stats_interval, port_discovery=discovery_port)
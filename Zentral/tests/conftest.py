@@ -0,0 +1,10 @@
+import os
+import sys
+
+
+"""
+Tests laufen wie die Startskripte aus dem Verzeichnis Zentral, damit from Library import ... funktioniert.
+"""
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
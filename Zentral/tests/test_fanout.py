@@ -0,0 +1,152 @@
+import socket
+import pytest
+from Library import fanout
+from Library import history
+from Library import interest
+from Library import protocol
+
+
+"""
+Begrenzte Ausgangswarteschlangen (fanout.Outbox) unter allen Policies und die Verteilung durch FanoutHub.publish.
+"""
+
+
+def state(vehicle_id: int, seq: int) -> bytes:
+    return protocol.encode_state(protocol.VehicleState(vehicle_id, seq, seq * 1000, 0.0, 0.0, 0.0, 0.0))
+
+
+def delta(key: bytes, seq: int) -> bytes:
+    key_state = protocol.decode_state(key)
+    return protocol.encode_delta(key_state, key_state._replace(seq=seq, timestamp=seq * 1000, x=1.0))
+
+
+def placed(vehicle_id: int, x: float) -> bytes:
+    return protocol.encode_state(protocol.VehicleState(vehicle_id, 0, 0, x, 0.0, 0.0, 0.0))
+
+
+def sequences(frames: list) -> list:
+    return [(protocol.sender_id(frame), protocol.sequence(frame)) for frame in frames]
+
+
+def test_drop_oldest_keeps_newest_frames():
+    outbox = fanout.Outbox(None, "a", 3, fanout.DROP_OLDEST)
+    for seq in range(5):
+        assert outbox.put(state(1, seq))
+    assert outbox.depth() == 3
+    assert outbox.dropped == 2
+    assert sequences(outbox.take()) == [(1, 2), (1, 3), (1, 4)]
+    assert outbox.sent == 3
+
+
+def test_drop_newest_keeps_oldest_frames():
+    outbox = fanout.Outbox(None, "a", 3, fanout.DROP_NEWEST)
+    for seq in range(5):
+        assert outbox.put(state(1, seq))
+    assert outbox.dropped == 2
+    assert sequences(outbox.take()) == [(1, 0), (1, 1), (1, 2)]
+
+
+def test_disconnect_closes_full_outbox():
+    outbox = fanout.Outbox(None, "a", 3, fanout.DISCONNECT)
+    for seq in range(3):
+        assert outbox.put(state(1, seq))
+    assert not outbox.put(state(1, 3))
+    assert outbox.closed
+    assert outbox.dropped == 1
+    # Nach dem Schließen wird nichts mehr eingereiht
+    assert outbox.put(state(1, 4))
+    assert sequences(outbox.take()) == [(1, 0), (1, 1), (1, 2)]
+
+
+def test_conflate_keeps_newest_state_per_vehicle():
+    outbox = fanout.Outbox(None, "a", 2, fanout.CONFLATE)
+    for seq in range(4):
+        for vehicle_id in (1, 2, 3):
+            assert outbox.put(state(vehicle_id, seq))
+    # Die Grenze gilt nicht für Zustände, die Warteschlange wächst höchstens auf die Anzahl der Fahrzeuge
+    assert outbox.depth() == 3
+    assert outbox.conflated == 9
+    assert outbox.dropped == 0
+    assert sequences(outbox.take()) == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_conflate_keeps_key_state_before_delta():
+    outbox = fanout.Outbox(None, "a", 2, fanout.CONFLATE)
+    key = state(1, 0)
+    outbox.put(key)
+    outbox.put(delta(key, 1))
+    outbox.put(delta(key, 2))
+    assert outbox.conflated == 1
+    assert [protocol.message_type(frame) for frame in outbox.take()] == [protocol.MSG_STATE, protocol.MSG_DELTA]
+
+
+def test_conflate_applies_limit_to_other_messages():
+    outbox = fanout.Outbox(None, "a", 2, fanout.CONFLATE)
+    for t0 in range(3):
+        outbox.put(protocol.encode_time_response(0, t0, 0, 0))
+    assert outbox.dropped == 1
+    assert outbox.depth() == 2
+
+
+@pytest.mark.parametrize("policy", fanout.POLICIES)
+def test_publish_skips_sender_and_reports_disconnects(policy):
+    hub = fanout.FanoutHub(2, policy)
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_STREAM) for _ in range(2)]
+    try:
+        sender, receiver = (hub.register(sock, f"client{index}") for index, sock in enumerate(sockets))
+        overflowed = hub.publish([state(1, seq) for seq in range(4)], sender)
+        assert sender.depth() == 0
+        assert overflowed == ([receiver] if policy == fanout.DISCONNECT else [])
+        if policy == fanout.CONFLATE:
+            assert receiver.depth() == 1 and receiver.conflated == 3
+        else:
+            assert receiver.depth() == 2 and receiver.dropped == (1 if policy == fanout.DISCONNECT else 2)
+        hub.unregister(receiver)
+        stats = hub.stats()
+        assert stats["clients"] == 1
+        assert stats["dropped"] == receiver.dropped
+        assert stats["conflated"] == receiver.conflated
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def test_publish_nearby_sends_non_finite_positions_to_all():
+    hub = fanout.FanoutHub(16, interest_grid=interest.InterestGrid(100.0))
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_STREAM) for _ in range(3)]
+    try:
+        sender, near, far = (hub.register(sock, f"client{index}") for index, sock in enumerate(sockets))
+        for outbox, x in ((sender, 0.0), (near, 50.0), (far, 1000.0)):
+            hub.publish([placed(sockets.index(outbox.sock), x)], outbox)
+        for outbox in (sender, near, far):
+            outbox.take()
+        hub.publish([placed(0, 10.0)], sender)
+        assert (near.depth(), far.depth()) == (1, 0)
+        for value in (float("nan"), float("inf")):
+            hub.publish([placed(0, value)], sender)
+        # Ungültige Positionen erreichen alle Clients und verschieben den Absender im Gitter nicht
+        assert (near.depth(), far.depth()) == (3, 2)
+        assert hub.interest_grid.position(sender) == (10.0, 0.0)
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def test_snapshot_on_register_is_not_replayed_on_resume():
+    hub = fanout.FanoutHub(16, sender_history=history.SenderHistory(), snapshot_age=5.0)
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_STREAM) for _ in range(2)]
+    try:
+        sender = hub.register(sockets[0], "client0")
+        hub.publish([state(1, seq) for seq in range(3)] + [state(2, 0)], sender)
+        client = hub.register(sockets[1], "client1")
+        # Momentaufnahme liegt sofort nach der Anmeldung bereit
+        assert sorted(sequences(client.take())) == [(1, 2), (2, 0)]
+        hub.publish([state(1, 3)], sender)
+        frames, replayed = hub.resume([protocol.encode_resume(9, 0), state(9, 0)], client)
+        # Verpasste Frames vor der Momentaufnahme sind überholt, Frame 3 kam bereits direkt
+        assert replayed == 0
+        assert sequences(frames) == [(9, 0)]
+        assert sequences(client.take()) == [(1, 3)]
+    finally:
+        for sock in sockets:
+            sock.close()
@@ -0,0 +1,115 @@
+import pytest
+from Library import history
+from Library import protocol
+
+
+"""
+Verlauf je Fahrzeug (history.SenderHistory) für Wiederaufnahmen und Momentaufnahmen. Die Empfangszeit kommt aus einer
+simulierten Uhr, die je aufgezeichnetem Frame um 1 ms weiterläuft.
+"""
+
+
+class FakeClock:
+    """
+    Ersetzt time.monotonic_ns() des Verlaufs.
+    """
+
+    def __init__(self):
+        self.now = 1_000_000_000
+
+    def monotonic_ns(self) -> int:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(history.time, "monotonic_ns", fake.monotonic_ns)
+    return fake
+
+
+def state(vehicle_id: int, seq: int, timestamp: int) -> bytes:
+    return protocol.encode_state(protocol.VehicleState(vehicle_id, seq, timestamp, 0.0, 0.0, 0.0, 0.0))
+
+
+def record(sender_history: history.SenderHistory, clock: FakeClock, *frames: bytes):
+    for frame in frames:
+        clock.now += 1_000_000
+        sender_history.record((frame,))
+
+
+def sequences(frames: list) -> list:
+    return [(protocol.sender_id(frame), protocol.sequence(frame)) for frame in frames]
+
+
+def test_since_replays_after_cutoff_in_receive_order(clock):
+    sender_history = history.SenderHistory(depth=10)
+    # Fahrzeug 2 geht 5 s nach, seine Zeitstempel sind kleiner, obwohl es später sendet
+    record(sender_history, clock, state(1, 0, 10_000), state(2, 0, 5_000), state(1, 1, 20_000), state(2, 1, 6_000))
+    assert sequences(sender_history.since(10_000)) == [(2, 0), (1, 1), (2, 1)]
+    assert sender_history.since(20_000) == [state(2, 1, 6_000)]
+
+
+def test_since_falls_back_to_timestamps_when_cutoff_was_evicted(clock):
+    sender_history = history.SenderHistory(depth=3)
+    record(sender_history, clock, *(state(1, seq, seq * 1000) for seq in range(6)))
+    # Frame 1 ist verdrängt, verglichen werden die Zeitstempel der verbliebenen Frames 3 bis 5
+    assert sequences(sender_history.since(1000)) == [(1, 3), (1, 4), (1, 5)]
+    assert sequences(sender_history.since(3500)) == [(1, 4), (1, 5)]
+
+
+def test_since_excludes_requesting_vehicle(clock):
+    sender_history = history.SenderHistory()
+    record(sender_history, clock, state(1, 0, 1000), state(2, 0, 1000), state(1, 1, 2000), state(2, 1, 2000))
+    # Der Client hat zuletzt Frame 0 von Fahrzeug 2 empfangen, eigene Frames bestimmen den Schnitt nicht
+    assert sequences(sender_history.since(1000, exclude=1)) == [(2, 1)]
+    assert sequences(sender_history.since(0, exclude=2)) == [(1, 0), (1, 1)]
+
+
+def test_latest_skips_vehicles_received_after_before(clock):
+    sender_history = history.SenderHistory()
+    record(sender_history, clock, state(1, 0, 1000), state(2, 0, 1000))
+    registered = clock.now + 1
+    record(sender_history, clock, state(2, 1, 2000), state(3, 0, 2000))
+    # Fahrzeuge 2 und 3 haben nach der Anmeldung gesendet und erreichen den Client direkt
+    assert sequences(sender_history.latest(before=registered)) == [(1, 0)]
+    assert sequences(sender_history.latest()) == [(1, 0), (2, 1), (3, 0)]
+    assert sequences(sender_history.latest(exclude=2)) == [(1, 0), (3, 0)]
+
+
+def test_latest_forgets_silent_vehicles(clock):
+    sender_history = history.SenderHistory()
+    record(sender_history, clock, state(1, 0, 1000), state(2, 0, 1000))
+    clock.now += 2_000_000_000
+    record(sender_history, clock, state(2, 1, 2000))
+    assert sequences(sender_history.latest(max_age=1.0)) == [(2, 1)]
+    assert len(sender_history) == 1
+
+
+def test_since_skips_frames_already_delivered(clock):
+    sender_history = history.SenderHistory()
+    record(sender_history, clock, state(1, 0, 1000), state(1, 1, 2000), state(2, 0, 1000), state(3, 0, 1000))
+    # Momentaufnahme bei der Anmeldung: neuester Frame von Fahrzeug 1, Fahrzeug 3 gilt als veraltet
+    registered = clock.now + 1
+    delivered = {sender: received for sender, (received, _) in sender_history.newest(before=registered).items()
+                 if sender != 3}
+    record(sender_history, clock, state(2, 1, 2000), state(3, 1, 2000))
+    # Nach der Anmeldung empfangene Frames hat der Client bereits direkt erhalten
+    assert sequences(sender_history.since(0, exclude=9, before=registered, delivered=delivered)) == [(3, 0)]
+    assert sequences(sender_history.since(0, exclude=9, before=registered)) == [(1, 0), (1, 1), (2, 0), (3, 0)]
+
+
+def test_record_expands_deltas_to_full_states(clock):
+    sender_history = history.SenderHistory()
+    key = state(1, 0, 1_000_000)
+    key_state = protocol.decode_state(key)
+    moved = key_state._replace(seq=1, timestamp=2_000_000, x=2.5, heading=45.0)
+    # Ohne Schlüsselzustand kann eine Zustandsänderung nicht ergänzt werden
+    record(sender_history, clock, protocol.encode_delta(key_state, moved))
+    assert len(sender_history) == 0
+    record(sender_history, clock, key, protocol.encode_delta(key_state, moved, protocol.FLAG_EMERGENCY))
+    newest = sender_history.latest()
+    assert [protocol.message_type(frame) for frame in newest] == [protocol.MSG_STATE]
+    assert protocol.decode_state(newest[0]) == pytest.approx(moved)
+    assert protocol.flags(newest[0]) == protocol.FLAG_EMERGENCY
+    assert sequences(sender_history.since(1_000_000)) == [(1, 1)]